@@ -0,0 +1,192 @@
+"""
+Local stand-in for the Bitvavo REST API (v2) order endpoints, to benchmark
+trading_core's order gateway offline.
+
+    python bench/bitvavo_mock.py --port 8790 --latency-ms 5 --error-rate 0.01
+
+Speaks HTTP/1.1 with keep-alive on plain asyncio (no extra dependencies) and
+implements GET /v2/time, POST/GET/DELETE /v2/order. Signatures are checked
+against --secret, market orders fill at once at a random-walk price, and a
+repeated clientOrderId returns the existing order. Weight-based rate limits
+come back in Bitvavo-Ratelimit-* headers (429 once the window's budget is
+spent). Faults: --error-rate answers 503 without placing, --drop-rate places
+the order and then closes the connection without an answer.
+"""
+import argparse, asyncio, hashlib, hmac, itertools, json, random, time, uuid
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+PREFIX = "/v2"
+WEIGHTS = {("GET", "/time"): 1, ("POST", "/order"): 1, ("GET", "/order"): 1, ("DELETE", "/order"): 1}
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 429: "Too Many Requests",
+            503: "Service Unavailable"}
+
+
+class MockBitvavo:
+    def __init__(self, secret: str = "secret", latency_ms: float = 0.0, error_rate: float = 0.0,
+                 drop_rate: float = 0.0, limit: int = 1000, window_s: float = 60.0, fee_bps: float = 25.0,
+                 seed: int = 1):
+        self.secret = secret.encode()
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.limit = limit
+        self.window_s = window_s
+        self.fee = fee_bps / 10_000
+        self.rnd = random.Random(seed)
+        self.prices: Dict[str, float] = {}
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.by_client: Dict[Tuple[str, str], str] = {}
+        self.used = 0
+        self.reset_at = 0.0
+        self.stats = {"requests": 0, "orders": 0, "duplicates": 0, "errors": 0, "drops": 0, "limited": 0,
+                      "bad_signature": 0}
+        self._fill_ids = itertools.count(1)
+
+    # ---------- HTTP ----------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, v = h.decode("latin-1").split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+                n = int(headers.get("content-length") or 0)
+                body = (await reader.readexactly(n)).decode() if n else ""
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, data, extra, drop = self.route(method, target, headers, body)
+                if drop:
+                    break
+                payload = json.dumps(data).encode()
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}", "Content-Type: application/json",
+                        f"Content-Length: {len(payload)}"] + [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method: str, target: str, headers: Dict[str, str],
+              body: str) -> Tuple[int, Any, Dict[str, str], bool]:
+        self.stats["requests"] += 1
+        url = urlsplit(target)
+        path = url.path[len(PREFIX):] if url.path.startswith(PREFIX) else url.path
+        now = time.time()
+        if now >= self.reset_at:
+            self.used, self.reset_at = 0, now + self.window_s
+        self.used += WEIGHTS.get((method, path), 1)
+        limits = {"Bitvavo-Ratelimit-Limit": str(self.limit),
+                  "Bitvavo-Ratelimit-Remaining": str(max(0, self.limit - self.used)),
+                  "Bitvavo-Ratelimit-ResetAt": str(int(self.reset_at * 1000))}
+        if self.used > self.limit:
+            self.stats["limited"] += 1
+            return 429, {"errorCode": 110, "error": "rate limit exceeded"}, limits, False
+        if path == "/time":
+            return 200, {"time": int(now * 1000)}, limits, False
+        if not self._signed(method, target, headers, body):
+            self.stats["bad_signature"] += 1
+            return 403, {"errorCode": 309, "error": "invalid signature"}, limits, False
+        if self.rnd.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return 503, {"errorCode": 101, "error": "unknown error"}, limits, False
+        q = dict(parse_qsl(url.query))
+        if path == "/order" and method == "POST":
+            order, dup = self.create(json.loads(body))
+            if order is None:
+                return 400, {"errorCode": 203, "error": "missing market/side/orderType"}, limits, False
+            if not dup and self.rnd.random() < self.drop_rate:
+                self.stats["drops"] += 1
+                return 0, None, {}, True
+            return 200, order, limits, False
+        if path == "/order" and method in ("GET", "DELETE"):
+            oid = q.get("orderId") or self.by_client.get((q.get("market", ""), q.get("clientOrderId", "")))
+            order = self.orders.get(oid or "")
+            if order is None:
+                return 404, {"errorCode": 240, "error": "no order found"}, limits, False
+            if method == "DELETE":
+                return 200, {"orderId": oid}, limits, False
+            return 200, order, limits, False
+        return 404, {"errorCode": 110, "error": "not found"}, limits, False
+
+    def _signed(self, method: str, target: str, headers: Dict[str, str], body: str) -> bool:
+        ts = headers.get("bitvavo-access-timestamp", "")
+        want = hmac.new(self.secret, f"{ts}{method}{target}{body}".encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(want, headers.get("bitvavo-access-signature", ""))
+
+    # ---------- matching ----------
+
+    def create(self, req: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        market, side = req.get("market"), req.get("side")
+        if not market or side not in ("buy", "sell") or not req.get("orderType"):
+            return None, False
+        cid = req.get("clientOrderId")
+        if cid and (market, cid) in self.by_client:
+            self.stats["duplicates"] += 1
+            return self.orders[self.by_client[(market, cid)]], True
+        self.stats["orders"] += 1
+        p = self.prices.get(market) or 1.0 + self.rnd.random() * 100
+        p = self.prices[market] = round(p * (1 + self.rnd.gauss(0, 0.0005)), 5)
+        if req.get("amountQuote") is not None:
+            quote = float(req["amountQuote"])
+            amount = quote / p
+        else:
+            amount = float(req.get("amount") or 0)
+            quote = amount * p
+        fee = quote * self.fee
+        now = int(time.time() * 1000)
+        oid = str(uuid.uuid4())
+        order = {"orderId": oid, "clientOrderId": cid, "market": market, "created": now, "updated": now,
+                 "status": "filled", "side": side, "orderType": req["orderType"], "amount": f"{amount:.8f}",
+                 "amountRemaining": "0", "filledAmount": f"{amount:.8f}", "filledAmountQuote": f"{quote:.8f}",
+                 "feePaid": f"{fee:.8f}", "feeCurrency": "EUR", "selfTradePrevention": "decrementAndCancel",
+                 "visible": False, "timeInForce": "GTC", "postOnly": False,
+                 "fills": [{"id": str(next(self._fill_ids)), "timestamp": now, "amount": f"{amount:.8f}",
+                            "price": f"{p:.5f}", "taker": True, "fee": f"{fee:.8f}", "feeCurrency": "EUR",
+                            "settled": True}]}
+        self.orders[oid] = order
+        if cid:
+            self.by_client[(market, cid)] = oid
+        return order, False
+
+
+async def serve_mock(mock: MockBitvavo, host: str, port: int) -> asyncio.AbstractServer:
+    return await asyncio.start_server(mock.handle, host, port)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local Bitvavo REST stand-in")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8790)
+    ap.add_argument("--secret", default="secret")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--drop-rate", type=float, default=0.0)
+    ap.add_argument("--limit", type=int, default=1000, help="weight budget per window")
+    ap.add_argument("--window-s", type=float, default=60.0)
+    args = ap.parse_args()
+    mock = MockBitvavo(args.secret, args.latency_ms, args.error_rate, args.drop_rate, args.limit, args.window_s)
+
+    async def _run():
+        server = await serve_mock(mock, args.host, args.port)
+        print(f"bitvavo mock on http://{args.host}:{args.port}{PREFIX}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        print(json.dumps(mock.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compare two bench/run.py result files.
+
+    python bench/compare.py bench/results/old.json bench/results/new.json
+
+Prints every numeric metric with old, new and the relative change.
+"""
+import json, sys
+from typing import Any, Dict, Iterator, Tuple
+
+
+def leaves(d: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(d, dict):
+        for k, v in d.items():
+            yield from leaves(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(d, (int, float)) and not isinstance(d, bool):
+        yield prefix, float(d)
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("usage: compare.py OLD.json NEW.json")
+    old, new = (json.load(open(p)) for p in sys.argv[1:])
+    print(f"old: {old.get('commit')} {old.get('created')}   new: {new.get('commit')} {new.get('created')}")
+    if old.get("params") != new.get("params"):
+        print("warning: runs used different parameters")
+    a: Dict[str, float] = dict(leaves(old.get("stages", {})))
+    b: Dict[str, float] = dict(leaves(new.get("stages", {})))
+    width = max((len(k) for k in a.keys() | b.keys()), default=10)
+    for k in sorted(a.keys() | b.keys()):
+        x, y = a.get(k), b.get(k)
+        change = f"{(y - x) / x * 100:+.1f}%" if x and y is not None else ""
+        fx = f"{x:.6g}" if x is not None else "-"
+        fy = f"{y:.6g}" if y is not None else "-"
+        print(f"{k:<{width}}  {fx:>12}  {fy:>12}  {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Decision-path benchmark: per-market compute_signal (book view + snapshot
+dict per market, as trading_core's decide builds them) against
+compute_signal_batch over the SignalColumns that the event loop keeps
+current, for a range of selection sizes. Also reports what the in-place
+column updates add per book/ticker event.
+
+    python bench/decision.py --markets 8,32,100,300
+    python bench/decision.py --check     # exit 1 if the batch path is not faster at batch_min_markets
+
+Times are the best of --repeat runs, in µs per decision run (per event for
+the updates). The Redis MGET of the per-market path is not included.
+"""
+import argparse, json, random, sys, timeit
+from pathlib import Path
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "services/trading_core"))
+from trading_core.book import BookManager, OrderBook  # noqa: E402
+from trading_core.decision import SignalColumns, compute_signal, compute_signal_batch  # noqa: E402
+
+PARAMS = {"max_spread_bps": 12, "min_book_depth_eur": 200}
+
+
+def setup(n: int, seed: int):
+    rnd = random.Random(seed)
+    books = BookManager(None, depth=100, levels=10)
+    columns = SignalColumns()
+    tickers = {}
+    markets = [f"M{i}-EUR" for i in range(n)]
+    for m in markets:
+        mid = rnd.choice([0.5, 37.5, 100, 64000])
+        tick = mid * rnd.choice([0.0001, 0.0005, 0.002])
+        b = books.books[m] = OrderBook(m, 100)
+        b.apply_snapshot(1, [[mid - tick * (i + 1), rnd.uniform(0.1, 50)] for i in range(20)],
+                         [[mid + tick * (i + 1), rnd.uniform(0.1, 50)] for i in range(20)])
+        tickers[m] = {"market": m, "lastPrice": str(mid)}
+        columns.set_book(m, books.view(m))
+        columns.set_ticker(m, tickers[m])
+    return markets, books, columns, tickers
+
+
+def per_market(markets, books, tickers):
+    out = []
+    for m in markets:
+        snapshot = {"ticker": tickers[m]}
+        view = books.view(m)
+        if view is not None:
+            snapshot["book"] = view
+        d = compute_signal(m, snapshot, PARAMS)
+        if d.side:
+            out.append(d)
+    return out
+
+
+def batched(markets, columns):
+    return compute_signal_batch(columns.select(markets), PARAMS).entries()
+
+
+def best_us(fn, number: int, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(n: int, args):
+    markets, books, columns, tickers = setup(n, args.seed)
+    assert [d.market for d in per_market(markets, books, tickers)] == [d.market for d in batched(markets, columns)]
+    number = max(20, 20_000 // n)
+    scalar = best_us(lambda: per_market(markets, books, tickers), number, args.repeat)
+    batch = best_us(lambda: batched(markets, columns), number, args.repeat)
+    m = markets[0]
+    view, ticker = books.view(m), tickers[m]
+    set_book = best_us(lambda: columns.set_book(m, view), 20_000, args.repeat)
+    set_ticker = best_us(lambda: columns.set_ticker(m, ticker), 20_000, args.repeat)
+    return {"markets": n, "per_market_us": round(scalar, 1), "batch_us": round(batch, 1),
+            "speedup": round(scalar / batch, 2), "set_book_us": round(set_book, 2),
+            "set_ticker_us": round(set_ticker, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the per-market and batched decision paths")
+    ap.add_argument("--markets", default="8,16,32,100,300")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--check", action="store_true",
+                    help="fail unless the batch path wins at signals.batch_min_markets (trading_core config.yml)")
+    args = ap.parse_args()
+
+    results = [run(int(n), args) for n in args.markets.split(",")]
+    print(json.dumps(results, indent=2))
+    if args.check:
+        cfg = yaml.safe_load((ROOT / "services/trading_core/trading_core/config.yml").read_text())
+        n = int(cfg["signals"].get("batch_min_markets", 32))
+        r = run(n, args)
+        if r["batch_us"] >= r["per_market_us"]:
+            print(f"[FAIL] batch path {r['batch_us']}µs >= per-market {r['per_market_us']}µs at {n} markets")
+            sys.exit(1)
+        print(f"[OK]   batch path {r['batch_us']}µs < per-market {r['per_market_us']}µs at {n} markets "
+              f"(batch_min_markets)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Synthetic (or recorded) Bitvavo public WebSocket feed for benchmarks.
+
+Speaks the subset of the protocol the ingest uses: `subscribe`/`unsubscribe`
+for the ticker, trades and book channels, then pushes events for the
+subscribed markets at a configured total rate. Book deltas carry a
+contiguous nonce per market, and `GET /v2/{market}/book?depth=N` on the same
+port returns a matching snapshot, so trading_core's resync path runs too.
+
+Every event carries `_t` (send time, epoch ms) for end-to-end latency.
+
+    python bench/feed.py --port 8765 --markets 100 --rate 5000
+    python bench/feed.py --replay recorded.jsonl --rate 2000   # one frame per line
+"""
+import argparse, asyncio, http, itertools, json, random, time
+from typing import Dict, List, Optional, Set
+import orjson
+from websockets.asyncio.server import serve, ServerConnection
+from websockets.http11 import Response
+from websockets.datastructures import Headers
+
+CHANNEL_OF = {"ticker": "ticker", "trades": "trade", "book": "book"}
+
+
+class MarketSim:
+    __slots__ = ("market", "mid", "nonce", "bids", "asks")
+
+    def __init__(self, market: str, rnd: random.Random):
+        self.market = market
+        self.mid = rnd.uniform(0.5, 50_000)
+        self.nonce = 0
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+
+    def tick(self) -> float:
+        return self.mid * 0.0001
+
+    def book_delta(self, rnd: random.Random) -> dict:
+        self.mid *= 1 + rnd.gauss(0, 0.0002)
+        step = self.tick()
+        bid = round(self.mid - step * rnd.randint(1, 20), 8)
+        ask = round(self.mid + step * rnd.randint(1, 20), 8)
+        bsz = round(rnd.choice((0.0, rnd.uniform(0.01, 50))), 6)
+        asz = round(rnd.choice((0.0, rnd.uniform(0.01, 50))), 6)
+        for side, p, s in ((self.bids, bid, bsz), (self.asks, ask, asz)):
+            if s:
+                side[p] = s
+            else:
+                side.pop(p, None)
+        # drop crossed levels so snapshot and deltas stay consistent
+        for p in [p for p in self.bids if p >= self.mid]:
+            self.bids.pop(p)
+        for p in [p for p in self.asks if p <= self.mid]:
+            self.asks.pop(p)
+        self.nonce += 1
+        return {"event": "book", "market": self.market, "nonce": self.nonce,
+                "bids": [[str(bid), str(bsz)]], "asks": [[str(ask), str(asz)]]}
+
+    def snapshot(self, depth: int) -> dict:
+        bids = sorted(self.bids.items(), reverse=True)[:depth]
+        asks = sorted(self.asks.items())[:depth]
+        return {"market": self.market, "nonce": self.nonce,
+                "bids": [[str(p), str(s)] for p, s in bids], "asks": [[str(p), str(s)] for p, s in asks]}
+
+    def ticker(self) -> dict:
+        bid = max(self.bids) if self.bids else self.mid - self.tick()
+        ask = min(self.asks) if self.asks else self.mid + self.tick()
+        return {"event": "ticker", "market": self.market, "bestBid": f"{bid:.8g}", "bestBidSize": "1.5",
+                "bestAsk": f"{ask:.8g}", "bestAskSize": "2.0", "lastPrice": f"{self.mid:.8g}"}
+
+    def trade(self, rnd: random.Random, seq: int) -> dict:
+        return {"event": "trade", "timestamp": int(time.time() * 1000), "market": self.market, "id": str(seq),
+                "amount": f"{rnd.uniform(0.001, 5):.6f}", "price": f"{self.mid:.8g}",
+                "side": rnd.choice(("buy", "sell"))}
+
+
+class Feed:
+    def __init__(self, markets: int, rate: float, mix=(0.3, 0.1, 0.6), replay: Optional[str] = None,
+                 seed: int = 7):
+        self.rnd = random.Random(seed)
+        self.sims = {f"M{i:04d}-EUR": MarketSim(f"M{i:04d}-EUR", self.rnd) for i in range(markets)}
+        self.rate = float(rate)
+        self.mix = mix  # ticker, trade, book
+        self.replay: Optional[List[bytes]] = None
+        if replay:
+            with open(replay, "rb") as f:
+                self.replay = [l.strip() for l in f if l.strip()]
+        self.conns: Dict[ServerConnection, Dict[str, Set[str]]] = {}
+        self.sent = 0
+        self._seq = itertools.count()
+
+    @property
+    def markets(self) -> List[str]:
+        return list(self.sims)
+
+    def _event(self, subs: Dict[str, Set[str]]) -> Optional[dict]:
+        r = self.rnd.random()
+        ch = "ticker" if r < self.mix[0] else "trade" if r < self.mix[0] + self.mix[1] else "book"
+        markets = subs.get(ch)
+        if not markets:
+            ch, markets = next(((c, m) for c, m in subs.items() if m), (None, None))
+            if not markets:
+                return None
+        sim = self.sims.get(self.rnd.choice(tuple(markets)))
+        if sim is None:
+            return None
+        if ch == "book":
+            return sim.book_delta(self.rnd)
+        if ch == "trade":
+            return sim.trade(self.rnd, next(self._seq))
+        return sim.ticker()
+
+    def process_request(self, connection, request):
+        # REST book snapshots on the same port: GET /v2/{market}/book?depth=N
+        path, _, query = request.path.partition("?")
+        parts = path.strip("/").split("/")
+        if len(parts) == 3 and parts[2] == "book":
+            sim = self.sims.get(parts[1])
+            if sim is None:
+                return Response(http.HTTPStatus.NOT_FOUND, "Not Found", Headers(), b"{}")
+            depth = 1000
+            for kv in query.split("&"):
+                if kv.startswith("depth="):
+                    depth = int(kv[6:])
+            body = orjson.dumps(sim.snapshot(depth))
+            return Response(http.HTTPStatus.OK, "OK", Headers([("Content-Type", "application/json"),
+                                                               ("Content-Length", str(len(body)))]), body)
+        return None
+
+    async def handler(self, ws: ServerConnection):
+        subs: Dict[str, Set[str]] = {"ticker": set(), "trade": set(), "book": set()}
+        self.conns[ws] = subs
+        pusher = asyncio.create_task(self._push(ws, subs))
+        try:
+            async for msg in ws:
+                req = json.loads(msg)
+                for c in req.get("channels") or []:
+                    ch = CHANNEL_OF.get(c.get("name"))
+                    if ch is None:
+                        continue
+                    if req.get("action") == "subscribe":
+                        subs[ch].update(c.get("markets") or [])
+                    elif req.get("action") == "unsubscribe":
+                        subs[ch].difference_update(c.get("markets") or [])
+                await ws.send(orjson.dumps({"event": "subscribed", "subscriptions": {}}).decode())
+        finally:
+            pusher.cancel()
+            self.conns.pop(ws, None)
+
+    async def _push(self, ws: ServerConnection, subs: Dict[str, Set[str]]):
+        tick = 0.005
+        budget = 0.0
+        replay = itertools.cycle(self.replay) if self.replay else None
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(tick)
+            now = time.perf_counter()
+            # each connection gets its share of the rate by subscribed markets
+            n_subs = len(set().union(*subs.values()))
+            share = n_subs / max(1, len(self.sims)) if replay is None else 1.0 / max(1, len(self.conns))
+            budget += self.rate * share * (now - last)
+            last = now
+            n = int(budget)
+            if n <= 0:
+                continue
+            budget -= n
+            t_ms = time.time() * 1000
+            frames = []
+            for _ in range(n):
+                if replay is not None:
+                    frames.append(next(replay))
+                    continue
+                evt = self._event(subs)
+                if evt is None:
+                    break
+                evt["_t"] = t_ms
+                frames.append(orjson.dumps(evt).decode())
+            for fr in frames:
+                await ws.send(fr)
+            self.sent += len(frames)
+
+
+async def serve_feed(feed: Feed, host: str, port: int):
+    return await serve(feed.handler, host, port, process_request=feed.process_request, max_size=None,
+                       compression=None)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Synthetic Bitvavo WS feed")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--markets", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=5000, help="total events/s across all connections")
+    ap.add_argument("--replay", help="recorded frames, one JSON object per line")
+    args = ap.parse_args()
+
+    async def _run():
+        feed = Feed(args.markets, args.rate, replay=args.replay)
+        async with await serve_feed(feed, args.host, args.port):
+            print(f"feed on ws://{args.host}:{args.port} markets={args.markets} rate={args.rate}/s", flush=True)
+            await asyncio.Future()
+
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
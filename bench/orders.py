@@ -0,0 +1,77 @@
+"""
+Order gateway benchmark: trading_core's BitvavoExecutor against the local
+Bitvavo stand-in (bench/bitvavo_mock.py, started as its own process).
+
+    python bench/orders.py --orders 2000 --concurrency 16 --markets 20 --latency-ms 5
+
+Reports orders/s and p50/p99 order latency (place_order call to result) as
+JSON; the mock's --error-rate/--drop-rate exercise retries, the
+clientOrderId lookup and the circuit breaker.
+"""
+import argparse, asyncio, json, subprocess, sys, time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "services/trading_core"))
+sys.path.insert(0, str(ROOT / "bench"))
+from run import free_port, percentiles, wait_port  # noqa: E402
+from trading_core.executor import BitvavoExecutor  # noqa: E402
+
+
+async def drive(args, port: int):
+    cfg = {"rest_base": f"http://127.0.0.1:{port}/v2", "api_key": "bench", "api_secret": "secret",
+           "max_connections": args.concurrency, "rate_limit_per_min": args.rate_limit, "retries": 2,
+           "breaker_failures": 5, "breaker_reset_s": 1}
+    ex = BitvavoExecutor(cfg, notional_eur=25.0)
+    await ex.start()
+    markets = [f"M{i}-EUR" for i in range(args.markets)]
+    latencies = []
+    results: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.orders):
+        queue.put_nowait(markets[i % len(markets)])
+
+    async def worker():
+        while not queue.empty():
+            m = queue.get_nowait()
+            side = "sell" if ex.holdings.get(m) else "buy"
+            t0 = time.perf_counter()
+            res = await ex.place_order(m, side, 0.0)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            results[res.reason] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+    await ex.close()
+    return {"orders": args.orders, "concurrency": args.concurrency, "markets": args.markets,
+            "mock_latency_ms": args.latency_ms, "elapsed_s": elapsed, "orders_per_s": args.orders / elapsed,
+            "latency_ms": percentiles(latencies), "results": dict(results)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the order gateway against the local Bitvavo mock")
+    ap.add_argument("--orders", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--markets", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="mock server latency per request")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--drop-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", type=int, default=1_000_000, help="weight per minute (mock and client)")
+    args = ap.parse_args()
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, str(ROOT / "bench/bitvavo_mock.py"), "--port", str(port),
+                             "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+                             "--drop-rate", str(args.drop_rate), "--limit", str(args.rate_limit)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        wait_port(port)
+        print(json.dumps(asyncio.run(drive(args, port)), indent=2))
+    finally:
+        mock.terminate()
+        mock.wait(10)
+
+
+if __name__ == "__main__":
+    main()
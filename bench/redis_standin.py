@@ -0,0 +1,23 @@
+"""
+Redis stand-in for benchmarks: fakeredis behind a real TCP socket, so the
+services connect with their normal redis:// DSN. Much slower than
+redis-server; pass --redis-url to bench/run.py to measure against a real one.
+
+    python bench/redis_standin.py --port 6390
+"""
+import argparse
+from fakeredis import TcpFakeServer
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+    server = TcpFakeServer((args.host, args.port), server_type="redis")
+    print(f"fakeredis on redis://{args.host}:{args.port}/0", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
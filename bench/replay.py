@@ -0,0 +1,112 @@
+"""
+Replay throughput benchmark: writes a synthetic Parquet lake (ingest's typed
+v1 schemas via its ColumnBuffer, book deltas with contiguous nonces, tickers
+and trades per market) and times trading_core.replay over it per worker count.
+
+    python bench/replay.py --markets 32 --seconds 600 --workers 1,4
+    python bench/replay.py --lake /srv/trading/data/parquet --date 2025-10-26   # project a real day
+
+Reports events/s per worker count and the projected wall time for a day of
+`--day-events` events; with --lake/--date that count is the row total of
+that day's parts (Parquet metadata only, nothing is replayed from the lake).
+"""
+import argparse, json, random, shutil, sys, tempfile
+from pathlib import Path
+import pyarrow.parquet as pq
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "services/trading_core"))
+sys.path.insert(0, str(ROOT / "services/ws_public_ingest"))
+from app.schemas import ColumnBuffer  # noqa: E402
+from trading_core import replay  # noqa: E402
+
+DATE = "2025-10-26"
+T0 = 1_761_436_800_000  # DATE 00:00 UTC in ms
+
+
+def write_part(root: Path, channel: str, market: str, buf: ColumnBuffer, seq: int):
+    base = root / channel / f"date={DATE}" / f"market={market}"
+    base.mkdir(parents=True, exist_ok=True)
+    pq.write_table(buf.to_table(), base / f"part-{T0 + seq}-0-{seq:06d}.parquet")
+
+
+def make_lake(root: Path, markets: int, seconds: int, rate: float, rows_per_file: int, seed: int) -> int:
+    """`rate` events/s per market: 70% book deltas, 20% tickers, 10% trades."""
+    rnd = random.Random(seed)
+    total = 0
+    for i in range(markets):
+        market = f"M{i}-EUR"
+        mid = rnd.choice([0.5, 37.5, 100.0, 64000.0])
+        tick = mid * 0.0002
+        bufs = {ch: ColumnBuffer(ch) for ch in replay.CHANNELS}
+        seq, nonce = 0, 0
+        n = int(seconds * rate)
+        for k in range(n):
+            ts = T0 + int(k * 1000 / rate)
+            mid *= 1 + rnd.gauss(0, 0.0002)
+            r = rnd.random()
+            if r < 0.7:
+                nonce += 1
+                bids = [[mid - tick * rnd.randint(1, 20), rnd.choice([0.0, rnd.uniform(0.1, 50)])] for _ in range(2)]
+                asks = [[mid + tick * rnd.randint(1, 20), rnd.choice([0.0, rnd.uniform(0.1, 50)])] for _ in range(2)]
+                bufs["books"].append({"nonce": nonce, "bids": bids, "asks": asks, "timestamp": ts}, market, ts)
+            elif r < 0.9:
+                bufs["tickers"].append({"bestBid": mid - tick, "bestBidSize": 5.0, "bestAsk": mid + tick,
+                                        "bestAskSize": 5.0, "lastPrice": mid, "timestamp": ts}, market, ts)
+            else:
+                bufs["trades"].append({"id": str(k), "price": mid, "amount": rnd.uniform(0.01, 2),
+                                       "side": rnd.choice(("buy", "sell")), "timestamp": ts}, market, ts)
+            for ch, buf in bufs.items():
+                if len(buf) >= rows_per_file:
+                    write_part(root, ch, market, buf, seq)
+                    seq += 1
+                    bufs[ch] = ColumnBuffer(ch)
+        for ch, buf in bufs.items():
+            if len(buf):
+                write_part(root, ch, market, buf, seq)
+                seq += 1
+        total += n
+    return total
+
+
+def lake_rows(root: Path, date: str) -> int:
+    return sum(pq.ParquetFile(p).metadata.num_rows
+               for ch in replay.CHANNELS for p in (root / ch / f"date={date}").glob("market=*/part-*.parquet"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark trading_core.replay over a synthetic Parquet lake")
+    ap.add_argument("--markets", type=int, default=32)
+    ap.add_argument("--seconds", type=int, default=600, help="event time per market")
+    ap.add_argument("--rate", type=float, default=20.0, help="events/s per market")
+    ap.add_argument("--rows-per-file", type=int, default=50_000)
+    ap.add_argument("--workers", default="1,4")
+    ap.add_argument("--day-events", type=float, default=100e6, help="events in a day of the full universe")
+    ap.add_argument("--lake", help="count --day-events from this Parquet root instead")
+    ap.add_argument("--date", default=DATE, help="day to count in --lake")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    day_events = lake_rows(Path(args.lake), args.date) if args.lake else int(args.day_events)
+    cfg = yaml.safe_load((ROOT / "services/trading_core/trading_core/config.yml").read_text())
+    tmp = Path(tempfile.mkdtemp(prefix="tradingbot-bench-replay-"))
+    try:
+        events = make_lake(tmp, args.markets, args.seconds, args.rate, args.rows_per_file, args.seed)
+        results = []
+        for w in (int(x) for x in args.workers.split(",")):
+            res = replay.run(str(tmp), [DATE], cfg, workers=w, split="market")
+            assert res["events"] == events, (res["events"], events)
+            eps = res["events_per_s"]
+            results.append({"markets": args.markets, "events": events, "workers": res["workers"],
+                            "elapsed_s": round(res["elapsed_s"], 2), "events_per_s": round(eps),
+                            "decisions": res["stats"].get("decisions", 0),
+                            "decisions_warmup": res["stats"].get("decisions_warmup", 0),
+                            "day_events": day_events, "day_minutes": round(day_events / eps / 60, 1)})
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+End-to-end benchmark: synthetic feed -> ws_public_ingest -> Redis -> trading_core,
+then market_selection.run_once over the Parquet parts the ingest wrote.
+
+Every service runs as its own process with its normal entry point and a
+config derived from the one in the repo (paths, ports and DSNs rewritten
+to a temp dir). Counters and histograms are scraped from the services'
+Prometheus endpoints before and after the measurement window; CPU and RSS
+come from /proc (Linux).
+
+    python bench/run.py --markets 100 --rate 5000 --duration 20
+    python bench/run.py --redis-url redis://127.0.0.1:6379/15 --shards 2
+
+Results are written as JSON to bench/results/<utc>-<commit>.json (or --out);
+compare two runs with `python bench/compare.py old.json new.json`.
+"""
+import argparse, json, os, platform, signal, socket, subprocess, sys, tempfile, time, urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import orjson
+import redis
+import yaml
+from prometheus_client.parser import text_string_to_metric_families
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ROOT / "services"
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), 0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"port {port} did not open")
+
+
+# ---------- process stats (/proc) ----------
+
+def _children(pid: int) -> List[int]:
+    out = []
+    for p in Path("/proc").iterdir():
+        if not p.name.isdigit():
+            continue
+        try:
+            ppid = int((p / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            out.append(int(p.name))
+    return out
+
+
+def process_tree(pid: int) -> List[int]:
+    todo, seen = [pid], []
+    while todo:
+        p = todo.pop()
+        seen.append(p)
+        todo.extend(_children(p))
+    return seen
+
+
+def cpu_seconds(pids: List[int]) -> float:
+    total = 0
+    for pid in pids:
+        try:
+            f = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            total += int(f[11]) + int(f[12])  # utime + stime
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / CLK_TCK
+
+
+def rss_mb(pids: List[int]) -> Tuple[float, float]:
+    """(current RSS, peak RSS) summed over the processes, in MiB."""
+    cur = peak = 0
+    for pid in pids:
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    cur += int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    peak += int(line.split()[1])
+        except OSError:
+            pass
+    return cur / 1024, peak / 1024
+
+
+# ---------- prometheus scraping ----------
+
+def scrape(port: int) -> Dict[Tuple[str, Tuple], float]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+        text = r.read().decode()
+    out = {}
+    for fam in text_string_to_metric_families(text):
+        for s in fam.samples:
+            out[(s.name, tuple(sorted(s.labels.items())))] = s.value
+    return out
+
+
+def delta(after: Dict, before: Dict, name: str, **match) -> float:
+    total = 0.0
+    for (n, labels), v in after.items():
+        if n != name:
+            continue
+        lab = dict(labels)
+        if any(lab.get(k) != v2 for k, v2 in match.items()):
+            continue
+        total += v - before.get((n, labels), 0.0)
+    return total
+
+
+def hist_quantiles(after: Dict, before: Dict, name: str, qs=(0.5, 0.99), **match) -> Dict[str, Optional[float]]:
+    """Quantiles of a histogram's increase over the window (linear within buckets)."""
+    buckets: Dict[float, float] = {}
+    for (n, labels), v in after.items():
+        if n != name + "_bucket":
+            continue
+        lab = dict(labels)
+        if any(lab.get(k) != v2 for k, v2 in match.items()):
+            continue
+        le = float(lab["le"])
+        buckets[le] = buckets.get(le, 0.0) + v - before.get((n, labels), 0.0)
+    bounds = sorted(buckets)
+    total = buckets.get(float("inf"), 0.0)
+    res: Dict[str, Optional[float]] = {"count": total}
+    for q in qs:
+        key = f"p{int(q * 100)}"
+        if total <= 0:
+            res[key] = None
+            continue
+        target, prev_b, prev_c = q * total, 0.0, 0.0
+        res[key] = None
+        for b in bounds:
+            c = buckets[b]
+            if c >= target:
+                if b == float("inf"):
+                    res[key] = prev_b
+                else:
+                    frac = (target - prev_c) / (c - prev_c) if c > prev_c else 1.0
+                    res[key] = prev_b + (b - prev_b) * frac
+                break
+            prev_b, prev_c = b, c
+    return res
+
+
+def percentiles(values: List[float], qs=(0.5, 0.99)) -> Dict[str, Optional[float]]:
+    vals = sorted(values)
+    out: Dict[str, Optional[float]] = {"count": len(vals)}
+    for q in qs:
+        out[f"p{int(q * 100)}"] = vals[min(len(vals) - 1, int(q * len(vals)))] if vals else None
+    return out
+
+
+# ---------- service configs ----------
+
+def ingest_config(tmp: Path, args, redis_url: str, feed_port: int, metrics_port: int) -> Path:
+    cfg = yaml.safe_load((SERVICES / "ws_public_ingest/config/public.yml").read_text())
+    cfg["runtime"].update(log_level="WARNING", metrics_port=metrics_port, parquet_root=str(tmp / "parquet"),
+                          redis_dsn=redis_url, universe_file=str(tmp / "universe.txt"),
+                          selection_file=str(tmp / "selection.json"))
+    cfg["ws"]["url"] = f"ws://127.0.0.1:{feed_port}/v2/"
+    cfg.setdefault("shards", {}).update(count=args.shards, processes=args.shard_processes)
+    cfg.setdefault("parquet", {})["rotation_seconds"] = args.rotation_s
+    if args.codec:
+        cfg.setdefault("redis", {})["codec"] = args.codec
+    p = tmp / "public.yml"
+    p.write_text(yaml.safe_dump(cfg))
+    return p
+
+
+def trading_core_config(tmp: Path, redis_url: str, feed_port: int, http_port: int) -> Path:
+    cfg = yaml.safe_load((SERVICES / "trading_core/trading_core/config.yml").read_text())
+    cfg.update(redis_url=redis_url, selection_file=str(tmp / "selection.json"))
+    cfg["http"] = {"host": "127.0.0.1", "port": http_port}
+    cfg["execution"]["mode"] = "paper"
+    cfg["execution"]["bitvavo"]["rest_base"] = f"http://127.0.0.1:{feed_port}/v2"
+    cfg["logging"] = {"level": "WARNING"}
+    cfg["state"] = dict(cfg.get("state") or {}, path=str(tmp / "trading_core.state"), redis=False)
+    p = tmp / "trading_core.yml"
+    p.write_text(yaml.safe_dump(cfg))
+    return p
+
+
+def selection_config(tmp: Path, metrics_port: int) -> Path:
+    cfg = yaml.safe_load((SERVICES / "market_selection/config/selection.yml").read_text())
+    cfg["runtime"].update(log_level="WARNING", metrics_port=metrics_port, mode="batch")
+    cfg["inputs"].update(universe_file=str(tmp / "universe.txt"), parquet_tickers_root=str(tmp / "parquet/tickers"),
+                         index_file=str(tmp / "parts.sqlite"))
+    cfg["output"]["selection_file"] = str(tmp / "selection.bench.json")
+    p = tmp / "selection.yml"
+    p.write_text(yaml.safe_dump(cfg))
+    return p
+
+
+SELECTION_DRIVER = """
+import json, resource, sys, time, yaml
+from app.main import run_once, make_pool, index_path
+from app.part_index import PartIndex
+cfg = yaml.safe_load(open(sys.argv[1]))
+index = PartIndex(index_path(cfg))
+pool = make_pool(cfg)
+runs = []
+for i in range(int(sys.argv[2])):
+    t0 = time.perf_counter()
+    run_once(cfg, index, pool)
+    runs.append(time.perf_counter() - t0)
+self_ru = resource.getrusage(resource.RUSAGE_SELF)
+kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+print(json.dumps({"runs_s": runs, "cpu_s": self_ru.ru_utime + self_ru.ru_stime + kids.ru_utime + kids.ru_stime,
+                  "peak_rss_mb": self_ru.ru_maxrss / 1024}))
+"""
+
+
+def spawn(cmd: List[str], cwd: Path, log: Path, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=str(cwd), stdout=open(log, "wb"), stderr=subprocess.STDOUT,
+                            env={**os.environ, **(env or {})}, start_new_session=True)
+
+
+def stop(p: subprocess.Popen, timeout: float = 20.0):
+    if p.poll() is None:
+        p.send_signal(signal.SIGTERM)
+        try:
+            p.wait(timeout)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+
+
+def stream_stats(r: "redis.Redis", stream: str, since_ms: int, n: int = 20_000) -> Dict[str, Any]:
+    """
+    From the entries themselves (ms resolution): feed send time (`_t`, only
+    kept by the JSON codec) -> XADD, ingest receive time (`rt`) -> XADD, and
+    the mean size of the `v` field.
+    """
+    feed, recv, size = [], [], []
+    for eid, fields in r.xrevrange(stream, count=n):
+        t_add = int(eid.split(b"-", 1)[0])
+        if t_add < since_ms:
+            break
+        v = fields.get(b"v") or b""
+        size.append(len(v))
+        if fields.get(b"rt"):
+            recv.append(max(0.0, (t_add - int(fields[b"rt"])) / 1000.0))
+        if v[:1] == b"{":
+            try:
+                t_sent = orjson.loads(v).get("_t")
+            except Exception:
+                continue
+            if t_sent:
+                feed.append(max(0.0, (t_add - t_sent) / 1000.0))
+    return {"feed_to_redis_s": percentiles(feed), "recv_to_redis_s": percentiles(recv),
+            "value_bytes": sum(size) / len(size) if size else None}
+
+
+def git_commit() -> Tuple[str, bool]:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "services", "bench"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark ingest, trading_core and market_selection")
+    ap.add_argument("--markets", type=int, default=100)
+    ap.add_argument("--selection-size", type=int, default=20, help="markets for trades/books and decisions")
+    ap.add_argument("--rate", type=float, default=5000, help="feed events/s (total)")
+    ap.add_argument("--replay", help="recorded frames (JSONL) instead of synthetic traffic")
+    ap.add_argument("--duration", type=float, default=20, help="measurement window (s)")
+    ap.add_argument("--warmup", type=float, default=5)
+    ap.add_argument("--shards", type=int, default=1)
+    ap.add_argument("--shard-processes", action="store_true")
+    ap.add_argument("--rotation-s", type=int, default=5, help="ingest parquet rotation during the bench")
+    ap.add_argument("--selection-runs", type=int, default=5)
+    ap.add_argument("--redis-url", help="real Redis (default: fakeredis TCP stand-in)")
+    ap.add_argument("--codec", choices=("binary", "json"), help="ingest redis.codec (default: from public.yml)")
+    ap.add_argument("--out")
+    ap.add_argument("--keep", action="store_true", help="keep the temp dir (logs, parquet)")
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="tradingbot-bench-"))
+    markets = [f"M{i:04d}-EUR" for i in range(args.markets)]
+    (tmp / "universe.txt").write_text("\n".join(markets) + "\n")
+    (tmp / "selection.json").write_text(json.dumps({"markets": markets[:args.selection_size]}))
+
+    procs: List[subprocess.Popen] = []
+    py = sys.executable
+    try:
+        redis_url = args.redis_url
+        if not redis_url:
+            rport = free_port()
+            procs.append(spawn([py, str(ROOT / "bench/redis_standin.py"), "--port", str(rport)], ROOT,
+                               tmp / "redis.log"))
+            wait_port(rport)
+            redis_url = f"redis://127.0.0.1:{rport}/0"
+        r = redis.from_url(redis_url)
+        r.delete("ws:ticker", "ws:trade", "ws:book")
+
+        feed_port = free_port()
+        feed_cmd = [py, str(ROOT / "bench/feed.py"), "--port", str(feed_port), "--markets", str(args.markets),
+                    "--rate", str(args.rate)] + (["--replay", args.replay] if args.replay else [])
+        feed = spawn(feed_cmd, ROOT, tmp / "feed.log")
+        procs.append(feed)
+        wait_port(feed_port)
+
+        ingest_port, tc_port = free_port(), free_port()
+        ingest = spawn([py, "-m", "app.main", "--config", str(ingest_config(tmp, args, redis_url, feed_port,
+                                                                            ingest_port))],
+                       SERVICES / "ws_public_ingest", tmp / "ingest.log")
+        procs.append(ingest)
+        tc = spawn([py, "-m", "trading_core.main"], SERVICES / "trading_core", tmp / "trading_core.log",
+                   env={"TRADING_CORE_CONFIG": str(trading_core_config(tmp, redis_url, feed_port, tc_port))})
+        procs.append(tc)
+        wait_port(ingest_port)
+        wait_port(tc_port)
+
+        time.sleep(args.warmup)
+        pids = {"feed": process_tree(feed.pid), "ingest": process_tree(ingest.pid), "trading_core": [tc.pid]}
+        cpu0 = {k: cpu_seconds(v) for k, v in pids.items()}
+        m_in0, m_tc0 = scrape(ingest_port), scrape(tc_port)
+        t0, since_ms = time.monotonic(), int(time.time() * 1000)
+        time.sleep(args.duration)
+        m_in1, m_tc1 = scrape(ingest_port), scrape(tc_port)
+        wall = time.monotonic() - t0
+        cpu1 = {k: cpu_seconds(v) for k, v in pids.items()}
+        rss = {k: rss_mb(v) for k, v in pids.items()}
+
+        def proc_stats(k):
+            return {"cpu_pct": 100.0 * (cpu1[k] - cpu0[k]) / wall, "rss_mb": rss[k][0], "peak_rss_mb": rss[k][1]}
+
+        ingested = delta(m_in1, m_in0, "ws_events_ingested_total")
+        stages = {
+            "feed": {"events_per_s": None, **proc_stats("feed")},
+            "ingest": {
+                "events_per_s": ingested / wall,
+                "events_per_s_by_channel": {ch: delta(m_in1, m_in0, "ws_events_ingested_total", channel=ch) / wall
+                                            for ch in ("ticker", "trade", "book")},
+                "queue_overflow": delta(m_in1, m_in0, "ws_queue_overflow_total"),
+                "redis_dropped": delta(m_in1, m_in0, "ws_redis_dropped_total"),
+                "streams": {s: stream_stats(r, s, since_ms) for s in ("ws:ticker", "ws:trade", "ws:book")},
+                "redis_flush_s": hist_quantiles(m_in1, m_in0, "ws_redis_flush_seconds"),
+                "parquet_flush_s": hist_quantiles(m_in1, m_in0, "ws_parquet_flush_seconds"),
+                **proc_stats("ingest"),
+            },
+            "trading_core": {
+                "events_per_s": delta(m_tc1, m_tc0, "trading_core_events_consumed_total") / wall,
+                "decision_runs_per_s": delta(m_tc1, m_tc0, "trading_core_decision_runs_total") / wall,
+                "book_updates_per_s": delta(m_tc1, m_tc0, "trading_core_book_updates_total") / wall,
+                "book_resyncs": delta(m_tc1, m_tc0, "trading_core_book_resyncs_total"),
+                "tick_to_decision_s": hist_quantiles(m_tc1, m_tc0, "trading_core_tick_to_decision_seconds"),
+                "latency_by_channel": {
+                    ch: {stage: hist_quantiles(m_tc1, m_tc0, name, channel=ch) for stage, name in (
+                        ("exchange_to_ingest_s", "trading_core_exchange_to_ingest_seconds"),
+                        ("ingest_to_redis_s", "trading_core_ingest_to_redis_seconds"),
+                        ("redis_to_decision_s", "trading_core_redis_to_decision_seconds"),
+                        ("decision_to_order_ms", "trader_order_latency_ms"))}
+                    for ch in ("ticker", "trade", "book")},
+                **proc_stats("trading_core"),
+            },
+        }
+        stop(tc)
+        stop(ingest)  # flushes the remaining parquet buffers
+
+        sel = subprocess.run([py, "-c", SELECTION_DRIVER, str(selection_config(tmp, free_port())),
+                              str(args.selection_runs)], cwd=SERVICES / "market_selection",
+                             capture_output=True, text=True)
+        if sel.returncode == 0:
+            res = json.loads(sel.stdout.strip().splitlines()[-1])
+            parts = sum(1 for _ in (tmp / "parquet/tickers").rglob("part-*.parquet"))
+            runs = res["runs_s"]
+            stages["market_selection"] = {"parts": parts, "run_cold_s": runs[0] if runs else None,
+                                          "run_warm_s": percentiles(runs[1:]) if len(runs) > 1 else None,
+                                          "cpu_s": res["cpu_s"], "peak_rss_mb": res["peak_rss_mb"]}
+        else:
+            stages["market_selection"] = {"error": sel.stderr.strip().splitlines()[-1:]}
+    finally:
+        for p in reversed(procs):
+            stop(p, 5.0)
+
+    sha, dirty = git_commit()
+    result = {
+        "version": 1,
+        "commit": sha,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "keep")},
+        "redis": "external" if args.redis_url else "fakeredis",
+        "stages": stages,
+    }
+    out = Path(args.out) if args.out else ROOT / "bench/results" / (
+        datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + f"-{sha}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(json.dumps(result["stages"], indent=2))
+    print(f"results: {out}" + (f"  (temp dir kept: {tmp})" if args.keep else ""))
+    if not args.keep:
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
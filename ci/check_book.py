@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Edge cases of trading_core's local order books (book.py): delta application,
+stale and collapsed (nonceStart) updates, nonce-gap detection and resync
+from a BookSource with the deltas that arrive meanwhile buffered and
+replayed, a gap that persists after the snapshot, a failing source, and the
+delta-only rebase that replay uses.
+
+    python ci/check_book.py
+"""
+import asyncio
+from checklib import close, run_checks
+from trading_core.book import BookManager, OrderBook, StaticBookSource
+
+M = "BTC-EUR"
+
+
+def delta(nonce, bids=(), asks=(), start=None):
+    evt = {"market": M, "nonce": nonce, "bids": [list(l) for l in bids], "asks": [list(l) for l in asks]}
+    if start is not None:
+        evt["nonceStart"] = start
+    return evt
+
+
+class SlowSource(StaticBookSource):
+    """StaticBookSource that answers after a few loop turns, so deltas arrive while the resync is in flight."""
+
+    async def fetch(self, market, depth):
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return await super().fetch(market, depth)
+
+
+class FailingSource:
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch(self, market, depth):
+        self.calls += 1
+        raise ConnectionError("REST down")
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def check_deltas():
+    """deltas: insert, update, remove at size 0, sorted sides, depth truncation"""
+    b = OrderBook(M, depth=3)
+    b.apply_snapshot(10, [[100, 1], [99, 2]], [[101, 1], [102, 2]])
+    assert b.apply_update(11, [[100.5, 3], [99, 0]], [[101, 5]])
+    assert b.bids.levels() == [(100.5, 3), (100, 1)], b.bids.levels()
+    assert b.asks.levels() == [(101, 5), (102, 2)], b.asks.levels()
+    assert b.apply_update(12, [[98, 1], [97, 1]], [])
+    assert b.bids.levels() == [(100.5, 3), (100, 1), (98, 1)], "bids beyond depth are truncated"
+    v = b.view(levels=2)
+    assert (v["bestBid"], v["bestAsk"]) == (100.5, 101)
+    assert close(v["bestBidSizeEur"], 301.5) and close(v["bidDepthEur"], 100.5 * 3 + 100)
+    assert close(v["imbalance"], (401.5 - (505 + 204)) / (401.5 + 505 + 204))
+
+
+def check_stale():
+    """stale and duplicate nonces are ignored without losing sync"""
+    b = OrderBook(M)
+    b.apply_snapshot(10, [[100, 1]], [[101, 1]])
+    assert b.apply_update(10, [[100, 9]], []) and b.apply_update(7, [[100, 9]], [])
+    assert b.bids.best() == (100, 1) and b.synced and b.nonce == 10
+
+
+def check_collapsed():
+    """a collapsed run (nonceStart..nonce) applies when it starts at or before nonce + 1"""
+    b = OrderBook(M)
+    b.apply_snapshot(10, [[100, 1]], [[101, 1]])
+    assert b.apply_update(15, [[100, 2]], [], nonce_start=9), "run overlapping the book applies"
+    assert b.nonce == 15 and b.bids.best() == (100, 2)
+    assert b.apply_update(18, [[100, 3]], [], nonce_start=16)
+    assert not b.apply_update(25, [[100, 4]], [], nonce_start=20), "run starting past nonce + 1 is a gap"
+    assert not b.synced and b.bids.best() == (100, 3)
+
+
+async def check_initial_sync():
+    """first event without a book triggers an initial resync; the buffered event is replayed"""
+    src = StaticBookSource({M: (10, [[100, 1]], [[101, 1]])})
+    resynced = []
+    mgr = BookManager(src, min_resync_interval_s=0, on_resync=resynced.append)
+    assert not mgr.on_event(delta(11, bids=[[100, 2]]))
+    assert mgr.view(M) is None, "no view before the snapshot"
+    await settle()
+    assert src.calls == 1 and resynced == [M]
+    assert mgr.books[M].nonce == 11 and mgr.books[M].bids.best() == (100, 2)
+    await mgr.close()
+
+
+async def check_gap_resync():
+    """a nonce gap marks the book stale, resyncs and replays the deltas buffered meanwhile"""
+    src = SlowSource({M: (10, [[100, 1]], [[101, 1]])})
+    mgr = BookManager(src, min_resync_interval_s=0)
+    mgr.books[M] = OrderBook(M)
+    mgr.books[M].apply_snapshot(5, [[90, 1]], [[110, 1]])
+    assert mgr.on_event(delta(6, bids=[[91, 1]]))
+    assert not mgr.on_event(delta(9, bids=[[92, 1]])), "gap: 6 -> 9"
+    assert mgr.get(M) is None
+    # arrive while the snapshot (nonce 10) is in flight: 10 is older than it, 11 and 12 apply on top
+    for evt in (delta(10, bids=[[93, 1]]), delta(11, asks=[[101, 4]]), delta(12, bids=[[100.5, 1]])):
+        assert not mgr.on_event(evt)
+    await settle()
+    book = mgr.get(M)
+    assert book is not None and book.nonce == 12 and src.calls == 1
+    assert book.bids.levels() == [(100.5, 1), (100, 1)], book.bids.levels()
+    assert book.asks.levels() == [(101, 4)]
+    assert mgr.on_event(delta(13, asks=[[101, 0]])) and mgr.view(M).get("bestAsk") is None
+    await mgr.close()
+
+
+async def check_gap_persists():
+    """a snapshot older than the buffered deltas leaves the book stale; the next event resyncs again"""
+    src = StaticBookSource({M: (10, [[100, 1]], [[101, 1]])})
+    mgr = BookManager(src, min_resync_interval_s=0)
+    mgr.on_event(delta(20, bids=[[100, 2]]))
+    await settle()
+    assert src.calls == 1 and mgr.get(M) is None, "snapshot at 10 cannot continue at 20"
+    src.books[M] = (21, [[100, 3]], [[101, 1]])
+    mgr.on_event(delta(22, bids=[[100, 4]]))
+    await settle()
+    book = mgr.get(M)
+    assert src.calls == 2 and book is not None and book.nonce == 22 and book.bids.best() == (100, 4)
+    await mgr.close()
+
+
+async def check_resync_throttle():
+    """resyncs per market are rate limited by min_resync_interval_s"""
+    src = StaticBookSource({M: (1, [[100, 1]], [[101, 1]])})
+    mgr = BookManager(src, min_resync_interval_s=60)
+    mgr.on_event(delta(5))
+    await settle()
+    mgr.on_event(delta(9))
+    await settle()
+    assert src.calls == 1 and mgr.get(M) is None
+    await mgr.close()
+
+
+async def check_failing_source():
+    """a failing source leaves the book unsynced and stops buffering; the next event retries"""
+    src = FailingSource()
+    mgr = BookManager(src, min_resync_interval_s=0)
+    mgr.on_event(delta(5))
+    await settle()
+    assert src.calls == 1 and mgr.get(M) is None and M not in mgr._resyncing
+    mgr.on_event(delta(6))
+    await settle()
+    assert src.calls == 2
+    await mgr.close()
+
+
+def check_rebase():
+    """rebase_on_gap (replay): no source, books built from deltas and carried across gaps"""
+    mgr = BookManager(None, rebase_on_gap=True)
+    assert mgr.on_event(delta(100, bids=[[100, 1]], asks=[[101, 1]]))
+    assert mgr.on_event(delta(101, bids=[[99, 1]]))
+    assert mgr.on_event(delta(150, asks=[[100.5, 2]])), "gap is rebased, not resynced"
+    v = mgr.view(M)
+    assert mgr.books[M].nonce == 150 and (v["bestBid"], v["bestAsk"]) == (100, 100.5)
+    assert mgr.books[M].bids.levels() == [(100, 1), (99, 1)], "levels from before the gap are kept"
+
+
+if __name__ == "__main__":
+    run_checks([check_deltas, check_stale, check_collapsed, check_initial_sync, check_gap_resync,
+                check_gap_persists, check_resync_throttle, check_failing_source, check_rebase])
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Edge cases of the live order gateway (gateway.py, via BitvavoExecutor)
+against the local Bitvavo stand-in (bench/bitvavo_mock.py) with scripted
+faults per POST /order: a 5xx or dropped connection after the order was
+placed is settled by the clientOrderId lookup and never places it twice, a
+5xx before placing is retried, a 429 waits for the reset without tripping
+the breaker, rejections are not retried, and the circuit breaker opens,
+lets exactly one probe through after breaker_reset_s and closes or reopens
+on its outcome.
+
+    python ci/check_gateway.py
+"""
+import asyncio, sys, time
+from contextlib import asynccontextmanager
+from checklib import ROOT, run_checks
+from trading_core.executor import BitvavoExecutor
+from trading_core.gateway import CircuitOpen, GatewayError
+
+sys.path.insert(0, str(ROOT / "bench"))
+from bitvavo_mock import MockBitvavo, serve_mock  # noqa: E402
+
+M = "BTC-EUR"
+
+
+class ScriptedMock(MockBitvavo):
+    """MockBitvavo whose POST /order requests take the next fault from `script` ("ok" = no fault)."""
+
+    def __init__(self, *script: str):
+        super().__init__(secret="secret")
+        self.script = list(script)
+        self.posts = 0
+        self.fail_lookups = False
+
+    def route(self, method, target, headers, body):
+        if method == "GET" and target.startswith("/v2/order") and self.fail_lookups:
+            return 503, {"errorCode": 101, "error": "unknown error"}, {}, False
+        if not (method == "POST" and target.startswith("/v2/order")):
+            return super().route(method, target, headers, body)
+        self.posts += 1
+        fault = self.script.pop(0) if self.script else "ok"
+        if fault == "503":
+            return 503, {"errorCode": 101, "error": "unknown error"}, {}, False
+        if fault == "429":
+            reset = str(int((time.time() + 0.1) * 1000))
+            return 429, {"errorCode": 110, "error": "rate limit exceeded"}, {
+                "Bitvavo-Ratelimit-Remaining": "0", "Bitvavo-Ratelimit-ResetAt": reset}, False
+        if fault == "400":
+            return 400, {"errorCode": 216, "error": "insufficient balance"}, {}, False
+        status, data, extra, drop = super().route(method, target, headers, body)
+        if fault == "503_placed":
+            return 503, {"errorCode": 101, "error": "unknown error"}, extra, False
+        if fault == "drop_placed":
+            return 0, None, {}, True
+        return status, data, extra, drop
+
+
+@asynccontextmanager
+async def executor(mock: MockBitvavo, **cfg):
+    server = await serve_mock(mock, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    ex = BitvavoExecutor({"rest_base": f"http://127.0.0.1:{port}/v2", "api_key": "ci", "api_secret": "secret",
+                          "retries": 2, "breaker_failures": 3, "breaker_reset_s": 0.2, "timeout_s": 2.0, **cfg},
+                         notional_eur=25.0)
+    try:
+        yield ex
+    finally:
+        await ex.close()
+        server.close()
+        await server.wait_closed()
+
+
+async def check_placed():
+    """a signed market buy is placed once and its fill lands in the holdings"""
+    mock = ScriptedMock()
+    async with executor(mock) as ex:
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.ok and res.reason == "filled" and res.filled_size > 0 and res.fee > 0
+        assert mock.stats["orders"] == 1 and mock.stats["bad_signature"] == 0
+        sell = await ex.place_order(M, "sell", 0.0)
+        assert sell.ok and M not in ex.holdings and mock.stats["orders"] == 2
+
+
+async def check_ambiguous_5xx():
+    """a 5xx after the order was placed is settled by the clientOrderId lookup, not a second POST"""
+    mock = ScriptedMock("503_placed")
+    async with executor(mock) as ex:
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.ok and res.filled_size > 0
+        assert mock.stats["orders"] == 1 and mock.posts == 1 and mock.stats["duplicates"] == 0
+
+
+async def check_dropped_connection():
+    """a connection dropped after placing is settled by the lookup as well"""
+    mock = ScriptedMock("drop_placed")
+    async with executor(mock) as ex:
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.ok and mock.stats["orders"] == 1 and mock.posts == 1
+
+
+async def check_5xx_not_placed():
+    """a 5xx before placing: the lookup finds nothing and the retry places the order once"""
+    mock = ScriptedMock("503")
+    async with executor(mock) as ex:
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.ok and mock.stats["orders"] == 1 and mock.posts == 2
+        assert ex.gateway.breaker.failures == 0, "success resets the failure count"
+
+
+async def check_unknown_outcome():
+    """retries exhausted after an ambiguous failure: result `unknown`, nothing booked"""
+    mock = ScriptedMock("503_placed", "503", "503")
+    async with executor(mock) as ex:
+        mock.fail_lookups = True
+        res = await ex.place_order(M, "buy", 0.0)
+        assert not res.ok and res.reason == "unknown" and M not in ex.holdings
+        assert mock.stats["orders"] == 1, "the order exists once on the exchange"
+
+
+async def check_429():
+    """a 429 blocks until ResetAt, is retried under the same clientOrderId and does not trip the breaker"""
+    mock = ScriptedMock("429", "429")
+    async with executor(mock, breaker_failures=1) as ex:
+        t0 = time.monotonic()
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.ok and mock.stats["orders"] == 1 and mock.posts == 3
+        assert time.monotonic() - t0 >= 0.05 and ex.gateway.breaker.state == "closed"
+
+
+async def check_rejected():
+    """a 4xx rejection is not retried, not ambiguous and not a breaker failure"""
+    mock = ScriptedMock("400", "400")
+    async with executor(mock, breaker_failures=1) as ex:
+        res = await ex.place_order(M, "buy", 0.0)
+        assert not res.ok and res.reason == "error_216" and mock.posts == 1 and mock.stats["orders"] == 0
+        assert ex.gateway.breaker.state == "closed"
+        try:
+            await ex.gateway.place_order(M, "buy", amount_quote="10", client_id="x")
+        except GatewayError as e:
+            assert not e.ambiguous and not e.retryable
+        else:
+            raise AssertionError("expected GatewayError")
+
+
+async def check_breaker():
+    """the breaker opens after breaker_failures, admits one probe after breaker_reset_s, then closes"""
+    mock = ScriptedMock(*["503"] * 3)
+    async with executor(mock, retries=0) as ex:
+        gw = ex.gateway
+        for _ in range(3):
+            assert (await ex.place_order(M, "buy", 0.0)).reason == "unknown", "a 5xx may have placed the order"
+        assert gw.breaker.state == "open"
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.reason == "circuit_open" and mock.posts == 3, "an open breaker sends nothing"
+        await asyncio.sleep(0.25)
+        assert gw.breaker.state == "half_open"
+        probe, blocked = await asyncio.gather(ex.place_order(M, "buy", 0.0), ex.place_order("ETH-EUR", "buy", 0.0))
+        assert probe.ok and blocked.reason == "circuit_open", "one probe at a time"
+        assert gw.breaker.state == "closed" and mock.posts == 4
+
+
+async def check_breaker_failed_probe():
+    """a failed probe reopens the breaker for another breaker_reset_s"""
+    mock = ScriptedMock(*["503"] * 4)
+    async with executor(mock, retries=0) as ex:
+        for _ in range(3):
+            await ex.place_order(M, "buy", 0.0)
+        await asyncio.sleep(0.25)
+        assert (await ex.place_order(M, "buy", 0.0)).reason == "unknown"
+        assert ex.gateway.breaker.state == "open"
+        try:
+            await ex.gateway.place_order(M, "buy", amount_quote="10")
+        except CircuitOpen:
+            pass
+        else:
+            raise AssertionError("expected CircuitOpen")
+
+
+async def check_connect_error():
+    """a refused connection never reached the exchange: retried, and not ambiguous when it gives up"""
+    mock = ScriptedMock()
+    async with executor(mock, retries=1) as ex:
+        ex.gateway.client.base_url = "http://127.0.0.1:9/v2"
+        try:
+            await ex.gateway.place_order(M, "buy", amount_quote="10")
+        except GatewayError as e:
+            assert e.status == 0 and not e.ambiguous
+        else:
+            raise AssertionError("expected GatewayError")
+        res = await ex.place_order(M, "buy", 0.0)
+        assert res.reason == "error_0"
+
+
+if __name__ == "__main__":
+    run_checks([check_placed, check_ambiguous_5xx, check_dropped_connection, check_5xx_not_placed,
+                check_unknown_outcome, check_429, check_rejected, check_breaker, check_breaker_failed_probe,
+                check_connect_error])
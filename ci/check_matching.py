@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Edge cases of the paper exchange (matching.py): the taker walk across
+levels and its slippage limit, fees in bps of notional, TP/SL exits from the
+book and from the ticker, partial exits on a thin bid, the maker queue
+(trades at and through our price, pro-rata cancellations, crossing,
+expiry) and PnL net of entry and exit fees.
+
+    python ci/check_matching.py
+"""
+from checklib import close, run_checks
+from trading_core.book import BookManager, OrderBook
+from trading_core.matching import MatchingEngine
+
+M = "BTC-EUR"
+ASKS = [[100.0, 1.0], [100.2, 1.0], [101.0, 10.0]]
+BIDS = [[99.9, 2.0], [99.8, 5.0]]
+
+
+def engine(bids=BIDS, asks=ASKS, **kw):
+    books = BookManager(None)
+    b = books.books[M] = OrderBook(M)
+    b.apply_snapshot(1, bids, asks)
+    kw = {"taker_fee_bps": 25, "maker_fee_bps": 15, "tp_pct": 0.30, "sl_pct": 0.25, "max_slippage_bps": 50,
+          "maker_timeout_s": 30, **kw}
+    return MatchingEngine(books, **kw), b
+
+
+def set_bids(book: OrderBook, levels):
+    """Replace the bid side (next nonce)."""
+    book.apply_update(book.nonce + 1, [[p, 0.0] for p, _ in book.bids.levels()] + levels, [])
+
+
+def check_taker_walk():
+    """taker buy walks the asks at VWAP, pays the taker fee and gets TP/SL from the entry"""
+    eng, _ = engine()
+    f = eng.market_order(M, "buy", 1000, quote=150.0)
+    size = 1.0 + 50.0 / 100.2
+    assert close(f.size, size) and close(f.price, 150.0 / size), (f.size, f.price)
+    assert f.liquidity == "taker" and f.reason == "entry" and close(f.fee, 150.0 * 0.0025)
+    pos = eng.positions[M]
+    assert close(pos.notional, 150.0) and close(pos.fees, 0.375)
+    assert close(pos.tp_price, f.price * 1.003) and close(pos.sl_price, f.price * 0.9975)
+    assert close(eng.fees, 0.375) and eng.realized_pnl == 0.0
+
+
+def check_slippage_limit():
+    """the walk stops max_slippage_bps past the touch: a large order fills partially"""
+    eng, _ = engine()
+    f = eng.market_order(M, "buy", 1000, quote=1000.0)
+    assert close(f.size, 2.0) and close(f.price, 200.2 / 2.0), "101 is past 100 * 1.005"
+    eng, _ = engine(max_slippage_bps=200)
+    assert close(eng.market_order(M, "buy", 1000, quote=1000.0).size, 2.0 + (1000.0 - 200.2) / 101.0)
+
+
+def check_no_liquidity():
+    """no synced book, an empty side or a non-positive price give no fill"""
+    eng, book = engine(asks=[])
+    assert eng.market_order(M, "buy", 1000, quote=100.0) is None
+    assert eng.market_order("ETH-EUR", "buy", 1000, quote=100.0) is None
+    book.synced = False
+    assert eng.market_order(M, "sell", 1000, size=1.0) is None
+    assert eng.fill_at(M, "buy", 1000, 0.0, quote=100.0) is None
+    assert not eng.positions and eng.fees == 0.0
+
+
+def check_take_profit():
+    """a best bid at or above the TP price sells the whole position as taker; PnL is net of both fees"""
+    eng, book = engine()
+    entry = eng.market_order(M, "buy", 1000, quote=150.0)
+    set_bids(book, [[entry.price * 1.0029, 10.0]])
+    assert eng.on_book(M, 2000) == [], "just below TP"
+    set_bids(book, [[100.4, 10.0]])
+    (f,) = eng.on_book(M, 3000)
+    assert f.reason == "tp" and f.side == "sell" and close(f.size, entry.size) and close(f.price, 100.4)
+    exit_fee = 100.4 * entry.size * 0.0025
+    assert close(f.fee, exit_fee) and close(f.pnl, 100.4 * entry.size - exit_fee - 150.0 - 0.375)
+    assert M not in eng.positions and close(eng.realized_pnl, f.pnl) and close(eng.fees, 0.375 + exit_fee)
+
+
+def check_stop_loss():
+    """a best bid at or below the SL price exits with a loss"""
+    eng, book = engine()
+    entry = eng.market_order(M, "buy", 1000, quote=150.0)
+    set_bids(book, [[entry.price * 0.9975, 10.0]])
+    (f,) = eng.on_book(M, 2000)
+    assert f.reason == "sl" and f.pnl < 0 and M not in eng.positions
+
+
+def check_partial_exit():
+    """a thin bid exits partially; the rest keeps its entry price and TP/SL"""
+    eng, book = engine()
+    entry = eng.market_order(M, "buy", 1000, quote=150.0)
+    tp = eng.positions[M].tp_price
+    set_bids(book, [[100.4, 1.0], [99.0, 10.0]])
+    (f,) = eng.on_book(M, 2000)
+    assert close(f.size, 1.0), "99.0 is past the slippage limit"
+    pos = eng.positions[M]
+    assert close(pos.size, entry.size - 1.0) and close(pos.entry_price, entry.price) and close(pos.tp_price, tp)
+    share = 1.0 / entry.size
+    assert close(f.pnl, 100.4 - f.fee - (150.0 + 0.375) * share)
+    assert close(pos.fees, 0.375 * (1 - share))
+
+
+def check_ticker_exits():
+    """without a book, fills happen at the given price and TP/SL follow the ticker bid"""
+    eng = MatchingEngine(None, taker_fee_bps=25, tp_pct=0.30, sl_pct=0.25)
+    f = eng.fill_at(M, "buy", 1000, 50.0, quote=100.0)
+    assert close(f.size, 2.0) and close(f.fee, 0.25)
+    assert eng.on_price(M, 2000, "50.1") == []
+    (x,) = eng.on_price(M, 3000, "50.15")
+    assert x.reason == "tp" and close(x.pnl, 50.15 * 2 * (1 - 0.0025) - 100.25)
+    booked, _ = engine()
+    booked.market_order(M, "buy", 1000, quote=150.0)
+    assert booked.on_price(M, 2000, 1e9) == [], "markets with a book exit from on_book only"
+
+
+def check_maker_queue():
+    """maker buy: queue ahead shrinks with trades at our price, fills past it, trade-through fills the rest"""
+    eng, _ = engine()
+    o = eng.limit_order(M, "buy", 1000, quote=99.9)
+    assert o.price == 99.9 and o.queue_ahead == 2.0 and close(o.size, 1.0)
+    assert eng.on_trade(M, 1100, 99.9, 1.5, "sell") == []
+    assert eng.on_trade(M, 1150, 99.9, 5.0, "buy") == [], "buy aggressors do not hit bids"
+    (f,) = eng.on_trade(M, 1200, 99.9, 0.8, "sell")
+    assert f.liquidity == "maker" and close(f.size, 0.3) and close(f.fee, 99.9 * 0.3 * 0.0015)
+    (g,) = eng.on_trade(M, 1300, 99.8, 0.1, "sell")
+    assert close(g.size, 0.7) and g.price == 99.9 and g.order_id == o.id
+    assert not eng.orders[M] and close(eng.positions[M].size, 1.0)
+
+
+def check_maker_cancels_cross_expiry():
+    """cancellations shrink the queue pro rata, a crossed book fills, unfilled orders expire"""
+    eng, book = engine()
+    o = eng.limit_order(M, "buy", 1000, size=1.0)
+    book.apply_update(book.nonce + 1, [[99.9, 1.0]], [])
+    eng.on_book(M, 1100)
+    assert close(o.queue_ahead, 1.0) and o.level == 1.0
+    book.apply_update(book.nonce + 1, [], [[99.9, 3.0]])
+    (f,) = eng.on_book(M, 1200)
+    assert f.liquidity == "maker" and close(f.size, 1.0) and not eng.orders[M]
+    book.apply_update(book.nonce + 1, [], [[99.9, 0.0]])
+    late = eng.limit_order(M, "buy", 2000, size=1.0)
+    eng.on_book(M, 2000 + 29_999)
+    assert late in eng.orders[M]
+    eng.on_book(M, 2000 + 30_000)
+    assert late not in eng.orders[M] and late.filled == 0.0
+
+
+if __name__ == "__main__":
+    run_checks([check_taker_walk, check_slippage_limit, check_no_liquidity, check_take_profit, check_stop_loss,
+                check_partial_exit, check_ticker_exits, check_maker_queue, check_maker_cancels_cross_expiry])
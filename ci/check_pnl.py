@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Edge cases of the day PnL and pause state machine (pnl.py): realized PnL net
+of entry and exit fees (also on partial sells), marks to mid or last price,
+the UTC day roll (exactly at 00:00, compounding the balance, carrying open
+positions without carrying their PnL), the pause at pause_pct inclusive,
+resume only once the timer has run out and the day is back above the
+threshold, and the guard size factor after a resume.
+
+    python ci/check_pnl.py
+"""
+from checklib import close, run_checks
+from trading_core.pnl import DAY_MS, PAUSED, RUNNING, PnlEngine
+
+M = "BTC-EUR"
+DAY = 20_387 * DAY_MS           # 2025-10-26 00:00 UTC
+MIN = 60_000
+
+
+def engine():
+    return PnlEngine(1000.0, pause_pct=-2.0, pause_minutes=60, guard_minutes=30, guard_size_factor=0.5)
+
+
+def tick(p: PnlEngine, ts: int, bid=None, ask=None, last=None, market=M):
+    evt = {k: v for k, v in (("bestBid", bid), ("bestAsk", ask), ("lastPrice", last)) if v is not None}
+    p.on_ticker(market, ts, evt)
+
+
+def check_realized():
+    """realized PnL is net of entry and exit fees, pro rata on partial sells"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 2.0, 0.5, DAY + 1000)
+    assert close(p.upnl, -0.5) and close(p.day_pnl, -0.5), "a fresh position is down its entry fee"
+    p.on_fill(M, "sell", 101.0, 0.5, 0.1, DAY + 2000)
+    assert close(p.day_realized, 101.0 * 0.5 - 0.1 - 200.5 * 0.25)
+    assert close(p.positions[M].size, 1.5) and close(p.positions[M].cost, 200.5 * 0.75)
+    p.on_fill(M, "sell", 99.0, 5.0, 0.2, DAY + 3000)
+    assert M not in p.positions and close(p.upnl, 0.0), "oversized sells close the position only"
+    assert close(p.day_realized, 101.0 * 0.5 - 0.1 + 99.0 * 1.5 - 0.2 - 200.5)
+    assert close(p.day_fees, 0.8) and p.day_trades == 3
+
+
+def check_marks():
+    """tickers mark to mid, or to the last price without a BBO; other markets are ignored"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 1.0, 0.0, DAY)
+    tick(p, DAY + 1, bid=101.0, ask=103.0)
+    assert close(p.upnl, 2.0)
+    tick(p, DAY + 2, last=99.0)
+    assert close(p.upnl, -1.0)
+    tick(p, DAY + 3, bid=101.0)
+    assert close(p.upnl, -1.0), "half a BBO without a last price is no mark"
+    tick(p, DAY + 4, bid=1.0, ask=1.0, market="ETH-EUR")
+    assert close(p.upnl, -1.0) and "ETH-EUR" not in p.positions
+
+
+def check_day_roll():
+    """at 00:00 UTC the balance compounds by the realized PnL and open positions carry no PnL into the new day"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 1.0, 0.0, DAY + 10 * MIN)
+    p.on_fill(M, "sell", 105.0, 1.0, 0.0, DAY + 20 * MIN)
+    p.on_fill(M, "buy", 100.0, 1.0, 0.0, DAY + 30 * MIN)
+    tick(p, DAY + DAY_MS - 1, last=90.0)
+    assert close(p.day_pnl, 5.0 - 10.0) and p.balance == 1000.0, "still the same day 1 ms before midnight"
+    tick(p, DAY + DAY_MS, last=91.0)
+    assert close(p.balance, 1005.0) and p.day_trades == 0 and p.day_realized == 0.0
+    assert close(p.day_pnl, 1.0), "the first mark after midnight counts in the new day"
+    p.on_fill(M, "sell", 92.0, 1.0, 0.0, DAY + DAY_MS + MIN)
+    assert close(p.day_pnl, 2.0) and M not in p.positions
+
+
+def check_pause():
+    """day PnL at pause_pct of the start-of-day balance pauses entries and sets risk mode halt"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 10.0, 0.0, DAY)
+    tick(p, DAY + 1, last=98.001)
+    assert p.allow_entry(DAY + 1) and p.state == RUNNING, "-1.999% is above the threshold"
+    tick(p, DAY + 2, last=98.0)
+    assert p.state == PAUSED and not p.allow_entry(DAY + 2) and p.pauses == 1, "-2% pauses"
+    assert p.paused_until == DAY + 2 + 60 * MIN and p.risk_mode(DAY + 2) == "halt"
+
+
+def check_resume_and_guard():
+    """resume needs the timer and a recovered day; the guard then halves the size for guard_minutes"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 10.0, 0.0, DAY)
+    tick(p, DAY, last=97.0)
+    t = p.paused_until
+    tick(p, t - 1, last=99.0)
+    assert not p.allow_entry(t - 1), "recovered, but the timer has not run out"
+    tick(p, t, last=97.5)
+    assert not p.allow_entry(t) and p.state == PAUSED, "timer out, but the day is still at -2.5%"
+    tick(p, t + MIN, last=99.0)
+    assert p.allow_entry(t + MIN) and p.pauses == 1
+    assert p.risk_mode(t + MIN) == "cautious" and p.size_factor(t + MIN) == 0.5
+    assert p.size_factor(t + 31 * MIN) == 1.0 and p.risk_mode(t + 31 * MIN) == "normal"
+
+
+def check_pause_across_midnight():
+    """a pause ends after midnight: the new day starts at 0 PnL against the compounded balance"""
+    p = engine()
+    p.on_fill(M, "buy", 100.0, 10.0, 0.0, DAY + DAY_MS - 30 * MIN)
+    p.on_fill(M, "sell", 97.0, 10.0, 0.0, DAY + DAY_MS - 20 * MIN)
+    assert p.state == PAUSED and close(p.day_pnl, -30.0)
+    assert not p.allow_entry(DAY + DAY_MS + 39 * MIN), "the timer still runs after midnight"
+    assert p.allow_entry(DAY + DAY_MS + 40 * MIN) and close(p.balance, 970.0) and p.day_pnl == 0.0
+    p.on_fill(M, "buy", 100.0, 10.0, 0.0, DAY + DAY_MS + 41 * MIN)
+    tick(p, DAY + DAY_MS + 42 * MIN, last=98.1)
+    assert p.state == RUNNING
+    tick(p, DAY + DAY_MS + 43 * MIN, last=98.03)
+    assert p.state == PAUSED and p.pauses == 2, "-19.7 EUR is -1.97% of 1000 but -2.03% of 970"
+
+
+if __name__ == "__main__":
+    run_checks([check_realized, check_marks, check_day_roll, check_pause, check_resume_and_guard,
+                check_pause_across_midnight])
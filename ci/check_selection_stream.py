@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Startup check for market_selection in stream mode: runs `python -m app.main`
+with `runtime.mode: stream` (as systemd does), feeds `ws:ticker` entries
+and waits until a selection is written. Fails when the process exits or
+publishes nothing.
+
+    python ci/check_selection_stream.py [--redis-url redis://127.0.0.1:6379/15]
+
+Without --redis-url a fakeredis stand-in (bench/redis_standin.py) is started.
+"""
+import argparse, json, sys, tempfile, time
+from pathlib import Path
+import orjson
+import redis
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "bench"))
+from run import free_port, spawn, stop, wait_port  # noqa: E402
+
+MARKETS = ["BTC-EUR", "ETH-EUR", "SOL-EUR", "ADA-EUR", "XRP-EUR"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--redis-url")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="selection-stream-"))
+    procs = []
+    ok = False
+    status = "did not start"
+    try:
+        url = args.redis_url
+        if not url:
+            rport = free_port()
+            procs.append(spawn([sys.executable, str(ROOT / "bench/redis_standin.py"), "--port", str(rport)], ROOT,
+                               tmp / "redis.log"))
+            wait_port(rport)
+            url = f"redis://127.0.0.1:{rport}/0"
+
+        cfg = yaml.safe_load((ROOT / "services/market_selection/config/selection.yml").read_text())
+        (tmp / "universe.jsonl").write_text("".join(json.dumps({"market": m}) + "\n" for m in MARKETS))
+        cfg["runtime"].update(mode="stream", metrics_port=free_port())
+        cfg["inputs"]["universe_file"] = str(tmp / "universe.jsonl")
+        cfg["output"].update(selection_file=str(tmp / "selection.json"), redis_dsn=url)
+        cfg["stream"].update(redis_dsn=url, volume_url=None, min_volume_eur=0, min_ticks=1, warmup_s=0,
+                             rank_interval_s=0.2, min_publish_interval_s=0)
+        (tmp / "selection.yml").write_text(yaml.safe_dump(cfg))
+        proc = spawn([sys.executable, "-m", "app.main", "--config", str(tmp / "selection.yml")],
+                     ROOT / "services/market_selection", tmp / "selection.log")
+        procs.append(proc)
+
+        r = redis.from_url(url)
+        deadline = time.monotonic() + args.timeout
+        i = 0
+        while time.monotonic() < deadline and proc.poll() is None:
+            for m in MARKETS:
+                mid = 100.0 + i % 7
+                r.xadd("ws:ticker", {"v": orjson.dumps({"event": "ticker", "market": m, "bestBid": mid - 0.01,
+                                                        "bestAsk": mid + 0.01})})
+            i += 1
+            sel = tmp / "selection.json"
+            if sel.exists():
+                markets = json.loads(sel.read_text()).get("markets") or []
+                ok = bool(markets) and r.get("selection:latest") is not None
+                if ok:
+                    print(f"[OK]   stream mode published {len(markets)} markets: {', '.join(markets)}")
+                    break
+            time.sleep(0.1)
+        status = f"exited with code {proc.returncode}" if proc.poll() is not None else "published nothing"
+    finally:
+        for p in reversed(procs):
+            stop(p)
+    if not ok:
+        print(f"[FAIL] market_selection stream mode {status}; log:")
+        log = tmp / "selection.log"
+        print(log.read_text()[-4000:] if log.exists() else "(no log)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
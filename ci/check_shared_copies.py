@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+The services are deployed self-contained, so modules they share are copied
+into each of them. This check fails when the copies of a module are no
+longer byte-identical (md5), and names the copies that differ.
+
+    python ci/check_shared_copies.py
+"""
+import hashlib, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVICES = ("services/ws_public_ingest/app", "services/trading_core/trading_core", "services/market_selection/app")
+SHARED = ("instrumentation.py", "codec.py", "artifacts.py")
+
+
+def md5(path: Path) -> str:
+    return hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def main():
+    failed = False
+    for name in SHARED:
+        digests = {}
+        for pkg in SERVICES:
+            p = ROOT / pkg / name
+            digests[f"{pkg}/{name}"] = md5(p) if p.exists() else "missing"
+        if len(set(digests.values())) == 1:
+            print(f"[OK]   {name}: {len(digests)} identical copies ({next(iter(digests.values()))})")
+            continue
+        failed = True
+        print(f"[FAIL] {name}: copies differ")
+        for path, digest in digests.items():
+            print(f"         {digest}  {path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Parity check: compute_signal_batch must decide exactly like the scalar
+compute_signal (same side, reason and price) for every snapshot, including
+missing fields, zero sizes and snapshots without a BBO. A second pass feeds
+random book deltas (with nonce gaps and resyncs) and tickers through
+BookManager and the in-place SignalColumns, as the events loop does, and
+compares after every event. Speed is bench/decision.py's job.
+
+    python ci/check_signal_parity.py [--n 30000] [--events 5000] [--seed 1]
+"""
+import argparse, asyncio, math, random, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "trading_core"))
+from trading_core.book import BookManager, OrderBook, StaticBookSource
+from trading_core.decision import compute_signal, compute_signal_batch, columns_from_snapshots, SignalColumns
+
+PARAMS = {"max_spread_bps": 12, "min_book_depth_eur": 200}
+
+EDGE_CASES = {
+    "empty": {},
+    "no_book": {"ticker": {"lastPrice": 100}},
+    "book_none": {"book": None, "ticker": None},
+    "bid_only": {"book": {"bestBid": 100}},
+    "ask_only": {"book": {"bestAsk": 100}},
+    "zero_bid": {"book": {"bestBid": 0, "bestAsk": 100}},
+    "zero_ask": {"book": {"bestBid": 100, "bestAsk": "0"}},
+    "nan_bid": {"book": {"bestBid": float("nan"), "bestAsk": 100}},
+    "garbage_bid": {"book": {"bestBid": "x", "bestAsk": 100}},
+    "alias_keys": {"book": {"bid": "99.99", "ask": "100.01", "bidSizeEur": 500, "askSizeEur": 500}},
+    "short_keys": {"book": {"b": 99.99, "a": 100.01}},
+    "zero_sizes": {"book": {"bestBid": 99.99, "bestAsk": 100.01, "bestBidSizeEur": 0, "bestAskSizeEur": 0}},
+    "zero_bid_size": {"book": {"bestBid": 99.99, "bestAsk": 100.01, "bestBidSizeEur": 0, "bestAskSizeEur": 500}},
+    "missing_sizes": {"book": {"bestBid": 99.99, "bestAsk": 100.01}},
+    "wide_and_thin": {"book": {"bestBid": 90, "bestAsk": 110, "bestBidSizeEur": 1, "bestAskSizeEur": 1}},
+    "crossed": {"book": {"bestBid": 101, "bestAsk": 100}},
+    "zero_last": {"book": {"bestBid": 99.99, "bestAsk": 100.01}, "ticker": {"lastPrice": 0}},
+    "price_alias": {"book": {"bestBid": 99.99, "bestAsk": 100.01}, "ticker": {"price": "100.5"}},
+    "at_max_spread": {"book": {"bestBid": 99.94, "bestAsk": 100.06}},
+    "at_min_depth": {"book": {"bestBid": 99.99, "bestAsk": 100.01, "bestBidSizeEur": 200, "bestAskSizeEur": 200}},
+}
+
+
+def random_snapshot(rnd: random.Random) -> dict:
+    mid = rnd.choice([0.0001, 0.5, 1, 37.5, 100, 64000])
+    spread_bps = rnd.choice([0, 1, 5, 11.99, 12, 12.01, 30, 500])
+    bid, ask = mid * (1 - spread_bps / 20_000), mid * (1 + spread_bps / 20_000)
+    book = {}
+    for keys, value in (("bestBid bid b", bid), ("bestAsk ask a", ask)):
+        r = rnd.random()
+        if r < 0.05:
+            continue                              # missing
+        value = 0 if r < 0.08 else value
+        book[rnd.choice(keys.split())] = str(value) if rnd.random() < 0.3 else value
+    for keys in ("bestBidSizeEur bidSizeEur", "bestAskSizeEur askSizeEur"):
+        r = rnd.random()
+        if r < 0.3:
+            continue
+        book[rnd.choice(keys.split())] = rnd.choice([0, 50, 199.99, 200, 200.01, 1e6])
+    snap = {"book": book if rnd.random() > 0.02 else None}
+    r = rnd.random()
+    if r < 0.6:
+        snap["ticker"] = {rnd.choice(["lastPrice", "price"]): rnd.choice([0, mid, mid * 1.001])}
+    elif r < 0.7:
+        snap["ticker"] = {}
+    return snap
+
+
+def same(a, b) -> bool:
+    if (a.side, a.reason, a.size) != (b.side, b.reason, b.size):
+        return False
+    if a.price is None or b.price is None:
+        return a.price is None and b.price is None
+    return math.isclose(a.price, b.price, rel_tol=1e-12, abs_tol=0.0)
+
+
+class SlowBookSource(StaticBookSource):
+    """Resyncs land a few events later, so decisions also run on unsynced books."""
+
+    def __init__(self, rnd: random.Random):
+        super().__init__()
+        self.rnd = rnd
+
+    async def fetch(self, market: str, depth: int):
+        for _ in range(self.rnd.randint(0, 6)):
+            await asyncio.sleep(0)
+        return await super().fetch(market, depth)
+
+
+async def event_parity(n_events: int, rnd: random.Random) -> int:
+    """Mirror of trading_core.main's ws:book / ws:ticker handling; returns the number of mismatches."""
+    markets = [f"E{i}-EUR" for i in range(6)]
+    truth = {m: OrderBook(m, 100) for m in markets}       # the exchange's book, incl. deltas we "lose"
+    source = SlowBookSource(rnd)
+    columns = SignalColumns(capacity=2)                  # small, so growing the columns is exercised
+    books = BookManager(source, depth=100, levels=10, min_resync_interval_s=0.0,
+                        on_resync=lambda m: columns.set_book(m, books.view(m)))
+    tickers = {}
+    nonce = dict.fromkeys(markets, 0)
+    for m in markets:
+        truth[m].apply_snapshot(0, [[99.99, 3]], [[100.01, 3]])
+    bad = 0
+    for i in range(n_events):
+        m = rnd.choice(markets)
+        if rnd.random() < 0.3:
+            tickers[m] = {"market": m, "lastPrice": rnd.choice(["100.2", 0, None, "x"])}
+            columns.set_ticker(m, tickers[m])
+        else:
+            nonce[m] += 1
+            side = [[round(100 + rnd.choice([-1, 1]) * rnd.randint(1, 8) * 0.01, 2),
+                     rnd.choice([0, 0, 0.5, 2, 3, 40])] for _ in range(rnd.randint(1, 3))]
+            evt = {"market": m, "nonce": nonce[m], "bids": [l for l in side if l[0] < 100],
+                   "asks": [l for l in side if l[0] > 100]}
+            truth[m].apply_update(nonce[m], evt["bids"], evt["asks"])
+            b = truth[m]
+            source.books[m] = (b.nonce, b.bids.levels(), b.asks.levels())
+            if rnd.random() < 0.03:
+                continue                                 # dropped delta: the next one has a nonce gap
+            if not books.on_event(evt):
+                if books.get(m) is None:
+                    columns.set_book(m, None)
+            else:
+                columns.set_book(m, books.view(m))
+        await asyncio.sleep(0)                           # let a resync task run
+        batch = compute_signal_batch(columns.select(markets), PARAMS).decisions()
+        for mk, b in zip(markets, batch):
+            snapshot = {"ticker": tickers.get(mk)}
+            view = books.view(mk)
+            if view is not None:
+                snapshot["book"] = view
+            s = compute_signal(mk, snapshot, PARAMS)
+            if not same(s, b):
+                bad += 1
+                if bad <= 20:
+                    print(f"[FAIL] event {i} {mk}: scalar={s} columns={b} snapshot={snapshot}")
+    await books.close()
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=30_000)
+    ap.add_argument("--events", type=int, default=5_000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    snapshots = dict(EDGE_CASES)
+    for i in range(args.n):
+        snapshots[f"R{i}"] = random_snapshot(rnd)
+    markets = list(snapshots)
+
+    batch = compute_signal_batch(columns_from_snapshots(markets, snapshots), PARAMS).decisions()
+    bad = 0
+    for m, b in zip(markets, batch):
+        s = compute_signal(m, snapshots[m], PARAMS)
+        if not same(s, b):
+            bad += 1
+            if bad <= 20:
+                print(f"[FAIL] {m}: scalar={s} batch={b} snapshot={snapshots[m]}")
+    reasons = sorted({d.reason for d in batch})
+    if bad:
+        print(f"[FAIL] {bad} of {len(markets)} decisions differ")
+        sys.exit(1)
+    print(f"[OK]   compute_signal_batch == compute_signal on {len(markets)} snapshots ({', '.join(reasons)})")
+
+    bad = asyncio.run(event_parity(args.events, rnd))
+    if bad:
+        print(f"[FAIL] {bad} decisions from SignalColumns differ over {args.events} events")
+        sys.exit(1)
+    print(f"[OK]   SignalColumns kept in place == compute_signal over {args.events} book/ticker events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Round trips of the warm-restart snapshots (state.py): pack/unpack of nested
+values and arrays, feature windows restored oldest first (also into a
+smaller capacity after a config change), and a full restart of the decision
+state (feature windows, day PnL in a pause, paper positions, cooldowns)
+through a StateStore file and Redis key, after which the restored
+components must export the same state and answer the same on the next
+events. Also checks that unreadable or older snapshots lose against the
+newest readable one.
+
+    python ci/check_state.py
+"""
+import math, random, tempfile
+from array import array
+from pathlib import Path
+from checklib import close, run_checks
+from trading_core.book import BookManager, OrderBook
+from trading_core.cooldown import Cooldown
+from trading_core.features import FeatureEngine, RollingWindow
+from trading_core.matching import MatchingEngine
+from trading_core.pnl import PAUSED, PnlEngine
+from trading_core.state import StateStore, pack, unpack
+
+MARKETS = ["BTC-EUR", "ETH-EUR", "SOL-EUR"]
+T0 = 1_761_436_800_000
+
+
+class FakeRedis:
+    """The two calls StateStore makes on its raw-bytes client."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+    async def get(self, key):
+        return self.data.get(key)
+
+
+def same(a, b, path="state") -> None:
+    """Deep equality; floats to 1e-9 (windows re-anchor their sums on restore), arrays by value."""
+    if isinstance(a, array) or isinstance(b, array):
+        assert isinstance(a, array) and isinstance(b, array) and a.typecode == b.typecode, path
+        same(list(a), list(b), path)
+    elif isinstance(a, dict):
+        assert isinstance(b, dict) and a.keys() == b.keys(), f"{path}: keys {sorted(a)} != {sorted(b)}"
+        for k in a:
+            same(a[k], b[k], f"{path}.{k}")
+    elif isinstance(a, (list, tuple)):
+        assert isinstance(b, (list, tuple)) and len(a) == len(b), f"{path}: length"
+        for i, (x, y) in enumerate(zip(a, b)):
+            same(x, y, f"{path}[{i}]")
+    elif isinstance(a, float) and isinstance(b, float):
+        assert (math.isnan(a) and math.isnan(b)) or close(a, b), f"{path}: {a} != {b}"
+    else:
+        assert a == b, f"{path}: {a!r} != {b!r}"
+
+
+def check_pack_values():
+    """pack/unpack keeps nested values, arrays of each typecode and their bytes exactly"""
+    obj = {"ts": T0, "none": None, "flag": True, "s": "€ markt", "f": [0.1, -0.0, 1e308, float("nan")],
+           "big": 2 ** 62, "nested": {"a": [array("d", [1.5, -2.25, 1 / 3]), array("q", [T0, -1]), array("d")],
+                                      "t": (1, 2)},
+           "win": {"ts": array("q", range(1000)), "vals": array("d", (random.random() for _ in range(3000)))}}
+    back = unpack(pack(obj))
+    assert back["nested"]["t"] == [1, 2], "tuples come back as lists"
+    back["nested"]["t"] = (1, 2)
+    same(obj, back)
+    assert back["win"]["vals"].tobytes() == obj["win"]["vals"].tobytes(), "array bytes are copied as is"
+    assert unpack(pack({})) == {} and unpack(pack([])) == []
+
+
+def check_pack_rejects():
+    """foreign or truncated data is rejected, not misread"""
+    data = pack({"a": array("d", [1.0, 2.0])})
+    for bad in (b"{}" + data[2:], data[:2] + bytes([99]) + data[3:]):
+        try:
+            unpack(bad)
+        except ValueError:
+            continue
+        raise AssertionError("foreign magic/version accepted")
+    try:
+        unpack(data[:-4])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("truncated array accepted")
+
+
+def check_window_restore():
+    """a wrapped window restores oldest first; a smaller capacity keeps the newest entries and exact moments"""
+    w = RollingWindow(10**9, 8, width=2)
+    for i in range(13):
+        w.push(T0 + i, float(i), float(i * i))
+    snap = unpack(pack(w.export()))
+    assert list(snap["ts"]) == [T0 + i for i in range(5, 13)], "export unwraps the ring"
+    small = RollingWindow(10**9, 3, width=2)
+    small.restore(snap)
+    assert len(small) == 3 and list(small.export()["ts"]) == [T0 + 10, T0 + 11, T0 + 12]
+    assert close(small.mean(0), 11.0) and close(small.mean(1), (100 + 121 + 144) / 3)
+    assert close(small.std(0), (2 / 3) ** 0.5)
+
+
+def build(rnd: random.Random):
+    """Decision state after a few hundred random events: features, paper engine with positions, PnL in a pause."""
+    features = FeatureEngine({})
+    books = BookManager(None)
+    engine = MatchingEngine(books, tp_pct=5.0, sl_pct=5.0)
+    pnl = PnlEngine(1000.0, pause_pct=-2.0, pause_minutes=60)
+    cooldown = Cooldown(120)
+    mids = {m: rnd.choice([1.0, 100.0, 64000.0]) for m in MARKETS}
+    for m in MARKETS:
+        books.books[m] = OrderBook(m)
+        books.books[m].apply_snapshot(1, [[mids[m] * 0.999, 10.0]], [[mids[m] * 1.001, 10.0]])
+    for i in range(600):
+        m, ts = rnd.choice(MARKETS), T0 + i * 500
+        mids[m] *= 1 + rnd.gauss(0, 0.001)
+        bid, ask = mids[m] * 0.9995, mids[m] * 1.0005
+        features.on_ticker(m, ts, {"bestBid": bid, "bestAsk": ask, "bestBidSize": 3.0, "bestAskSize": 2.0})
+        features.on_trade(m, ts, mids[m], rnd.uniform(0.1, 2), rnd.choice(("buy", "sell")))
+        pnl.on_ticker(m, ts, {"bestBid": bid, "bestAsk": ask})
+    for m in MARKETS[:2]:
+        f = engine.market_order(m, "buy", T0 + 300_000, quote=400.0)
+        pnl.on_fill(m, "buy", f.price, f.size, f.fee, f.ts)
+        cooldown.set(m, now=(T0 + 300_000) / 1000)
+    pnl.on_ticker(MARKETS[0], T0 + 301_000, {"lastPrice": engine.positions[MARKETS[0]].entry_price * 0.9})
+    assert pnl.state == PAUSED
+    return features, engine, pnl, cooldown
+
+
+def export(features, engine, pnl, cooldown, ts):
+    return {"ts": ts, "features": features.export(), "executor": engine.export(), "pnl": pnl.export(),
+            "cooldowns": dict(cooldown._last)}
+
+
+async def check_restart():
+    """a restart through file and Redis restores features, positions, PnL pause and cooldowns exactly"""
+    rnd = random.Random(7)
+    features, engine, pnl, cooldown = build(rnd)
+    state = export(features, engine, pnl, cooldown, T0 + 302_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        redis = FakeRedis()
+        store = StateStore(str(Path(tmp) / "sub" / "state.bin"), redis, "trading_core:state")
+        size = await store.save(state)
+        assert size == len(redis.data["trading_core:state"]) == (Path(tmp) / "sub" / "state.bin").stat().st_size
+        assert not list(Path(tmp).glob("sub/*.tmp")), "temp file renamed into place"
+        snap = await StateStore(str(Path(tmp) / "sub" / "state.bin")).load()
+    same(state, snap)
+
+    f2, e2, p2, c2 = FeatureEngine({}), MatchingEngine(engine.books, tp_pct=5.0, sl_pct=5.0), \
+        PnlEngine(1000.0, pause_pct=-2.0, pause_minutes=60), Cooldown(120)
+    f2.restore(snap["features"])
+    e2.restore(snap["executor"])
+    p2.restore(snap["pnl"])
+    c2.restore(snap["cooldowns"])
+    same(state, export(f2, e2, p2, c2, state["ts"]))
+    assert p2.state == PAUSED and not p2.allow_entry(T0 + 303_000)
+    assert c2.hit(MARKETS[0], now=(T0 + 303_000) / 1000) and not c2.hit(MARKETS[2], now=(T0 + 303_000) / 1000)
+
+    # both copies must answer the same on what comes next
+    for i in range(200):
+        m, ts = rnd.choice(MARKETS), T0 + 303_000 + i * 500
+        evt = {"bestBid": 99.0 + i % 7, "bestAsk": 99.1 + i % 7, "bestBidSize": 1.0, "bestAskSize": 1.0}
+        for fe, pe in ((features, pnl), (f2, p2)):
+            fe.on_ticker(m, ts, evt)
+            fe.on_trade(m, ts, 99.05, 0.5, "buy")
+            pe.on_ticker(m, ts, evt)
+        for m2 in MARKETS:
+            same(features.snapshot(m2, ts), f2.snapshot(m2, ts), f"features[{m2}]@{i}")
+        assert close(pnl.day_pnl, p2.day_pnl) and pnl.state == p2.state
+
+
+async def check_newest_wins():
+    """load takes the newest readable snapshot; a corrupt file falls back to Redis"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "state.bin"
+        redis = FakeRedis()
+        store = StateStore(str(path), redis)
+        await StateStore(str(path)).save({"ts": T0 + 2, "src": "file"})
+        await StateStore(None, redis).save({"ts": T0 + 1, "src": "redis"})
+        assert (await store.load())["src"] == "file"
+        await StateStore(None, redis).save({"ts": T0 + 3, "src": "redis"})
+        assert (await store.load())["src"] == "redis"
+        path.write_bytes(b"garbage")
+        await StateStore(None, redis).save({"ts": T0, "src": "redis"})
+        assert (await store.load())["src"] == "redis", "an unreadable file is skipped"
+        redis.data.clear()
+        assert await store.load() is None
+        assert await StateStore(str(Path(tmp) / "missing.bin")).load() is None
+
+
+if __name__ == "__main__":
+    run_checks([check_pack_values, check_pack_rejects, check_window_restore, check_restart, check_newest_wins])
@@ -0,0 +1,42 @@
+"""
+Runner for the focused ci/check_*.py scripts on trading_core's money paths.
+
+A check is a plain or async function that raises (usually AssertionError)
+on failure; its docstring's first line is the name printed in the
+`[OK]` / `[FAIL]` lines. `run_checks` runs them all and exits 1 if any
+failed. Importing this module puts services/trading_core on sys.path and
+silences module logging up to ERROR.
+"""
+import asyncio, inspect, logging, math, sys, traceback
+from pathlib import Path
+from typing import Callable, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services" / "trading_core"))
+# the checks provoke the failures the modules log (resync errors, rejected orders)
+logging.disable(logging.ERROR)
+
+
+def close(a, b, tol: float = 1e-9) -> bool:
+    return a is not None and b is not None and math.isclose(a, b, rel_tol=tol, abs_tol=tol)
+
+
+def run_checks(checks: Sequence[Callable]):
+    failed = 0
+    for fn in checks:
+        name = (fn.__doc__ or fn.__name__).strip().splitlines()[0]
+        try:
+            if inspect.iscoroutinefunction(fn):
+                asyncio.run(fn())
+            else:
+                fn()
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {name}: {type(e).__name__}: {e}")
+            if not isinstance(e, AssertionError):
+                traceback.print_exc()
+            continue
+        print(f"[OK]   {name}")
+    if failed:
+        print(f"{failed} of {len(checks)} checks failed")
+        sys.exit(1)
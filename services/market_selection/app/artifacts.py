@@ -0,0 +1,178 @@
+"""
+Cached loaders for the shared config artifacts: the selection file
+(selection.latest.json, written by market_selection) and the universe
+(JSONL or one market per line).
+
+The services are self-contained, so each keeps a copy of this module
+(ws_public_ingest/app, trading_core/trading_core, market_selection/app);
+`make ci` (ci/check_shared_copies.py) fails when they differ.
+
+- `CachedFile` re-parses a file only when its (inode, mtime, size) changes,
+  so polling it costs one stat() instead of open + parse. An atomic
+  os.replace gives a new inode, so rewrites are never missed.
+- market_selection also publishes each new selection to Redis: the key
+  `selection:latest` and the pubsub channel `selection:updates` carry
+  {"version", "ts", "markets"}, with `version` from INCR `selection:version`.
+- `SelectionWatcher` (asyncio consumers) follows the file and the Redis
+  channel; whichever update is newer wins, so a stale key never overrides
+  a newer file and vice versa.
+"""
+import asyncio, json, logging, os, time
+from typing import Any, Callable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+SELECTION_KEY = "selection:latest"
+SELECTION_CHANNEL = "selection:updates"
+SELECTION_VERSION_KEY = "selection:version"
+
+
+def parse_selection(data: bytes) -> List[str]:
+    """{"markets": [...]} (or "symbols"), or a plain list of names / {"market": ...} objects."""
+    obj = json.loads(data) if data.strip() else []
+    if isinstance(obj, dict):
+        obj = obj.get("markets") or obj.get("symbols") or []
+    out = []
+    for m in obj if isinstance(obj, list) else []:
+        m = m if isinstance(m, str) else (m.get("market") if isinstance(m, dict) else None)
+        if m:
+            out.append(m)
+    return out
+
+
+def parse_universe(data: bytes) -> List[str]:
+    """JSONL with symbol/market/pair, or one market per line."""
+    out = []
+    for line in data.decode().splitlines():
+        s = line.strip()
+        if not s:
+            continue
+        if s.startswith("{"):
+            try:
+                obj = json.loads(s)
+            except ValueError:
+                continue
+            sym = obj.get("symbol") or obj.get("market") or obj.get("pair")
+            if sym:
+                out.append(sym)
+        else:
+            out.append(s)
+    return out
+
+
+def selection_message(version: int, markets: List[str], ts_ms: Optional[int] = None) -> bytes:
+    ts_ms = int(time.time() * 1000) if ts_ms is None else ts_ms
+    return json.dumps({"version": version, "ts": ts_ms, "markets": list(markets)}, separators=(",", ":")).encode()
+
+
+def parse_selection_message(data) -> Tuple[int, int, List[str]]:
+    """-> (version, ts_ms, markets)"""
+    obj = json.loads(data)
+    return int(obj["version"]), int(obj.get("ts") or 0), [m for m in obj.get("markets") or [] if m]
+
+
+class CachedFile:
+    """Parsed contents of `path`, re-read only when the file changes. Missing file -> `default`."""
+
+    def __init__(self, path: str, parse: Callable[[bytes], Any], default: Any = None):
+        self.path = path
+        self.parse = parse
+        self.default = default
+        self.value = default
+        self.version = 0    # bumped on every reload
+        self.mtime_ms = 0
+        self._key: Optional[Tuple[int, int, int]] = None
+
+    def get(self) -> Any:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._key is not None:
+                self._key, self.value, self.mtime_ms = None, self.default, 0
+                self.version += 1
+            return self.value
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._key:
+            return self.value
+        self._key = key
+        try:
+            with open(self.path, "rb") as f:
+                self.value = self.parse(f.read())
+        except (OSError, ValueError) as e:
+            # keep the previous value; the next change is picked up again
+            log.warning("could not parse %s: %s", self.path, e)
+            return self.value
+        self.mtime_ms = st.st_mtime_ns // 1_000_000
+        self.version += 1
+        return self.value
+
+
+class SelectionWatcher:
+    """
+    Current selection from the file (stat'ed at most every `check_interval_s`)
+    and, when `listen` runs, from the Redis key + pubsub channel. `changed` is
+    set on every update so callers can wake up immediately.
+    """
+
+    def __init__(self, path: str, check_interval_s: float = 0.5):
+        self.file = CachedFile(path, parse_selection, [])
+        self.check_interval = float(check_interval_s)
+        self.markets: List[str] = []
+        self.version: Optional[int] = None   # Redis version of the current selection, if it came from Redis
+        self.changed = asyncio.Event()
+        self._ts = -1
+        self._file_version = -1
+        self._next_check = 0.0
+
+    def _apply(self, markets: List[str], ts_ms: int, version: Optional[int]) -> bool:
+        if ts_ms < self._ts:
+            return False
+        self._ts = ts_ms
+        self.version = version
+        if markets != self.markets:
+            self.markets = markets
+            self.changed.set()
+        return True
+
+    def get(self) -> List[str]:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            markets = self.file.get()
+            if self.file.version != self._file_version:
+                self._file_version = self.file.version
+                self._apply(markets, self.file.mtime_ms, None)
+        return self.markets
+
+    def on_message(self, data) -> bool:
+        try:
+            version, ts_ms, markets = parse_selection_message(data)
+        except (ValueError, KeyError, TypeError):
+            log.warning("ignoring malformed selection message")
+            return False
+        if self.version is not None and version <= self.version:
+            return False
+        return self._apply(markets, ts_ms, version)
+
+    async def listen(self, r, retry_s: float = 5.0):
+        """Follow SELECTION_CHANNEL on a redis.asyncio client (seeded from SELECTION_KEY); reconnects on errors."""
+        while True:
+            pubsub = r.pubsub()
+            try:
+                await pubsub.subscribe(SELECTION_CHANNEL)
+                current = await r.get(SELECTION_KEY)  # after subscribing, so no update falls in between
+                if current:
+                    self.on_message(current)
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "message":
+                        self.on_message(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("selection channel: %s; retrying in %.0fs", e, retry_s)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(retry_s)
@@ -1,9 +1,14 @@
-import os, time, logging, argparse, json, orjson
+import os, time, logging, argparse
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
 import yaml
 import pyarrow.parquet as pq
-from prometheus_client import start_http_server, Counter, Gauge
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from prometheus_client import Counter, Gauge, Histogram
+from .part_index import PartIndex
+from .instrumentation import Instrumentation
+from .selection_core import (run_success, markets_considered, markets_eligible, read_universe, finalize_selection,
+                             write_selection, SelectionPublisher, make_publisher)
 
 def last_scalar(tbl, name):
     try:
@@ -16,7 +21,7 @@ def last_scalar(tbl, name):
         if n == 0 or (hasattr(ch,'null_count') and ch.null_count == n):
             continue
         for i in range(n-1, -1, -1):
-            if not ch.is_null(i):
+            if ch[i].is_valid:
                 try:
                     return ch[i].as_py()
                 except Exception:
@@ -26,106 +31,121 @@ def last_scalar(tbl, name):
     except Exception:
         return None
 
-run_success = Counter("selection_run_success_total","Successful selection runs")
-markets_considered = Gauge("selection_markets_considered","Markets considered this run")
-markets_eligible = Gauge("selection_markets_eligible","Markets eligible after filters")
-selection_size_g = Gauge("selection_size","Final selection size")
+TYPED_SCHEMA_KEY = b"tradingbot.schema"
+
+stage_seconds = Gauge("selection_stage_seconds","Duration of the last run per stage",["stage"])
+run_seconds = Histogram("selection_run_seconds","Total duration of a selection run",
+                        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+index_new_parts = Counter("selection_index_new_parts_total","Parquet parts newly added to the index")
 
 def load_yaml(p: str) -> Dict:
     with open(p,"r") as f:
         return yaml.safe_load(f)
 
-def read_universe(path: str) -> List[str]:
-    out = []
-    p = Path(path)
-    if not p.exists():
-        return out
-    with p.open("r") as f:
-        for line in f:
-            s = line.strip()
-            if not s: continue
-            if s.startswith("{"):
-                try:
-                    obj = orjson.loads(s)
-                    sym = obj.get("symbol") or obj.get("market") or obj.get("pair")
-                    if sym: out.append(sym)
-                except Exception:
-                    pass
-            else:
-                out.append(s)
-    return out
-
-def latest_market_paths(root: Path, market: str, max_files: int):
-    if not root.exists():
-        return []
-    paths = list(root.glob(f"date=*/market={market}/part-*.parquet"))
-    paths.sort(key=lambda p: p.stat().st_mtime, reverse=True)  # newest → oldest
-    return paths[:max_files]
-
-
-
+def _read_legacy(pth):
+    """Oude parts (schema per event afgeleid): lees met de bekende fallbacks."""
+    import pyarrow as pa
+    try:
+        return pq.read_table(pth)
+    except Exception:
+        pass
+    # dictionary-encoded 'market' kolom fix
+    try:
+        pf = pq.ParquetFile(pth)
+        tbls = [pf.read_row_group(i).replace_schema_metadata({}) for i in range(pf.num_row_groups)]
+        return pa.concat_tables(tbls, promote=True)
+    except Exception:
+        pass
+    # fallback: forceer type casting voor 'market' als die bestaat
+    try:
+        tbl = pq.read_table(pth, columns=None)
+        if 'market' in tbl.column_names:
+            tbl = tbl.set_column(tbl.column_names.index('market'), 'market', tbl['market'].cast(pa.string()))
+        return tbl
+    except Exception:
+        return None
 
+def _to_float(x):
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
 
-def scan_market(paths):
+def scan_part(pth):
     """
-    Lees elk Parquet-part afzonderlijk, converteer dictionary<str> naar str
-    en tel total_rows correct door.
+    Stats van één part: rows, last_bid, last_ask (laatste niet-null waarde),
+    min_ts/max_ts. None als het bestand onleesbaar is.
     """
-    import pyarrow as pa, pyarrow.parquet as pq
+    try:
+        pf = pq.ParquetFile(pth)
+        typed = (pf.schema_arrow.metadata or {}).get(TYPED_SCHEMA_KEY, b"").startswith(b"tickers/")
+    except Exception:
+        return None
+    if typed:
+        # getypeerde parts (ingest schema tickers/v1): rows en ts uit de footer, één projectie
+        tbl = pf.read(columns=["bestBid", "bestAsk"])
+        md = pf.metadata
+        lo = hi = None
+        ts_idx = pf.schema_arrow.get_field_index("ts")
+        for rg in range(md.num_row_groups):
+            st = md.row_group(rg).column(ts_idx).statistics
+            if st is not None and st.has_min_max:
+                lo = st.min if lo is None else min(lo, st.min)
+                hi = st.max if hi is None else max(hi, st.max)
+        return {"rows": md.num_rows, "last_bid": last_scalar(tbl, "bestBid"),
+                "last_ask": last_scalar(tbl, "bestAsk"), "min_ts": lo, "max_ts": hi}
+    tbl = _read_legacy(pth)
+    if tbl is None:
+        return None
+    cols = set(tbl.column_names)
+    bid = next((last_scalar(tbl, c) for c in ["bestBid","bid","lastBid","best_bid"] if c in cols), None)
+    ask = next((last_scalar(tbl, c) for c in ["bestAsk","ask","lastAsk","best_ask"] if c in cols), None)
+    return {"rows": tbl.num_rows, "last_bid": _to_float(bid), "last_ask": _to_float(ask),
+            "min_ts": None, "max_ts": None}
+
+def combine_stats(parts):
+    """Combineer part-stats (newest → oldest) tot markt-stats; de nieuwste bid/ask wint."""
     total_rows = 0
     last_bid = None
     last_ask = None
-    has_bid = False
-    has_ask = False
-    for pth in paths:
-        try:
-            tbl = pq.read_table(pth)
-        except Exception as e:
-            # dictionary-encoded 'market' kolom fix
-            try:
-                pf = pq.ParquetFile(pth)
-                tbls = [pf.read_row_group(i).replace_schema_metadata({}) for i in range(pf.num_row_groups)]
-                tbl = pa.concat_tables(tbls, promote=True)
-            except Exception:
-                # fallback: forceer type casting voor 'market' als die bestaat
-                try:
-                    tbl = pq.read_table(pth, columns=None)
-                    if 'market' in tbl.column_names:
-                        tbl = tbl.set_column(tbl.column_names.index('market'),
-                                             'market',
-                                             tbl['market'].cast(pa.string()))
-                except Exception:
-                    continue
-        total_rows += tbl.num_rows
-        cols = set(tbl.column_names)
-        for c in ["bestBid","bid","lastBid","best_bid"]:
-            if c in cols:
-                last_bid = tbl[c][-1].as_py()
-                has_bid = True
-                break
-        for c in ["bestAsk","ask","lastAsk","best_ask"]:
-            if c in cols:
-                last_ask = tbl[c][-1].as_py()
-                has_ask = True
-                break
+    for st in parts:
+        if st is None:
+            continue
+        total_rows += st["rows"]
+        if last_bid is None and st.get("last_bid") is not None:
+            last_bid = st["last_bid"]
+        if last_ask is None and st.get("last_ask") is not None:
+            last_ask = st["last_ask"]
+    has_bid = last_bid is not None
+    has_ask = last_ask is not None
     spread_bps = None
     if has_bid and has_ask:
-        try:
-            bid = float(last_bid); ask = float(last_ask)
-            mid = (bid + ask)/2 if (bid != 0 and ask != 0) else None
-            if mid:
-                spread_bps = (ask - bid)/mid * 10000.0
-        except Exception:
-            pass
+        mid = (last_bid + last_ask)/2 if (last_bid != 0 and last_ask != 0) else None
+        if mid:
+            spread_bps = (last_ask - last_bid)/mid * 10000.0
     return {"rows": total_rows, "has_bid": has_bid, "has_ask": has_ask, "spread_bps": spread_bps}
 
-def choose_markets(universe, tick_root: Path, cfg: Dict):
+def make_pool(cfg: Dict):
+    """Pool voor scan_part; None (serieel) bij scan_workers <= 1."""
+    rt = cfg["runtime"]
+    n = int(rt.get("scan_workers", os.cpu_count() or 1))
+    if n <= 1:
+        return None
+    if rt.get("scan_pool", "process") == "thread":
+        return ThreadPoolExecutor(max_workers=n)
+    return ProcessPoolExecutor(max_workers=n)
+
+def scan_many(paths, pool=None, chunksize: int = 16):
+    """scan_part over alle paden; volgorde van de resultaten = volgorde van paths."""
+    if pool is None or len(paths) < 2:
+        return [scan_part(p) for p in paths]
+    return list(pool.map(scan_part, paths, chunksize=chunksize))
+
+def choose_markets(universe, index: PartIndex, cfg: Dict):
     max_files = int(cfg["inputs"]["max_files_per_market"])
     min_rows = int(cfg["inputs"]["min_rows_per_market"])
     max_spread = float(cfg["selection"]["max_spread_bps"])
-    target = int(cfg["selection"]["target_size"])
     require_ba = bool(cfg["selection"]["require_bid_ask"])
-    always = list(cfg["selection"]["always_include"] or [])
     exclude = set(cfg["selection"]["exclude_markets"] or [])
 
     considered = 0
@@ -133,11 +153,11 @@ def choose_markets(universe, tick_root: Path, cfg: Dict):
     for m in universe:
         if m in exclude:
             continue
-        paths = latest_market_paths(tick_root, m, max_files)
-        if not paths:
+        parts = index.latest(m, max_files)
+        if not parts:
             continue
         considered += 1
-        stat = scan_market(paths)
+        stat = combine_stats(parts)
         if stat["rows"] < min_rows:
             continue
         if require_ba and not (stat["has_bid"] and stat["has_ask"]):
@@ -149,34 +169,39 @@ def choose_markets(universe, tick_root: Path, cfg: Dict):
     markets_considered.set(considered)
     markets_eligible.set(len(scored))
     scored.sort(key=lambda x: (x[0], x[1]))
-    sel = [m for _,__,m in scored]
-
-    out = []
-    for a in always:
-        if a in universe and a not in out:
-            out.append(a)
-    for m in sel:
-        if m not in out:
-            out.append(m)
-        if len(out) >= target:
-            break
-    selection_size_g.set(len(out))
-    return out
-
-def write_selection(path: str, markets: List[str]):
-    data = {"markets": markets}
-    tmp = path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, separators=(",",":"))
-    os.replace(tmp, path)
-
-def run_once(cfg: Dict):
+    return finalize_selection(universe, [m for _,__,m in scored], cfg)
+
+def index_path(cfg: Dict) -> str:
+    tick_root = Path(cfg["inputs"]["parquet_tickers_root"])
+    return cfg["inputs"].get("index_file") or str(tick_root.parent / ".selection_index.sqlite")
+
+def run_once(cfg: Dict, index: PartIndex = None, pool=None, publisher: SelectionPublisher = None):
+    t0 = time.perf_counter()
     uni = read_universe(cfg["inputs"]["universe_file"])
     tick_root = Path(cfg["inputs"]["parquet_tickers_root"])
-    sel = choose_markets(uni, tick_root, cfg)
+    t1 = time.perf_counter()
+    own = index is None
+    if own:
+        index = PartIndex(index_path(cfg))
+    try:
+        new_parts = index.refresh(tick_root, lambda paths: scan_many(paths, pool))
+        index_new_parts.inc(new_parts)
+        t2 = time.perf_counter()
+        sel = choose_markets(uni, index, cfg)
+    finally:
+        if own:
+            index.close()
+    t3 = time.perf_counter()
     write_selection(cfg["output"]["selection_file"], sel)
+    if publisher is not None:
+        publisher.publish(sel)
+    t4 = time.perf_counter()
+    for stage, dt in (("universe", t1 - t0), ("scan", t2 - t1), ("rank", t3 - t2), ("write", t4 - t3)):
+        stage_seconds.labels(stage).set(dt)
+    run_seconds.observe(t4 - t0)
     run_success.inc()
-    logging.info("selection written size=%d file=%s", len(sel), cfg["output"]["selection_file"])
+    logging.info("selection written size=%d file=%s new_parts=%d took=%.3fs (scan=%.3fs)",
+                 len(sel), cfg["output"]["selection_file"], new_parts, t4 - t0, t2 - t1)
 
 def main():
     import argparse
@@ -186,11 +211,20 @@ def main():
     cfg = load_yaml(args.config)
     logging.basicConfig(level=getattr(logging, cfg["runtime"]["log_level"].upper(), logging.INFO),
                         format='%(asctime)s %(levelname)s %(message)s')
-    start_http_server(int(cfg["runtime"]["metrics_port"]))
+    instr = Instrumentation("selection", cfg.get("instrumentation"))
+    instr.start_http_server(int(cfg["runtime"]["metrics_port"]))
+    instr.install()
+    if cfg["runtime"].get("mode", "batch") == "stream":
+        from .stream import run_stream
+        run_stream(cfg, make_publisher(cfg))
+        return
     interval = int(cfg["runtime"]["interval_seconds"])
+    index = PartIndex(index_path(cfg))
+    pool = make_pool(cfg)
+    publisher = make_publisher(cfg)
     while True:
         try:
-            run_once(cfg)
+            run_once(cfg, index, pool, publisher)
         except Exception:
             logging.exception("selection run failed")
         time.sleep(interval)
@@ -0,0 +1,117 @@
+"""
+Persistente index van ticker Parquet-parts (sqlite).
+
+Per part-bestand: rijen, laatste bid/ask en min/max ts, één keer berekend.
+`refresh` bekijkt alleen mappen waarvan de mtime veranderd is (plus de
+datums van vandaag/gisteren), dus de kosten van een run schalen met de
+hoeveelheid nieuwe data en niet met de totale historie.
+"""
+import os, sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    market TEXT NOT NULL,
+    date TEXT NOT NULL,
+    file_ts INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    last_bid REAL,
+    last_ask REAL,
+    min_ts INTEGER,
+    max_ts INTEGER
+);
+CREATE INDEX IF NOT EXISTS parts_market_ts ON parts (market, file_ts DESC);
+CREATE INDEX IF NOT EXISTS parts_dir ON parts (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# scan_many(paths) -> [{"rows", "last_bid", "last_ask", "min_ts", "max_ts"} | None, ...]
+ScanMany = Callable[[Sequence[Path]], List[Optional[Dict]]]
+
+
+def file_ts(path: Path) -> int:
+    """part-<ms>-<pid>-<seq>.parquet of legacy part-<unix-sec>.parquet -> epoch ms."""
+    try:
+        t = int(path.stem.split("-")[1])
+    except (IndexError, ValueError):
+        return int(path.stat().st_mtime * 1000)
+    return t if t > 10**11 else t * 1000
+
+
+class PartIndex:
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _dir_mtimes(self) -> Dict[str, int]:
+        return dict(self.db.execute("SELECT path, mtime_ns FROM dirs"))
+
+    def refresh(self, root: Path, scan_many: ScanMany) -> int:
+        """Index nieuwe parts onder root/date=*/market=*/; geeft het aantal nieuwe bestanden terug."""
+        if not root.exists():
+            return 0
+        now = datetime.now(timezone.utc)
+        recent = {now.strftime("%Y-%m-%d"), (now - timedelta(days=1)).strftime("%Y-%m-%d")}
+        known = self._dir_mtimes()
+        seen_dates = set()
+        todo = []  # (market_dir, market, date, mtime_ns)
+        for ddir in root.glob("date=*"):
+            date = ddir.name[5:]
+            seen_dates.add(date)
+            dm = ddir.stat().st_mtime_ns
+            if known.get(str(ddir)) == dm and date not in recent:
+                continue
+            for mdir in ddir.glob("market=*"):
+                mm = mdir.stat().st_mtime_ns  # vóór het listen: latere writes wijzigen de mtime weer
+                if known.get(str(mdir)) != mm:
+                    todo.append((mdir, mdir.name[7:], date, mm))
+            known[str(ddir)] = dm
+            self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (str(ddir), dm))
+
+        new_paths: List[Path] = []
+        meta = []
+        for mdir, market, date, mm in todo:
+            files = {str(p): p for p in mdir.glob("part-*.parquet")}
+            indexed = {r[0] for r in self.db.execute("SELECT path FROM parts WHERE dir = ?", (str(mdir),))}
+            gone = indexed - files.keys()
+            if gone:
+                self.db.executemany("DELETE FROM parts WHERE path = ?", [(p,) for p in gone])
+            for p in sorted(files.keys() - indexed):
+                new_paths.append(files[p])
+                meta.append((str(mdir), market, date))
+            self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (str(mdir), mm))
+
+        stats = scan_many(new_paths) if new_paths else []
+        rows = []
+        for path, (d, market, date), st in zip(new_paths, meta, stats):
+            if st is None:
+                continue
+            rows.append((str(path), d, market, date, file_ts(path), st["rows"], st.get("last_bid"),
+                         st.get("last_ask"), st.get("min_ts"), st.get("max_ts")))
+        self.db.executemany("INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        # retentie: verdwenen datum-mappen opruimen
+        for (date,) in list(self.db.execute("SELECT DISTINCT date FROM parts")):
+            if date not in seen_dates:
+                self.db.execute("DELETE FROM parts WHERE date = ?", (date,))
+                self.db.execute("DELETE FROM dirs WHERE path LIKE ?", (f"%{os.sep}date={date}%",))
+        self.db.commit()
+        return len(rows)
+
+    def latest(self, market: str, n: int) -> List[Dict]:
+        """Nieuwste n parts van een markt (newest → oldest)."""
+        cur = self.db.execute(
+            "SELECT rows, last_bid, last_ask, min_ts, max_ts FROM parts WHERE market = ? "
+            "ORDER BY file_ts DESC, path DESC LIMIT ?", (market, n))
+        return [{"rows": r, "last_bid": b, "last_ask": a, "min_ts": lo, "max_ts": hi} for r, b, a, lo, hi in cur]
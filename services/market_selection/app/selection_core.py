@@ -0,0 +1,82 @@
+"""
+Gedeeld door batch (`main.py`) en stream (`stream.py`): de selectie-metrics,
+universe inlezen, selectie afronden, wegschrijven en publiceren in Redis.
+Los van `main.py`, zodat `python -m app.main` in stream-mode de metrics niet
+een tweede keer registreert.
+"""
+import os, json, logging
+from typing import Dict, List, Optional
+import redis
+from prometheus_client import Counter, Gauge
+from .artifacts import (CachedFile, parse_universe, selection_message, SELECTION_KEY, SELECTION_CHANNEL,
+                        SELECTION_VERSION_KEY)
+
+run_success = Counter("selection_run_success_total","Successful selection runs")
+markets_considered = Gauge("selection_markets_considered","Markets considered this run")
+markets_eligible = Gauge("selection_markets_eligible","Markets eligible after filters")
+selection_size_g = Gauge("selection_size","Final selection size")
+selection_version_g = Gauge("selection_published_version","Version of the last selection published to Redis")
+
+_universes: Dict[str, CachedFile] = {}
+
+def read_universe(path: str) -> List[str]:
+    """Markten uit de universe-file; alleen opnieuw geparsed als de file wijzigt (inode/mtime/size)."""
+    c = _universes.get(path)
+    if c is None:
+        c = _universes[path] = CachedFile(path, parse_universe, [])
+    return list(c.get())
+
+def finalize_selection(universe, ranked: List[str], cfg: Dict) -> List[str]:
+    """always_include eerst, dan de ranking tot target_size."""
+    target = int(cfg["selection"]["target_size"])
+    always = list(cfg["selection"]["always_include"] or [])
+    out = []
+    for a in always:
+        if a in universe and a not in out:
+            out.append(a)
+    for m in ranked:
+        if len(out) >= target:
+            break
+        if m not in out:
+            out.append(m)
+    selection_size_g.set(len(out))
+    return out
+
+def write_selection(path: str, markets: List[str]):
+    data = {"markets": markets}
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",",":"))
+    os.replace(tmp, path)
+
+class SelectionPublisher:
+    """
+    Publiceert de selectie in Redis (key `selection:latest` + pubsub `selection:updates`) met een
+    oplopend versienummer, alleen als de set markten wijzigt. Fouten laten de run niet falen:
+    de selection-file is dan al geschreven.
+    """
+
+    def __init__(self, r: "redis.Redis"):
+        self.r = r
+        self.last: Optional[List[str]] = None
+
+    def publish(self, markets: List[str]) -> Optional[int]:
+        if markets == self.last:
+            return None
+        try:
+            version = int(self.r.incr(SELECTION_VERSION_KEY))
+            msg = selection_message(version, markets)
+            pipe = self.r.pipeline(transaction=False)
+            pipe.set(SELECTION_KEY, msg)
+            pipe.publish(SELECTION_CHANNEL, msg)
+            pipe.execute()
+        except redis.RedisError:
+            logging.exception("publishing selection to redis failed")
+            return None
+        self.last = list(markets)
+        selection_version_g.set(version)
+        return version
+
+def make_publisher(cfg: Dict) -> Optional[SelectionPublisher]:
+    dsn = cfg["output"].get("redis_dsn")
+    return SelectionPublisher(redis.from_url(dsn)) if dsn else None
@@ -0,0 +1,275 @@
+"""
+Streaming selectie direct uit `ws:ticker` (runtime.mode: stream).
+
+Per markt rollende vensters in geheugen (blueprint §3.3): tick-aantal en
+spread-verdeling over de laatste `stream.window_s` seconden, plus 24h EUR-volume
+uit `ticker24h`-events of de REST `/ticker/24h` endpoint. De ranking wordt
+elke `stream.rank_interval_s` herberekend; alleen bij een materiële wijziging
+(andere set markten) worden `selection.latest.json` en
+`streams:universe.candidates` bijgewerkt.
+
+Een venster bewaart geen losse samples maar tellers per seconde: het aantal
+ticks en een histogram van de spread (afgerond op SPREAD_RESOLUTION_BPS),
+plus lopende totalen over het hele venster. Geheugen per markt is dus
+begrensd door `window_s` en het aantal verschillende spreads, niet door het
+aantal ticks, en ook de drukste markten tellen en meten over het volledige
+venster.
+"""
+import logging, time, urllib.request
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import orjson
+import redis
+from prometheus_client import Counter, Gauge
+from . import codec
+from .selection_core import (read_universe, finalize_selection, write_selection, markets_considered,
+                             markets_eligible, run_success, SelectionPublisher)
+
+stream_events = Counter("selection_stream_events_total", "ws:ticker entries consumed by the streaming selector")
+stream_publishes = Counter("selection_stream_publishes_total", "Selections published by the streaming selector")
+stream_lag = Gauge("selection_stream_lag_seconds", "Age of the newest consumed ws:ticker entry")
+
+# spreads worden per seconde geteld met deze resolutie (bps); ruim onder elke zinnige max_spread_bps
+SPREAD_RESOLUTION_BPS = 0.01
+
+
+def _f(x) -> Optional[float]:
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def weighted_percentile(counts: Dict[float, int], q: float) -> float:
+    """Percentiel (lineaire interpolatie tussen de samples) over {waarde: aantal}, zonder de samples uit te schrijven."""
+    if not counts:
+        raise ValueError("empty")
+    items = sorted(counts.items())
+    k = (sum(counts.values()) - 1) * q
+    lo = int(k)
+    lo_val = hi_val = None
+    seen = 0
+    for v, n in items:
+        seen += n
+        if lo_val is None and seen > lo:
+            lo_val = v
+        if seen > lo + 1:
+            hi_val = v
+            break
+    if hi_val is None:
+        hi_val = items[-1][0]
+    return lo_val + (hi_val - lo_val) * (k - lo)
+
+
+class MarketWindow:
+    """Ticks en spread-histogram per seconde (buckets) plus lopende totalen over het venster."""
+    __slots__ = ("bid", "ask", "buckets", "ticks", "spreads", "vol24h_eur")
+
+    def __init__(self):
+        self.bid: Optional[float] = None
+        self.ask: Optional[float] = None
+        # [seconde, ticks, {spread_bps: aantal}], oudste eerst; hooguit window_s + 1 buckets
+        self.buckets: Deque[list] = deque()
+        self.ticks = 0
+        self.spreads: Dict[float, int] = {}
+        self.vol24h_eur: Optional[float] = None
+
+    def add(self, ts_ms: int, spread_bps: Optional[float]):
+        sec = ts_ms // 1000
+        if not self.buckets or sec > self.buckets[-1][0]:
+            self.buckets.append([sec, 0, {}])
+        # een entry met een oudere timestamp telt mee in de laatste bucket
+        b = self.buckets[-1]
+        b[1] += 1
+        self.ticks += 1
+        if spread_bps is not None:
+            key = round(round(spread_bps / SPREAD_RESOLUTION_BPS) * SPREAD_RESOLUTION_BPS, 6)
+            b[2][key] = b[2].get(key, 0) + 1
+            self.spreads[key] = self.spreads.get(key, 0) + 1
+
+    def expire(self, cutoff_ms: int):
+        # een bucket valt weg zodra zijn hele seconde voor de cutoff ligt
+        while self.buckets and (self.buckets[0][0] + 1) * 1000 <= cutoff_ms:
+            _, n, spreads = self.buckets.popleft()
+            self.ticks -= n
+            for key, c in spreads.items():
+                left = self.spreads[key] - c
+                if left:
+                    self.spreads[key] = left
+                else:
+                    del self.spreads[key]
+
+
+class StreamSelector:
+    def __init__(self, cfg: Dict):
+        st = cfg.get("stream") or {}
+        self.cfg = cfg
+        self.window_ms = int(st.get("window_s", 300)) * 1000
+        self.min_ticks = int(st.get("min_ticks", 50))
+        self.min_volume = float(st.get("min_volume_eur", 25_000))
+        self.min_price = float(st.get("min_price", 1e-7))
+        self.spread_q = float(st.get("spread_percentile", 0.5))
+        self.max_spread = float(cfg["selection"]["max_spread_bps"])
+        self.exclude = set(cfg["selection"]["exclude_markets"] or [])
+        self.markets: Dict[str, MarketWindow] = {}
+
+    def _w(self, market: str) -> MarketWindow:
+        w = self.markets.get(market)
+        if w is None:
+            w = self.markets[market] = MarketWindow()
+        return w
+
+    def on_volume(self, market: str, volume_quote):
+        v = _f(volume_quote)
+        if market and v is not None:
+            self._w(market).vol24h_eur = v
+
+    def on_ticker(self, ts_ms: int, evt: Dict[str, Any]):
+        if evt.get("event") == "ticker24h":
+            for item in evt.get("data") or []:
+                self.on_volume(item.get("market"), item.get("volumeQuote"))
+            return
+        market = evt.get("market")
+        if not market:
+            return
+        w = self._w(market)
+        b, a = _f(evt.get("bestBid")), _f(evt.get("bestAsk"))
+        if b is not None:
+            w.bid = b
+        if a is not None:
+            w.ask = a
+        spread = None
+        if w.bid and w.ask:
+            mid = (w.bid + w.ask) / 2
+            spread = (w.ask - w.bid) / mid * 10_000
+        w.add(ts_ms, spread)
+
+    def rank(self, universe: List[str], now_ms: int) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+        """Geschikte markten (spread-percentiel, -ticks, markt) plus stats per markt."""
+        cutoff = now_ms - self.window_ms
+        scored = []
+        stats: Dict[str, Dict[str, Any]] = {}
+        considered = 0
+        for m in universe:
+            w = self.markets.get(m)
+            if m in self.exclude or w is None:
+                continue
+            considered += 1
+            w.expire(cutoff)
+            if not w.spreads or w.bid is None or w.ask is None:
+                continue
+            spread = weighted_percentile(w.spreads, self.spread_q)
+            stats[m] = {"bid": w.bid, "ask": w.ask, "spread_bps": spread, "ticks": w.ticks,
+                        "vol24h_eur": w.vol24h_eur or 0.0}
+            if w.ticks < self.min_ticks or spread > self.max_spread or w.bid <= self.min_price:
+                continue
+            if self.min_volume > 0 and (w.vol24h_eur or 0.0) < self.min_volume:
+                continue
+            scored.append((spread, -w.ticks, m))
+        scored.sort()
+        markets_considered.set(considered)
+        markets_eligible.set(len(scored))
+        return [m for _, __, m in scored], stats
+
+
+def fetch_volumes(url: str, timeout: float = 10.0) -> Dict[str, float]:
+    """REST /ticker/24h -> {market: volumeQuote}."""
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        data = orjson.loads(resp.read())
+    out = {}
+    for item in data if isinstance(data, list) else []:
+        v = _f(item.get("volumeQuote"))
+        if item.get("market") and v is not None:
+            out[item["market"]] = v
+    return out
+
+
+def publish(r: "redis.Redis", cfg: Dict, markets: List[str], stats: Dict[str, Dict[str, Any]], now_ms: int,
+            publisher: Optional[SelectionPublisher] = None):
+    write_selection(cfg["output"]["selection_file"], markets)
+    if publisher is not None:
+        publisher.publish(markets)
+    stream = (cfg.get("stream") or {}).get("candidates_stream", "streams:universe.candidates")
+    maxlen = int((cfg.get("stream") or {}).get("candidates_maxlen", 10_000))
+    pipe = r.pipeline(transaction=False)
+    for m in markets:
+        st = stats.get(m)
+        if not st:
+            continue
+        payload = {"ts": now_ms, "pair": m, "bid": st["bid"], "ask": st["ask"],
+                   "spread_bps": round(st["spread_bps"], 3), "vol24h_eur": st["vol24h_eur"]}
+        pipe.xadd(stream, {"v": orjson.dumps(payload)}, maxlen=maxlen, approximate=True)
+    pipe.execute()
+    stream_publishes.inc()
+    run_success.inc()
+
+
+def run_stream(cfg: Dict, publisher: Optional[SelectionPublisher] = None):
+    st = cfg.get("stream") or {}
+    r = redis.from_url(st.get("redis_dsn", "redis://127.0.0.1:6379/0"), decode_responses=False)
+    sel = StreamSelector(cfg)
+    source = st.get("source_stream", "ws:ticker")
+    rank_every = float(st.get("rank_interval_s", 5))
+    min_publish = float(st.get("min_publish_interval_s", 10))
+    volume_url = st.get("volume_url")
+    volume_every = float(st.get("volume_refresh_s", 300))
+    retry_min = float(st.get("retry_backoff_s", 1))
+    retry_max = float(st.get("retry_backoff_max_s", 30))
+    backoff = retry_min
+    # vensters eerst laten vullen; anders publiceert een herstart een (bijna) lege selectie
+    publish_after = time.monotonic() + float(st.get("warmup_s", 60))
+
+    last_id = "$"
+    next_rank = time.monotonic() + rank_every
+    next_volume = 0.0
+    last_publish = 0.0
+    published: Optional[List[str]] = None
+    logging.info("streaming selection from %s", source)
+    while True:
+        if volume_url and time.monotonic() >= next_volume:
+            try:
+                for m, v in fetch_volumes(volume_url).items():
+                    sel.on_volume(m, v)
+            except Exception:
+                logging.exception("24h volume refresh failed")
+            next_volume = time.monotonic() + volume_every
+
+        try:
+            resp = r.xread({source: last_id}, count=5000, block=1000)
+            for _, entries in resp or []:
+                for eid, fields in entries:
+                    last_id = eid
+                    try:
+                        evt = codec.decode(fields[b"v"])
+                    except Exception:
+                        continue
+                    sel.on_ticker(int(eid.split(b"-", 1)[0]), evt)
+                    stream_events.inc()
+        except redis.RedisError as e:
+            # vensters blijven staan; verder lezen vanaf de laatst verwerkte entry
+            logging.warning("reading %s failed: %s; retrying in %.0fs", source, e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, retry_max)
+            continue
+        backoff = retry_min
+        if last_id != "$":
+            stream_lag.set(max(0.0, time.time() - int(last_id.split(b"-", 1)[0]) / 1000))
+
+        now = time.monotonic()
+        if now < next_rank or now < publish_after:
+            continue
+        next_rank = now + rank_every
+        universe = read_universe(cfg["inputs"]["universe_file"])
+        ranked, stats = sel.rank(universe, int(time.time() * 1000))
+        markets = finalize_selection(universe, ranked, cfg)
+        changed = published is None or set(markets) != set(published)
+        if changed and now - last_publish >= min_publish:
+            try:
+                publish(r, cfg, markets, stats, int(time.time() * 1000), publisher)
+            except Exception:
+                logging.exception("publishing selection failed")
+                continue
+            logging.info("selection changed size=%d added=%s removed=%s", len(markets),
+                         sorted(set(markets) - set(published or [])), sorted(set(published or []) - set(markets)))
+            published = markets
+            last_publish = now
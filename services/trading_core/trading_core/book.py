@@ -0,0 +1,319 @@
+"""
+Local L2 order books built from the Bitvavo `book` channel.
+
+Bitvavo sends deltas ([price, size] with size 0 = remove) stamped with a
+per-market nonce that increases by one per update. A book is only trusted
+after a snapshot; a nonce gap marks it stale and triggers a resync from a
+pluggable `BookSource` (REST in production, `StaticBookSource` locally).
+Updates that arrive while a resync is in flight are buffered and replayed
+on top of the snapshot.
+
+Each side is kept as two parallel `array('d')` buffers sorted by price
+(bids stored negated), so an update is a bisect plus an in-place
+insert/delete of at most `depth` doubles.
+"""
+import asyncio, logging, time
+from array import array
+from bisect import bisect_left
+from operator import mul
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+from trading_core.metrics import book_resyncs_total, book_updates_total
+
+log = logging.getLogger("trading_core.book")
+
+Levels = Sequence[Sequence[Any]]
+BookSnapshot = Tuple[int, Levels, Levels]  # (nonce, bids, asks)
+
+
+class BookSide:
+    __slots__ = ("_sign", "_keys", "_sizes")
+
+    def __init__(self, descending: bool):
+        # bids are stored as -price so both sides are ascending in _keys
+        self._sign = -1.0 if descending else 1.0
+        self._keys = array("d")
+        self._sizes = array("d")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self):
+        del self._keys[:]
+        del self._sizes[:]
+
+    def set(self, price: float, size: float):
+        k = price * self._sign
+        keys = self._keys
+        i = bisect_left(keys, k)
+        hit = i < len(keys) and keys[i] == k
+        if size <= 0.0:
+            if hit:
+                del keys[i]
+                del self._sizes[i]
+        elif hit:
+            self._sizes[i] = size
+        else:
+            keys.insert(i, k)
+            self._sizes.insert(i, size)
+
+    def apply(self, levels: Optional[Levels]):
+        for lvl in levels or ():
+            self.set(float(lvl[0]), float(lvl[1]))
+
+    def truncate(self, depth: int):
+        if len(self._keys) > depth:
+            del self._keys[depth:]
+            del self._sizes[depth:]
+
+    def best(self) -> Tuple[Optional[float], Optional[float]]:
+        if not self._keys:
+            return None, None
+        return self._keys[0] * self._sign, self._sizes[0]
+
+    def depth_eur(self, levels: int) -> float:
+        return self._sign * sum(map(mul, self._keys[:levels], self._sizes[:levels]))
+
+    def size_at(self, price: float) -> float:
+        k = price * self._sign
+        i = bisect_left(self._keys, k)
+        return self._sizes[i] if i < len(self._keys) and self._keys[i] == k else 0.0
+
+    def walk(self, size: Optional[float] = None, quote: Optional[float] = None,
+             limit: Optional[float] = None) -> Tuple[float, float]:
+        """
+        Take liquidity from the best level outwards until `size` (base) or
+        `quote` (EUR) is filled or the price passes `limit`; the book itself is
+        not modified. Returns (filled size, notional).
+        """
+        sign = self._sign
+        lim = None if limit is None else limit * sign
+        filled = notional = 0.0
+        for k, s in zip(self._keys, self._sizes):
+            if lim is not None and k > lim:
+                break
+            p = k * sign
+            take = min(s, (quote - notional) / p if quote is not None else size - filled)
+            if take <= 0.0:
+                break
+            filled += take
+            notional += take * p
+            if take < s:
+                break
+        return filled, notional
+
+    def levels(self, n: Optional[int] = None) -> List[Tuple[float, float]]:
+        n = len(self._keys) if n is None else n
+        sign = self._sign
+        return [(k * sign, s) for k, s in zip(self._keys[:n], self._sizes[:n])]
+
+
+class OrderBook:
+    __slots__ = ("market", "depth", "nonce", "synced", "bids", "asks")
+
+    def __init__(self, market: str, depth: int = 100):
+        self.market = market
+        self.depth = depth
+        self.nonce = -1
+        self.synced = False
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+
+    def apply_snapshot(self, nonce: int, bids: Levels, asks: Levels):
+        self.bids.clear()
+        self.asks.clear()
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        self.nonce = int(nonce)
+        self.synced = True
+
+    def apply_update(self, nonce: int, bids: Optional[Levels], asks: Optional[Levels],
+                     nonce_start: Optional[int] = None) -> bool:
+        """
+        Apply a delta. Returns False on a nonce gap (book marked unsynced);
+        stale or duplicate updates are ignored. Ingest may collapse a run of
+        deltas into one covering nonce_start..nonce; since levels are absolute,
+        it applies cleanly as long as the run starts at or before nonce + 1.
+        """
+        nonce = int(nonce)
+        if nonce <= self.nonce:
+            return True
+        start = nonce if nonce_start is None else int(nonce_start)
+        if not self.synced or start > self.nonce + 1:
+            self.synced = False
+            return False
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        # depth-limited subscriptions can leave levels beyond `depth` behind
+        self.bids.truncate(self.depth)
+        self.asks.truncate(self.depth)
+        self.nonce = nonce
+        return True
+
+    def imbalance(self, levels: int) -> Optional[float]:
+        b = self.bids.depth_eur(levels)
+        a = self.asks.depth_eur(levels)
+        return (b - a) / (b + a) if (a + b) > 0 else None
+
+    def view(self, levels: int = 10) -> Dict[str, Any]:
+        """BBO, EUR sizes, depth over `levels` and imbalance, in compute_signal's snapshot keys."""
+        bid, bid_sz = self.bids.best()
+        ask, ask_sz = self.asks.best()
+        out: Dict[str, Any] = {"nonce": self.nonce}
+        b = self.bids.depth_eur(levels)
+        a = self.asks.depth_eur(levels)
+        if bid is not None:
+            out.update(bestBid=bid, bestBidSize=bid_sz, bestBidSizeEur=bid * bid_sz, bidDepthEur=b)
+        if ask is not None:
+            out.update(bestAsk=ask, bestAskSize=ask_sz, bestAskSizeEur=ask * ask_sz, askDepthEur=a)
+        if a + b > 0:
+            out["imbalance"] = (b - a) / (b + a)
+        return out
+
+
+def ticker_view(ticker: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Top-of-book view from a ticker's bestBid/bestAsk (poll mode has no local
+    books): the BBO and EUR sizes of `OrderBook.view`, without depth or
+    imbalance. None when the ticker has neither side.
+    """
+    if not ticker:
+        return None
+    out: Dict[str, Any] = {}
+    for side, key in (("Bid", "bestBid"), ("Ask", "bestAsk")):
+        try:
+            price = float(ticker[key])
+            size = float(ticker.get(key + "Size") or 0.0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        out[f"best{side}"] = price
+        out[f"best{side}Size"] = size
+        out[f"best{side}SizeEur"] = price * size
+    return out or None
+
+
+class BookSource(Protocol):
+    async def fetch(self, market: str, depth: int) -> BookSnapshot: ...
+
+
+class BitvavoRestBookSource:
+    """GET {rest_base}/{market}/book?depth=N."""
+
+    def __init__(self, rest_base: str, timeout_s: float = 5.0):
+        import httpx
+        self._client = httpx.AsyncClient(base_url=rest_base.rstrip("/"), timeout=timeout_s)
+
+    async def fetch(self, market: str, depth: int) -> BookSnapshot:
+        r = await self._client.get(f"/{market}/book", params={"depth": depth})
+        r.raise_for_status()
+        data = r.json()
+        return int(data["nonce"]), data.get("bids") or [], data.get("asks") or []
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class StaticBookSource:
+    """In-memory stand-in for the REST endpoint: {market: (nonce, bids, asks)}."""
+
+    def __init__(self, books: Optional[Dict[str, BookSnapshot]] = None):
+        self.books: Dict[str, BookSnapshot] = dict(books or {})
+        self.calls = 0
+
+    async def fetch(self, market: str, depth: int) -> BookSnapshot:
+        self.calls += 1
+        nonce, bids, asks = self.books[market]
+        return nonce, list(bids)[:depth], list(asks)[:depth]
+
+
+class BookManager:
+    """Keeps one OrderBook per market in sync from `book` events."""
+
+    def __init__(self, source: Optional[BookSource], depth: int = 100, levels: int = 10,
+                 min_resync_interval_s: float = 1.0, rebase_on_gap: bool = False,
+                 on_resync: Optional[Callable[[str], None]] = None):
+        self.source = source
+        # called with the market once a resync has been applied (no book event reports that)
+        self.on_resync = on_resync
+        # replay has no snapshots: build books from deltas alone and carry on across gaps
+        self.rebase_on_gap = rebase_on_gap
+        self.depth = depth
+        self.levels = levels
+        self.min_resync_interval = min_resync_interval_s
+        self.books: Dict[str, OrderBook] = {}
+        self._resyncing: Dict[str, List[Dict[str, Any]]] = {}
+        self._last_resync: Dict[str, float] = {}
+        self._tasks: set = set()
+
+    def get(self, market: str) -> Optional[OrderBook]:
+        b = self.books.get(market)
+        return b if b is not None and b.synced else None
+
+    def view(self, market: str) -> Optional[Dict[str, Any]]:
+        b = self.get(market)
+        return b.view(self.levels) if b is not None else None
+
+    def on_event(self, evt: Dict[str, Any]) -> bool:
+        """Apply one `book` event. Returns True if the market's book changed."""
+        market = evt.get("market")
+        nonce = evt.get("nonce")
+        if not market or nonce is None:
+            return False
+        pending = self._resyncing.get(market)
+        if pending is not None:
+            pending.append(evt)
+            return False
+        book = self.books.get(market)
+        if book is None:
+            book = self.books[market] = OrderBook(market, self.depth)
+        if book.apply_update(nonce, evt.get("bids"), evt.get("asks"), evt.get("nonceStart")):
+            book_updates_total.inc()
+            return True
+        if self.rebase_on_gap:
+            book.nonce = int(nonce) - 1
+            book.synced = True
+            book.apply_update(nonce, evt.get("bids"), evt.get("asks"))
+            book_updates_total.inc()
+            return True
+        self._start_resync(market, evt, "gap" if book.nonce >= 0 else "initial")
+        return False
+
+    def _start_resync(self, market: str, evt: Dict[str, Any], reason: str):
+        if self.source is None:
+            return
+        now = time.monotonic()
+        if now - self._last_resync.get(market, -1e9) < self.min_resync_interval:
+            return
+        self._last_resync[market] = now
+        book_resyncs_total.labels(reason).inc()
+        self._resyncing[market] = [evt]
+        task = asyncio.get_running_loop().create_task(self._resync(market))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resync(self, market: str):
+        book = self.books[market]
+        try:
+            nonce, bids, asks = await self.source.fetch(market, self.depth)
+            book.apply_snapshot(nonce, bids, asks)
+        except Exception:
+            log.exception("book resync failed market=%s", market)
+            book.synced = False
+            self._resyncing.pop(market, None)
+            return
+        buffered = self._resyncing.pop(market, [])
+        for evt in buffered:
+            if not book.apply_update(evt["nonce"], evt.get("bids"), evt.get("asks"), evt.get("nonceStart")):
+                # still gapped after the snapshot: try again from the next event
+                log.warning("book %s gap persists after resync (nonce %s)", market, evt["nonce"])
+                break
+        if self.on_resync is not None:
+            self.on_resync(market)
+
+    async def close(self):
+        tasks = list(self._tasks)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            await close()
@@ -0,0 +1,24 @@
+import time
+from typing import Dict
+
+
+class Cooldown:
+    """Per-market cooldown after an entry; `now` is epoch seconds (event time in replay)."""
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self._last = {}
+
+    def hit(self, market: str, now: float = None) -> bool:
+        t = self._last.get(market, 0)
+        return (time.time() if now is None else now) - t < self.seconds
+
+    def set(self, market: str, now: float = None):
+        self._last[market] = time.time() if now is None else now
+
+    def export(self) -> Dict[str, float]:
+        now = time.time()
+        return {m: t for m, t in self._last.items() if now - t < self.seconds}
+
+    def restore(self, last: Dict[str, float]):
+        self._last.update(last)
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import numpy as np
 
 @dataclass
 class Decision:
@@ -15,17 +16,29 @@ def _to_float(x, default=None):
     except Exception:
         return default
 
+def _num(x) -> Optional[float]:
+    # NaN counts as missing so the scalar and batch paths agree on it
+    v = _to_float(x, None)
+    return None if v is None or v != v else v
+
+def _extract(snapshot: Dict[str, Any]) -> Tuple[Optional[float], ...]:
+    """(bid, ask, bid_size_eur, ask_size_eur, last_price) with the alias keys resolved once."""
+    book = snapshot.get("book", {}) or {}
+    bid = _num(book.get("bestBid") or book.get("bid") or book.get("b"))
+    ask = _num(book.get("bestAsk") or book.get("ask") or book.get("a"))
+    bid_size_eur = _num(book.get("bestBidSizeEur") or book.get("bidSizeEur"))
+    ask_size_eur = _num(book.get("bestAskSizeEur") or book.get("askSizeEur"))
+    ticker = snapshot.get("ticker", {}) or {}
+    last_price = _num(ticker.get("lastPrice") or ticker.get("price"))
+    return bid, ask, bid_size_eur, ask_size_eur, last_price
+
 def compute_signal(market: str, snapshot: Dict[str, Any], params: Dict[str, Any]) -> Decision:
     """
     Naive but safe: micro-spread and top-of-book liquidity gate.
     - Requires book best bids/asks with sizes in quote currency terms (EUR)
     - Buy-only MVP; no shorting.
     """
-    book = snapshot.get("book", {}) or {}
-    bid = _to_float(book.get("bestBid") or book.get("bid") or book.get("b"), None)
-    ask = _to_float(book.get("bestAsk") or book.get("ask") or book.get("a"), None)
-    bid_size_eur = _to_float(book.get("bestBidSizeEur") or book.get("bidSizeEur"), None)
-    ask_size_eur = _to_float(book.get("bestAskSizeEur") or book.get("askSizeEur"), None)
+    bid, ask, bid_size_eur, ask_size_eur, last_price = _extract(snapshot)
 
     if not (bid and ask):
         return Decision(market, None, "no_bbo", None, None)
@@ -39,8 +52,129 @@ def compute_signal(market: str, snapshot: Dict[str, Any], params: Dict[str, Any]
     if (bid_size_eur is not None and bid_size_eur < min_depth) or (ask_size_eur is not None and ask_size_eur < min_depth):
         return Decision(market, None, "thin_book", None, None)
 
-    ticker = snapshot.get("ticker", {}) or {}
-    last_price = _to_float(ticker.get("lastPrice") or ticker.get("price"), (ask+bid)/2)
+    if last_price is None:
+        last_price = (ask+bid)/2
     price = last_price if last_price else (ask+bid)/2
 
     return Decision(market, "buy", "tight_spread_liquid_book", price, None)
+
+# --- batch path ------------------------------------------------------------
+
+REASONS = ("no_bbo", "spread_too_wide", "thin_book", "tight_spread_liquid_book")
+NO_BBO, SPREAD_TOO_WIDE, THIN_BOOK, BUY = range(len(REASONS))
+
+@dataclass
+class MarketColumns:
+    """Columnar view of the selection; NaN marks a missing value."""
+    markets: List[str]
+    bid: np.ndarray
+    ask: np.ndarray
+    bid_size_eur: np.ndarray
+    ask_size_eur: np.ndarray
+    last_price: np.ndarray
+
+def columns_from_snapshots(markets: Sequence[str], snapshots: Dict[str, Dict[str, Any]]) -> MarketColumns:
+    """Rebuilds the columns from snapshot dicts; for tests and the parity check, too slow for the decision path."""
+    rows = [_extract(snapshots.get(m) or {}) for m in markets]
+    arr = np.array([[np.nan if v is None else v for v in r] for r in rows], dtype=np.float64).reshape(len(rows), 5)
+    return MarketColumns(list(markets), arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4])
+
+def _cell(x) -> float:
+    # same falsy rule as the `or` chains in _extract: 0 and missing are both "no value"
+    v = _num(x) if x else None
+    return np.nan if v is None else v
+
+class SignalColumns:
+    """
+    compute_signal's inputs for every market seen so far, one column per
+    field, updated in place as book and ticker events arrive. `select` only
+    gathers the rows of one decision run; no snapshot dicts are rebuilt.
+    """
+    __slots__ = ("index", "_data", "_tickers")
+
+    def __init__(self, capacity: int = 64):
+        self.index: Dict[str, int] = {}
+        # rows: bid, ask, bid_size_eur, ask_size_eur, last_price
+        self._data = np.full((5, capacity), np.nan)
+        self._tickers: set = set()
+
+    def _row(self, market: str) -> int:
+        i = self.index.get(market)
+        if i is None:
+            i = self.index[market] = len(self.index)
+            if i == self._data.shape[1]:
+                self._data = np.concatenate([self._data, np.full_like(self._data, np.nan)], axis=1)
+        return i
+
+    def set_book(self, market: str, view: Optional[Dict[str, Any]]):
+        """From BookManager.view(); None (book not synced) clears BBO and sizes."""
+        i = self._row(market)
+        d = self._data
+        if view is None:
+            d[:4, i] = np.nan
+            return
+        d[0, i] = _cell(view.get("bestBid"))
+        d[1, i] = _cell(view.get("bestAsk"))
+        d[2, i] = _cell(view.get("bestBidSizeEur"))
+        d[3, i] = _cell(view.get("bestAskSizeEur"))
+
+    def set_ticker(self, market: str, ticker: Optional[Dict[str, Any]]):
+        """The latest ticker replaces the previous one, like the ws:ticker:{market} key."""
+        ticker = ticker or {}
+        self._data[4, self._row(market)] = _cell(ticker.get("lastPrice") or ticker.get("price"))
+        self._tickers.add(market)
+
+    def without_ticker(self, markets: Sequence[str]) -> List[str]:
+        return [m for m in markets if m not in self._tickers]
+
+    def select(self, markets: Sequence[str]) -> MarketColumns:
+        idx = [self._row(m) for m in markets]
+        rows = self._data[:, idx]
+        return MarketColumns(list(markets), rows[0], rows[1], rows[2], rows[3], rows[4])
+
+@dataclass
+class BatchDecisions:
+    markets: List[str]
+    reason: np.ndarray   # int8 index into REASONS
+    price: np.ndarray    # NaN unless reason == BUY
+
+    def entries(self) -> List[Decision]:
+        """Only the markets with a buy signal; the rest carry no order."""
+        buy = np.flatnonzero(self.reason == BUY).tolist()
+        price = self.price
+        return [Decision(self.markets[i], "buy", REASONS[BUY], float(price[i]), None) for i in buy]
+
+    def decisions(self) -> List[Decision]:
+        out = []
+        for m, r, p in zip(self.markets, self.reason.tolist(), self.price.tolist()):
+            if r == BUY:
+                out.append(Decision(m, "buy", REASONS[r], p, None))
+            else:
+                out.append(Decision(m, None, REASONS[r], None, None))
+        return out
+
+def compute_signal_batch(cols: MarketColumns, params: Dict[str, Any]) -> BatchDecisions:
+    """
+    compute_signal for the whole selection at once. Gates are evaluated in the
+    same order as the scalar path, so every market gets the identical decision.
+    """
+    bid, ask = cols.bid, cols.ask
+    max_spread = (params.get("max_spread_bps", 12)) / 10_000
+    min_depth = params.get("min_book_depth_eur", 200)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        has_bbo = ~(np.isnan(bid) | np.isnan(ask) | (bid == 0) | (ask == 0))
+        mid = (ask + bid) / 2
+        spread = (ask - bid) / mid
+        wide = spread > max_spread
+        # NaN sizes compare False, matching the scalar "is not None" checks
+        thin = (cols.bid_size_eur < min_depth) | (cols.ask_size_eur < min_depth)
+        last = cols.last_price
+        price = np.where(np.isnan(last) | (last == 0), mid, last)
+
+    reason = np.full(len(cols.markets), BUY, dtype=np.int8)
+    reason[thin] = THIN_BOOK
+    reason[wide] = SPREAD_TOO_WIDE
+    reason[~has_bbo] = NO_BBO
+    price = np.where(reason == BUY, price, np.nan)
+    return BatchDecisions(cols.markets, reason, price)
@@ -1,6 +1,12 @@
-import time
-from typing import Dict, Any, Optional
+import logging, os, time, uuid
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
+from trading_core.gateway import CircuitOpen, GatewayError, OrderGateway
+from trading_core.matching import Fill, MatchingEngine, Position
+from trading_core.metrics import orders_submitted_total
+
+log = logging.getLogger("trading_core.executor")
 
 @dataclass
 class ExecResult:
@@ -10,20 +16,144 @@ class ExecResult:
     filled_size: Optional[float]
     mode: str
     reason: str
+    fee: float = 0.0
+    liquidity: Optional[str] = None   # paper fills: taker | maker
 
 class PaperExecutor:
-    def __init__(self, notional_eur: float, tp_pct: float, sl_pct: float):
+    """
+    Paper trading on the `MatchingEngine`: taker orders walk the local book
+    (maker orders join the bid with a queue estimate when `order_type` is
+    "maker"), fees are charged and TP/SL exits are managed per position.
+    Markets without a synced local book fill at the signal price.
+
+    Later fills (maker orders, TP/SL exits) come out of the `on_book`,
+    `on_trade` and `on_ticker` hooks, which the caller feeds with the
+    market events.
+    """
+
+    def __init__(self, notional_eur: float, tp_pct: float, sl_pct: float, books=None,
+                 cfg: Optional[Dict[str, Any]] = None):
+        cfg = cfg or {}
         self.notional = notional_eur
         self.tp = tp_pct / 100.0
         self.sl = sl_pct / 100.0
+        self.order_type = cfg.get("order_type", "taker")
+        self.engine = MatchingEngine(books, taker_fee_bps=float(cfg.get("taker_fee_bps", 25)),
+                                     maker_fee_bps=float(cfg.get("maker_fee_bps", 15)), tp_pct=tp_pct, sl_pct=sl_pct,
+                                     max_slippage_bps=float(cfg.get("max_slippage_bps", 50)),
+                                     maker_timeout_s=float(cfg.get("maker_timeout_s", 30)))
+
+    def position(self, market: str) -> Optional[Position]:
+        return self.engine.positions.get(market)
+
+    async def place_order(self, market: str, side: str, price: float, ts_ms: Optional[int] = None,
+                          notional: Optional[float] = None) -> ExecResult:
+        eng = self.engine
+        ts = int(time.time() * 1000) if ts_ms is None else ts_ms
+        pos = eng.positions.get(market)
+        if side == "sell" and pos is None:
+            return ExecResult(False, None, None, None, "paper", "no_position")
+        quote, size = (notional or self.notional, None) if side == "buy" else (None, pos.size)
+        if not eng.has_book(market):
+            fill = eng.fill_at(market, side, ts, price, quote=quote, size=size,
+                               reason="entry" if side == "buy" else "close")
+        elif self.order_type == "maker" and side == "buy":
+            order = eng.limit_order(market, side, ts, quote=quote)
+            if order is None:
+                return ExecResult(False, None, None, None, "paper", "no_liquidity")
+            return ExecResult(True, order.id, None, 0.0, "paper", "resting")
+        else:
+            fill = eng.market_order(market, side, ts, quote=quote, size=size,
+                                    reason="entry" if side == "buy" else "close")
+        if fill is None:
+            return ExecResult(False, None, None, None, "paper", "no_liquidity")
+        return ExecResult(True, fill.order_id, fill.price, fill.size, "paper", "filled", fill.fee, fill.liquidity)
+
+    async def close(self):
+        """Nothing to release; same interface as BitvavoExecutor."""
+
+    def export(self) -> Dict[str, Any]:
+        return self.engine.export()
+
+    def restore(self, state: Dict[str, Any]):
+        self.engine.restore(state)
 
-    async def place_order(self, market: str, side: str, price: float) -> ExecResult:
-        size = self.notional / max(price, 1e-9)
-        return ExecResult(True, f"paper-{int(time.time()*1000)}", price, size, "paper", "filled")
+    def on_book(self, market: str, ts_ms: int) -> List[Fill]:
+        return self.engine.on_book(market, ts_ms)
+
+    def on_trade(self, market: str, ts_ms: int, price, amount, side) -> List[Fill]:
+        if price is None or amount is None:
+            return []
+        return self.engine.on_trade(market, ts_ms, price, amount, side)
+
+    def on_ticker(self, market: str, ts_ms: int, evt: Dict[str, Any]) -> List[Fill]:
+        return self.engine.on_price(market, ts_ms, evt.get("bestBid"))
 
 class BitvavoExecutor:
-    def __init__(self, cfg: Dict[str, Any]):
+    """
+    Live orders through the `OrderGateway`: market buys for `notional_eur`
+    (amountQuote), market sells of the amount bought in that market. Each
+    call gets a fresh clientOrderId, so concurrent calls for different
+    markets are independent. API keys come from BITVAVO_API_KEY /
+    BITVAVO_API_SECRET, falling back to the config.
+    """
+
+    def __init__(self, cfg: Dict[str, Any], notional_eur: float = 0.0):
         self.cfg = cfg
+        self.notional = notional_eur
+        self.gateway = OrderGateway(cfg.get("rest_base", "https://api.bitvavo.com/v2"),
+                                    os.environ.get("BITVAVO_API_KEY") or cfg.get("api_key", ""),
+                                    os.environ.get("BITVAVO_API_SECRET") or cfg.get("api_secret", ""), cfg)
+        self.holdings: Dict[str, Decimal] = {}
+
+    async def start(self):
+        try:
+            await self.gateway.start()
+        except GatewayError as e:
+            log.warning("order gateway warm-up failed: %s", e)
+
+    async def close(self):
+        await self.gateway.close()
+
+    def export(self) -> Dict[str, Any]:
+        return {"holdings": {m: str(v) for m, v in self.holdings.items()}}
+
+    def restore(self, state: Dict[str, Any]):
+        self.holdings = {m: Decimal(v) for m, v in state.get("holdings", {}).items()}
 
-    async def place_order(self, market: str, side: str, price: float) -> ExecResult:
-        return ExecResult(False, None, None, None, "bitvavo", "not_implemented")
+    async def place_order(self, market: str, side: str, price: float, ts_ms: Optional[int] = None,
+                          notional: Optional[float] = None) -> ExecResult:
+        held = self.holdings.get(market)
+        if side == "sell" and not held:
+            return ExecResult(False, None, None, None, "bitvavo", "no_position")
+        client_id = str(uuid.uuid4())
+        try:
+            if side == "buy":
+                o = await self.gateway.place_order(market, side, amount_quote=f"{notional or self.notional:.2f}",
+                                                   client_id=client_id)
+            else:
+                o = await self.gateway.place_order(market, side, amount=str(held), client_id=client_id)
+        except CircuitOpen:
+            orders_submitted_total.labels("circuit_open").inc()
+            return ExecResult(False, client_id, None, None, "bitvavo", "circuit_open")
+        except GatewayError as e:
+            if e.ambiguous:
+                # placed or not is unknown; the clientOrderId lets the private feed / a later lookup settle it
+                orders_submitted_total.labels("unknown").inc()
+                log.error("order %s %s outcome unknown (clientOrderId %s): %s", side, market, client_id, e)
+                return ExecResult(False, client_id, None, None, "bitvavo", "unknown")
+            orders_submitted_total.labels("rejected" if e.code else "error").inc()
+            log.warning("order %s %s failed: %s", side, market, e)
+            return ExecResult(False, client_id, None, None, "bitvavo", f"error_{e.code or e.status}")
+        filled = Decimal(o.get("filledAmount") or "0")
+        quote = Decimal(o.get("filledAmountQuote") or "0")
+        if filled:
+            rest = (held or Decimal(0)) + filled if side == "buy" else held - filled
+            if rest > 0:
+                self.holdings[market] = rest
+            else:
+                self.holdings.pop(market, None)
+        status = o.get("status", "new")
+        orders_submitted_total.labels(status).inc()
+        return ExecResult(True, o.get("orderId"), float(quote / filled) if filled else None, float(filled),
+                          "bitvavo", status, float(o.get("feePaid") or 0.0))
@@ -0,0 +1,328 @@
+"""
+Incremental per-market features (blueprint §4.1).
+
+Every update is O(1): rolling windows are fixed-capacity ring buffers with
+running sums and rolling-Welford variances that evict expired entries from
+the head (re-anchored from the ring every `capacity` updates, amortized
+O(1)), EMAs are single multiply-adds, and RSI(7) uses Wilder smoothing on
+1-minute bars that are closed as time advances. Mid-based features only
+update when the best bid or ask changes.
+
+`FeatureEngine.snapshot(market)` returns a flat dict that trading_core
+attaches to the decision snapshot as `snapshot["features"]`.
+"""
+import math
+from array import array
+from typing import Any, Dict, Optional
+import numpy as np
+
+
+class RollingWindow:
+    """
+    Time-bounded window over (ts_ms, v0..vn) with running sums and
+    rolling-Welford second moments (`m2`) per column. Capacity is fixed; when
+    full, the oldest entry is evicted even if it is still inside the horizon.
+
+    Add/remove updates accumulate rounding error over a process lifetime, so
+    the window re-anchors: the moments are recomputed exactly from the ring
+    every `capacity` updates (amortized O(1)) and reset when it empties.
+    """
+    __slots__ = ("horizon_ms", "capacity", "width", "_ts", "_vals", "_head", "_size", "_ops", "sums", "m2")
+
+    def __init__(self, horizon_ms: int, capacity: int, width: int = 1):
+        self.horizon_ms = int(horizon_ms)
+        self.capacity = int(capacity)
+        self.width = width
+        self._ts = array("q", [0]) * self.capacity
+        self._vals = array("d", [0.0]) * (self.capacity * width)
+        self._head = 0
+        self._size = 0
+        self._ops = 0
+        self.sums = [0.0] * width
+        self.m2 = [0.0] * width
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reanchor(self):
+        self._ops = 0
+        n = self._size
+        if not n:
+            self.sums = [0.0] * self.width
+            self.m2 = [0.0] * self.width
+            return
+        ring = np.frombuffer(self._vals, dtype=np.float64).reshape(self.capacity, self.width)
+        head, end = self._head, self._head + n
+        live = ring[head:end] if end <= self.capacity else np.concatenate((ring[head:], ring[:end - self.capacity]))
+        sums = live.sum(axis=0)
+        self.sums = sums.tolist()
+        self.m2 = ((live - sums / n) ** 2).sum(axis=0).tolist()
+
+    def _pop(self):
+        base = self._head * self.width
+        n = self._size
+        for c in range(self.width):
+            v = self._vals[base + c]
+            s = self.sums[c]
+            if n > 1:
+                # reverse Welford step: (v - mean with v) * (v - mean without v)
+                self.m2[c] -= (v - s / n) * (v - (s - v) / (n - 1))
+            self.sums[c] = s - v
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        self._ops += 1
+        if not self._size or self._ops >= self.capacity:
+            self._reanchor()
+
+    def expire(self, now_ms: int):
+        cutoff = now_ms - self.horizon_ms
+        while self._size and self._ts[self._head] < cutoff:
+            self._pop()
+
+    def push(self, ts_ms: int, *values: float):
+        self.expire(ts_ms)
+        if self._size == self.capacity:
+            self._pop()
+        n = self._size
+        idx = (self._head + n) % self.capacity
+        self._ts[idx] = ts_ms
+        base = idx * self.width
+        for c, v in enumerate(values):
+            self._vals[base + c] = v
+            s = self.sums[c]
+            if n:
+                self.m2[c] += (v - s / n) * (v - (s + v) / (n + 1))
+            self.sums[c] = s + v
+        self._size = n + 1
+        self._ops += 1
+        if self._ops >= self.capacity:
+            self._reanchor()
+
+    def mean(self, col: int = 0) -> Optional[float]:
+        return self.sums[col] / self._size if self._size else None
+
+    def std(self, col: int = 0) -> Optional[float]:
+        if self._size < 2:
+            return None
+        var = self.m2[col] / self._size
+        return math.sqrt(var) if var > 0 else 0.0
+
+    def export(self) -> Dict[str, Any]:
+        """Live entries oldest first, as arrays (see `state.pack`)."""
+        head, end, w = self._head, self._head + self._size, self.width
+        if end <= self.capacity:
+            return {"ts": self._ts[head:end], "vals": self._vals[head * w:end * w]}
+        end -= self.capacity
+        return {"ts": self._ts[head:] + self._ts[:end], "vals": self._vals[head * w:] + self._vals[:end * w]}
+
+    def restore(self, state: Dict[str, Any]):
+        ts, vals = state["ts"], state["vals"]
+        n = min(len(ts), self.capacity)
+        skip = len(ts) - n
+        w = self.width
+        self._head = 0
+        self._size = n
+        self._ts[:n] = ts[skip:]
+        self._vals[:n * w] = vals[skip * w:]
+        self._reanchor()
+
+
+class Ema:
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, n: int):
+        self.alpha = 2.0 / (n + 1.0)
+        self.value: Optional[float] = None
+
+    def update(self, x: float) -> float:
+        v = self.value
+        self.value = x if v is None else v + self.alpha * (x - v)
+        return self.value
+
+
+class BarRsi:
+    """RSI(n) with Wilder smoothing on fixed-length bars of the last price."""
+    __slots__ = ("n", "bar_ms", "_bar", "_last_close", "_close", "_avg_gain", "_avg_loss", "_count", "value")
+
+    def __init__(self, n: int = 7, bar_ms: int = 60_000):
+        self.n = n
+        self.bar_ms = bar_ms
+        self._bar: Optional[int] = None
+        self._last_close: Optional[float] = None
+        self._close: Optional[float] = None
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self._count = 0
+        self.value: Optional[float] = None
+
+    def _close_bar(self):
+        c = self._close
+        if self._last_close is not None and c is not None:
+            d = c - self._last_close
+            g, l = (d, 0.0) if d > 0 else (0.0, -d)
+            if self._count < self.n:
+                self._avg_gain += g / self.n
+                self._avg_loss += l / self.n
+                self._count += 1
+            else:
+                self._avg_gain = (self._avg_gain * (self.n - 1) + g) / self.n
+                self._avg_loss = (self._avg_loss * (self.n - 1) + l) / self.n
+            if self._count >= self.n:
+                if self._avg_loss == 0.0:
+                    self.value = 100.0
+                else:
+                    self.value = 100.0 - 100.0 / (1.0 + self._avg_gain / self._avg_loss)
+        self._last_close = c
+
+    def update(self, ts_ms: int, price: float):
+        bar = ts_ms // self.bar_ms
+        if self._bar is None:
+            self._bar = bar
+        elif bar > self._bar:
+            # bars without ticks carry the previous close (zero change)
+            self._close_bar()
+            for _ in range(min(bar - self._bar - 1, self.n)):
+                self._close_bar()
+            self._bar = bar
+        self._close = price
+
+    def export(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__[2:]}
+
+    def restore(self, state: Dict[str, Any]):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+
+class MarketFeatures:
+    __slots__ = ("bid", "ask", "bid_size", "ask_size", "book_imbalance", "ts_ms",
+                 "ema_fast", "ema_slow", "mid_window", "trade_window", "rsi")
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.bid: Optional[float] = None
+        self.ask: Optional[float] = None
+        self.bid_size: Optional[float] = None
+        self.ask_size: Optional[float] = None
+        self.book_imbalance: Optional[float] = None
+        self.ts_ms = 0
+        self.ema_fast = Ema(int(cfg.get("ema_fast", 3)))
+        self.ema_slow = Ema(int(cfg.get("ema_slow", 9)))
+        cap = int(cfg.get("window_capacity", 4096))
+        self.mid_window = RollingWindow(int(cfg.get("z_window_s", 60)) * 1000, cap)
+        # columns: qty, price*qty, signed qty (buy +, sell -)
+        self.trade_window = RollingWindow(int(cfg.get("trade_window_s", 60)) * 1000, cap, width=3)
+        self.rsi = BarRsi(int(cfg.get("rsi_n", 7)), int(cfg.get("rsi_bar_s", 60)) * 1000)
+
+
+def _f(x) -> Optional[float]:
+    if x is None:
+        return None
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+class FeatureEngine:
+    def __init__(self, cfg: Optional[Dict[str, Any]] = None):
+        self.cfg = dict(cfg or {})
+        self.markets: Dict[str, MarketFeatures] = {}
+
+    def _state(self, market: str) -> MarketFeatures:
+        st = self.markets.get(market)
+        if st is None:
+            st = self.markets[market] = MarketFeatures(self.cfg)
+        return st
+
+    def on_quote(self, market: str, ts_ms: int, bid=None, ask=None, bid_size=None, ask_size=None,
+                 imbalance=None):
+        """
+        Ticker or book BBO update; missing fields keep their previous value.
+        The mid only feeds the EMAs, the z-score window and RSI when the best
+        bid or ask moved: book deltas deeper in the book would otherwise fill
+        the window with repeats, and `window_capacity` would cover seconds
+        instead of `z_window_s` on a busy market.
+        """
+        st = self._state(market)
+        prev_bid, prev_ask = st.bid, st.ask
+        b, a, bs, as_ = _f(bid), _f(ask), _f(bid_size), _f(ask_size)
+        if b is not None:
+            st.bid = b
+        if a is not None:
+            st.ask = a
+        if bs is not None:
+            st.bid_size = bs
+        if as_ is not None:
+            st.ask_size = as_
+        if imbalance is not None:
+            st.book_imbalance = imbalance
+        st.ts_ms = max(st.ts_ms, ts_ms)
+        if st.bid is None or st.ask is None or (st.bid == prev_bid and st.ask == prev_ask):
+            return
+        mid = (st.bid + st.ask) / 2.0
+        st.ema_fast.update(mid)
+        st.ema_slow.update(mid)
+        st.mid_window.push(ts_ms, mid)
+        st.rsi.update(ts_ms, mid)
+
+    def on_ticker(self, market: str, ts_ms: int, evt: Dict[str, Any]):
+        self.on_quote(market, ts_ms, evt.get("bestBid"), evt.get("bestAsk"),
+                      evt.get("bestBidSize"), evt.get("bestAskSize"))
+
+    def on_book_view(self, market: str, ts_ms: int, view: Dict[str, Any]):
+        self.on_quote(market, ts_ms, view.get("bestBid"), view.get("bestAsk"),
+                      view.get("bestBidSize"), view.get("bestAskSize"), view.get("imbalance"))
+
+    def on_trade(self, market: str, ts_ms: int, price, amount, side: Optional[str]):
+        p, q = _f(price), _f(amount)
+        if p is None or q is None:
+            return
+        st = self._state(market)
+        st.ts_ms = max(st.ts_ms, ts_ms)
+        st.trade_window.push(ts_ms, q, p * q, q if side == "buy" else -q)
+
+    def export(self) -> Dict[str, Any]:
+        """Per-market state for a warm restart (`trading_core/state.py`)."""
+        return {m: {"quote": [st.bid, st.ask, st.bid_size, st.ask_size, st.book_imbalance, st.ts_ms],
+                    "ema": [st.ema_fast.value, st.ema_slow.value], "mid": st.mid_window.export(),
+                    "trades": st.trade_window.export(), "rsi": st.rsi.export()}
+                for m, st in self.markets.items()}
+
+    def restore(self, state: Dict[str, Any]):
+        for m, d in state.items():
+            st = self._state(m)
+            st.bid, st.ask, st.bid_size, st.ask_size, st.book_imbalance, st.ts_ms = d["quote"]
+            st.ema_fast.value, st.ema_slow.value = d["ema"]
+            st.mid_window.restore(d["mid"])
+            st.trade_window.restore(d["trades"])
+            st.rsi.restore(d["rsi"])
+
+    def snapshot(self, market: str, now_ms: Optional[int] = None) -> Dict[str, Any]:
+        st = self.markets.get(market)
+        if st is None or st.bid is None or st.ask is None:
+            return {}
+        now_ms = st.ts_ms if now_ms is None else now_ms
+        st.mid_window.expire(now_ms)
+        st.trade_window.expire(now_ms)
+        bid, ask = st.bid, st.ask
+        mid = (bid + ask) / 2.0
+        out: Dict[str, Any] = {"mid": mid, "spread_bps": (ask - bid) / mid * 10_000 if mid else None,
+                               "ema_fast": st.ema_fast.value, "ema_slow": st.ema_slow.value,
+                               "rsi": st.rsi.value, "imbalance_l2": st.book_imbalance}
+        bs, as_ = st.bid_size, st.ask_size
+        if bs is not None and as_ is not None and bs + as_ > 0:
+            out["microprice"] = (bid * as_ + ask * bs) / (bs + as_)
+            out["imbalance_l1"] = (bs - as_) / (bs + as_)
+        sd = st.mid_window.std()
+        m = st.mid_window.mean()
+        out["zscore_mid"] = (mid - m) / sd if sd else None
+        tw = st.trade_window
+        qty, notional, signed = tw.sums
+        horizon_s = tw.horizon_ms / 1000.0
+        out["trade_intensity"] = len(tw) / horizon_s if horizon_s else None
+        if qty > 0:
+            vwap = notional / qty
+            out["vwap"] = vwap
+            out["vwap_drift_bps"] = (mid - vwap) / vwap * 10_000
+            out["buy_pressure"] = signed / qty
+        return out
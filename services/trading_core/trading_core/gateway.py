@@ -0,0 +1,291 @@
+"""
+Async order gateway for the Bitvavo REST API (v2).
+
+- One pooled `httpx.AsyncClient` (keep-alive) per gateway; `start()` opens
+  the first connection and measures the clock offset against `GET /time`.
+- Requests are signed with HMAC-SHA256 over timestamp + method + path + body.
+  The keyed HMAC and the static headers are built once; each request only
+  copies the HMAC state.
+- A token bucket follows Bitvavo's weight-based limit (1000 points per
+  minute per API key by default) and is corrected from the
+  `Bitvavo-Ratelimit-Remaining` / `-ResetAt` response headers; a 429 blocks
+  all requests until the reset.
+- Every order carries a `clientOrderId` (UUID). Retries reuse it, and after a
+  request whose outcome is unknown (timeout, dropped connection, 5xx) the
+  order is looked up by that id before it is sent again, so an order is
+  placed at most once. Only a 429 or a failed connect is known not to have
+  placed it.
+- A circuit breaker around order placement (blueprint §9) opens after
+  `breaker_failures` consecutive transport/5xx failures and lets one probe
+  through after `breaker_reset_s`.
+
+Requests run concurrently; the pool size bounds how many are in flight.
+"""
+import asyncio, hashlib, hmac, json, logging, random, socket, time, uuid
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from trading_core.metrics import (gateway_requests_total, gateway_request_seconds, gateway_ratelimit_wait_seconds,
+                                  gateway_breaker_open)
+
+log = logging.getLogger("trading_core.gateway")
+
+# request weights from the Bitvavo API docs
+WEIGHTS = {("GET", "/time"): 1, ("POST", "/order"): 1, ("GET", "/order"): 1, ("DELETE", "/order"): 1,
+           ("GET", "/orders"): 5, ("DELETE", "/orders"): 25, ("GET", "/balance"): 5}
+
+
+class GatewayError(Exception):
+    """Request failed. `status` is the HTTP status (0 for transport errors), `code` Bitvavo's errorCode."""
+
+    def __init__(self, msg: str, status: int = 0, code: Optional[int] = None, ambiguous: bool = False):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        # the request may have reached the exchange (timeout after sending, dropped connection)
+        self.ambiguous = ambiguous
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 0 or self.status == 429 or self.status >= 500
+
+
+class CircuitOpen(GatewayError):
+    pass
+
+
+class Signer:
+    def __init__(self, api_key: str, api_secret: str, access_window_ms: int = 10_000, prefix: str = "/v2"):
+        self._mac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+        self.prefix = prefix
+        self.headers = {"Bitvavo-Access-Key": api_key, "Bitvavo-Access-Window": str(access_window_ms),
+                        "Content-Type": "application/json"}
+
+    def sign(self, ts_ms: int, method: str, path: str, body: str = "") -> Dict[str, str]:
+        """`path` relative to the API base, including the query string."""
+        mac = self._mac.copy()
+        mac.update(f"{ts_ms}{method}{self.prefix}{path}{body}".encode())
+        h = dict(self.headers)
+        h["Bitvavo-Access-Timestamp"] = str(ts_ms)
+        h["Bitvavo-Access-Signature"] = mac.hexdigest()
+        return h
+
+
+class TokenBucket:
+    """Weight budget refilled continuously at `limit` per `window_s`, synced from the exchange's headers."""
+
+    def __init__(self, limit: int = 1000, window_s: float = 60.0):
+        self.limit = float(limit)
+        self.rate = limit / window_s
+        self.tokens = float(limit)
+        self.blocked_until = 0.0       # monotonic; set on 429 / exhausted budget
+        self._t = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.limit, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    async def acquire(self, weight: int = 1) -> float:
+        """Wait until `weight` points are available; returns the time waited."""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                delay = self.blocked_until - now
+            elif self.tokens >= weight:
+                self.tokens -= weight
+                return waited
+            else:
+                delay = (weight - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def sync(self, remaining: Optional[str], reset_at_ms: Optional[str], offset_ms: float = 0.0):
+        """Apply Bitvavo-Ratelimit-Remaining/-ResetAt (server epoch ms)."""
+        if remaining is None:
+            return
+        try:
+            rem = float(remaining)
+        except ValueError:
+            return
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, rem)
+        if rem < 1 and reset_at_ms:
+            self.block_until_reset(reset_at_ms, offset_ms)
+
+    def block_until_reset(self, reset_at_ms: Optional[str], offset_ms: float = 0.0):
+        try:
+            wait = (float(reset_at_ms) - offset_ms) / 1000.0 - time.time() if reset_at_ms else 1.0
+        except ValueError:
+            wait = 1.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, wait))
+        self.tokens = 0.0
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures -> half_open after `reset_s` -> closed on success."""
+
+    def __init__(self, failures: int = 5, reset_s: float = 30.0):
+        self.max_failures = failures
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+        gateway_breaker_open.set(0)
+
+    def failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.opened_at is None:
+                log.warning("order circuit breaker open after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+            gateway_breaker_open.set(1)
+
+
+class OrderGateway:
+    def __init__(self, rest_base: str, api_key: str, api_secret: str, cfg: Optional[Dict[str, Any]] = None):
+        cfg = cfg or {}
+        base = rest_base.rstrip("/")
+        prefix = httpx.URL(base).path.rstrip("/")
+        self.signer = Signer(api_key, api_secret, int(cfg.get("access_window_ms", 10_000)), prefix)
+        pool = int(cfg.get("max_connections", 8))
+        limits = httpx.Limits(max_connections=pool, max_keepalive_connections=pool,
+                              keepalive_expiry=float(cfg.get("keepalive_s", 60.0)))
+        # httpcore writes headers and body separately; without TCP_NODELAY the body waits for a delayed ACK
+        transport = httpx.AsyncHTTPTransport(limits=limits, socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+        self.client = httpx.AsyncClient(base_url=base, timeout=float(cfg.get("timeout_s", 5.0)), transport=transport)
+        self.bucket = TokenBucket(int(cfg.get("rate_limit_per_min", 1000)))
+        self.breaker = CircuitBreaker(int(cfg.get("breaker_failures", 5)), float(cfg.get("breaker_reset_s", 30.0)))
+        self.retries = int(cfg.get("retries", 2))
+        self.operator_id = cfg.get("operator_id")
+        self.offset_ms = 0.0           # server clock - local clock
+
+    async def start(self):
+        """Open a pooled connection and measure the clock offset (signatures are checked against server time)."""
+        t0 = time.time()
+        data, _ = await self.request("GET", "/time")
+        t1 = time.time()
+        self.offset_ms = float(data["time"]) - (t0 + t1) * 500.0
+        log.info("order gateway ready (clock offset %.0f ms)", self.offset_ms)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                      body: Optional[Dict[str, Any]] = None) -> Tuple[Any, int]:
+        """One signed request; returns (json, status) or raises GatewayError."""
+        endpoint = f"{method} {path}"
+        waited = await self.bucket.acquire(WEIGHTS.get((method, path), 1))
+        if waited:
+            gateway_ratelimit_wait_seconds.observe(waited)
+        url = httpx.URL(path, params=params) if params else httpx.URL(path)
+        target = url.raw_path.decode()
+        payload = json.dumps(body, separators=(",", ":")) if body is not None else ""
+        headers = self.signer.sign(int(time.time() * 1000 + self.offset_ms), method, target, payload)
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client.request(method, target, content=payload or None, headers=headers)
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+            gateway_requests_total.labels(endpoint, "transport").inc()
+            # a connect failure never reached the exchange; anything later might have
+            raise GatewayError(f"{endpoint}: {type(e).__name__}", ambiguous=not isinstance(e, httpx.ConnectError))
+        finally:
+            gateway_request_seconds.labels(endpoint).observe(time.perf_counter() - t0)
+        h = resp.headers
+        self.bucket.sync(h.get("bitvavo-ratelimit-remaining"), h.get("bitvavo-ratelimit-resetat"), self.offset_ms)
+        gateway_requests_total.labels(endpoint, str(resp.status_code)).inc()
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        if resp.status_code >= 400:
+            code = data.get("errorCode") if isinstance(data, dict) else None
+            msg = data.get("error") if isinstance(data, dict) else resp.text[:200]
+            if resp.status_code == 429:
+                self.bucket.block_until_reset(h.get("bitvavo-ratelimit-resetat"), self.offset_ms)
+            # a 5xx from the edge can follow an accepted order
+            raise GatewayError(f"{endpoint}: {resp.status_code} {msg}", resp.status_code, code,
+                               ambiguous=resp.status_code >= 500)
+        return data, resp.status_code
+
+    async def find_order(self, market: str, client_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            data, _ = await self.request("GET", "/order", params={"market": market, "clientOrderId": client_id})
+        except GatewayError as e:
+            if 400 <= e.status < 500 and e.status != 429:
+                return None            # unknown order
+            raise
+        return data
+
+    async def place_order(self, market: str, side: str, order_type: str = "market", amount: Optional[str] = None,
+                          amount_quote: Optional[str] = None, price: Optional[str] = None,
+                          client_id: Optional[str] = None, **extra) -> Dict[str, Any]:
+        """
+        POST /order with retries under one `clientOrderId`. Amounts and prices
+        are passed as strings, already rounded to the market's precision.
+        Raises CircuitOpen while the breaker is open, GatewayError otherwise.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen("order circuit open")
+        client_id = client_id or str(uuid.uuid4())
+        body: Dict[str, Any] = {"market": market, "side": side, "orderType": order_type, "clientOrderId": client_id}
+        if amount is not None:
+            body["amount"] = amount
+        if amount_quote is not None:
+            body["amountQuote"] = amount_quote
+        if price is not None:
+            body["price"] = price
+        if self.operator_id is not None:
+            body["operatorId"] = int(self.operator_id)
+        body.update(extra)
+        ambiguous = False
+        for attempt in range(self.retries + 1):
+            try:
+                if ambiguous:
+                    found = await self.find_order(market, client_id)
+                    if found:
+                        self.breaker.success()
+                        return found
+                data, _ = await self.request("POST", "/order", body=body)
+                self.breaker.success()
+                return data
+            except GatewayError as e:
+                if not e.retryable:
+                    # the exchange answered (e.g. insufficient balance): not a gateway failure
+                    self.breaker.success()
+                    raise
+                if e.status != 429:
+                    self.breaker.failure()
+                ambiguous = ambiguous or e.ambiguous
+                if attempt == self.retries or not self.breaker.allow():
+                    # the order may still exist on the exchange under client_id
+                    e.ambiguous = ambiguous
+                    raise
+                log.warning("order %s %s attempt %d failed: %s", market, client_id, attempt + 1, e)
+                await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * (0.5 + random.random()))
+        raise GatewayError("unreachable")
+
+    async def cancel_order(self, market: str, order_id: str) -> Dict[str, Any]:
+        data, _ = await self.request("DELETE", "/order", params={"market": market, "orderId": order_id})
+        return data
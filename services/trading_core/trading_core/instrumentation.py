@@ -0,0 +1,258 @@
+"""
+Runtime health and on-demand profiling.
+
+The services are self-contained, so each keeps a copy of this module
+(ws_public_ingest/app, trading_core/trading_core, market_selection/app);
+`make ci` (ci/check_shared_copies.py) fails when they differ. Only stdlib
+and prometheus_client are used.
+
+- loop lag: a task (asyncio) or thread (sync services) that sleeps
+  `lag_interval_s` and records how late it woke up
+- slow callbacks: a watchdog thread notices when the event loop has not
+  ticked for `slow_callback_ms` and logs the loop thread's stack once
+- GC pauses per generation (gc.callbacks) and peak RSS (/proc/self/status)
+- sampling profiler: SIGUSR2 samples all threads at `profile_hz` and
+  writes folded stacks ("frame;frame;frame count" lines, the input format
+  of flamegraph.pl and speedscope) to `profile_dir`. With `profile_http`
+  (off by default) `GET /debug/profile?seconds=N` returns them; it is
+  served on its own listener bound to 127.0.0.1 (`profile_http_port`,
+  default metrics port + 1000), never on the metrics port: whoever can
+  reach it makes the live process sample itself for up to
+  `profile_max_seconds`.
+"""
+import asyncio, gc, logging, os, signal, sys, threading, time
+from collections import Counter as Tally
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.exposition import MetricsHandler
+
+log = logging.getLogger(__name__)
+
+_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+_GC_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+def sample_profile(seconds: float, hz: float = 100.0, skip_thread: Optional[int] = None) -> Tally:
+    """Sample every thread's stack for `seconds`; returns {folded stack: samples}."""
+    stacks: Tally = Tally()
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    interval = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for tid, frame in sys._current_frames().items():
+            if tid in (me, skip_thread):
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            parts.append(names.get(tid, str(tid)))
+            stacks[";".join(reversed(parts))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def folded(stacks: Tally) -> str:
+    return "".join(f"{k} {v}\n" for k, v in stacks.most_common())
+
+
+class Instrumentation:
+    def __init__(self, prefix: str, cfg: Optional[Dict[str, Any]] = None):
+        cfg = cfg or {}
+        self.prefix = prefix
+        self.enabled = bool(cfg.get("enabled", True))
+        self.lag_interval = float(cfg.get("lag_interval_s", 0.5))
+        self.slow_callback = float(cfg.get("slow_callback_ms", 100)) / 1000.0
+        self.profile_hz = float(cfg.get("profile_hz", 100))
+        self.profile_seconds = float(cfg.get("profile_seconds", 30))
+        self.profile_max_seconds = float(cfg.get("profile_max_seconds", 120))
+        self.profile_dir = cfg.get("profile_dir", "/tmp")
+        self.profile_http = bool(cfg.get("profile_http", False))
+        self.profile_http_port = int(cfg.get("profile_http_port") or 0)
+        self._profiling = threading.Lock()
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+
+        self.loop_lag = Gauge(f"{prefix}_loop_lag_seconds", "Last measured event-loop (or main thread) wake-up lag")
+        self.loop_lag_hist = Histogram(f"{prefix}_loop_lag_hist_seconds", "Event-loop wake-up lag",
+                                       buckets=_LAG_BUCKETS)
+        self.slow_callbacks = Counter(f"{prefix}_slow_callbacks_total",
+                                      "Event-loop stalls longer than slow_callback_ms")
+        self.gc_pause = Histogram(f"{prefix}_gc_pause_seconds", "Garbage collector pause", ["generation"],
+                                  buckets=_GC_BUCKETS)
+        self.rss_peak = Gauge(f"{prefix}_rss_peak_bytes", "Peak resident set size (VmHWM)")
+        self.profiles = Counter(f"{prefix}_profiles_total", "On-demand profiles taken", ["trigger"])
+        # current RSS is already exported by prometheus_client as process_resident_memory_bytes
+
+    # ---------- install ----------
+
+    def install(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Start the monitors. Pass the running loop from asyncio services; sync services pass None."""
+        if not self.enabled:
+            return
+        self._install_gc()
+        self._install_signal()
+        threading.Thread(target=self._rss_loop, name="instr-rss", daemon=True).start()
+        if loop is not None:
+            self._loop_thread = threading.get_ident()
+            loop.create_task(self._loop_lag())
+            threading.Thread(target=self._watchdog, name="instr-watchdog", daemon=True).start()
+        else:
+            threading.Thread(target=self._thread_lag, name="instr-lag", daemon=True).start()
+
+    def _install_gc(self):
+        started: Dict[int, float] = {}
+
+        def cb(phase, info):
+            gen = info.get("generation", 0)
+            if phase == "start":
+                started[gen] = time.perf_counter()
+            elif gen in started:
+                self.gc_pause.labels(str(gen)).observe(time.perf_counter() - started.pop(gen))
+
+        gc.callbacks.append(cb)
+
+    def _install_signal(self):
+        if not hasattr(signal, "SIGUSR2") or threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGUSR2, lambda *_: self.profile_to_file("signal"))
+
+    # ---------- monitors ----------
+
+    def _observe_lag(self, lag: float):
+        lag = max(0.0, lag)
+        self.loop_lag.set(lag)
+        self.loop_lag_hist.observe(lag)
+
+    async def _loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            self._observe_lag(loop.time() - t0 - self.lag_interval)
+
+    def _thread_lag(self):
+        # sync services: a late wake-up here means the GIL was held (busy main thread or C extension)
+        while True:
+            t0 = time.monotonic()
+            time.sleep(self.lag_interval)
+            self._observe_lag(time.monotonic() - t0 - self.lag_interval)
+
+    def _watchdog(self):
+        reported = False
+        step = max(0.01, min(self.slow_callback / 4, 0.05))
+        while True:
+            time.sleep(step)
+            stalled = time.monotonic() - self._beat - self.lag_interval
+            if stalled < self.slow_callback:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            self.slow_callbacks.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = []
+            while frame is not None and len(stack) < 30:
+                stack.append(f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}")
+                frame = frame.f_back
+            log.warning("event loop blocked for >%.0f ms; loop thread is in:\n  %s",
+                        stalled * 1000, "\n  ".join(reversed(stack)))
+
+    def _rss_loop(self):
+        while True:
+            try:
+                with open("/proc/self/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            self.rss_peak.set(int(line.split()[1]) * 1024)
+                            break
+            except OSError:
+                return  # not Linux
+            time.sleep(10)
+
+    # ---------- profiling ----------
+
+    def profile(self, seconds: float, trigger: str) -> Optional[str]:
+        """Folded stacks for `seconds`, or None if a profile is already running."""
+        if not self._profiling.acquire(blocking=False):
+            return None
+        try:
+            self.profiles.labels(trigger).inc()
+            seconds = min(max(0.1, seconds), self.profile_max_seconds)
+            return folded(sample_profile(seconds, self.profile_hz))
+        finally:
+            self._profiling.release()
+
+    def profile_to_file(self, trigger: str = "signal"):
+        def run():
+            out = self.profile(self.profile_seconds, trigger)
+            if out is None:
+                log.warning("profile already running")
+                return
+            path = os.path.join(self.profile_dir, f"{self.prefix}-{os.getpid()}-{int(time.time())}.folded")
+            with open(path, "w") as f:
+                f.write(out)
+            log.info("profile written to %s", path)
+
+        threading.Thread(target=run, name="instr-profile", daemon=True).start()
+
+    # ---------- HTTP ----------
+
+    def start_http_server(self, port: int, addr: str = "0.0.0.0"):
+        """
+        Prometheus metrics on addr:`port`. With profile_http on, GET
+        /debug/profile?seconds=N is served separately on
+        127.0.0.1:`profile_http_port` (default `port` + 1000).
+        """
+        server = ThreadingHTTPServer((addr, port), MetricsHandler.factory(REGISTRY))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="instr-http", daemon=True).start()
+        if self.enabled and self.profile_http:
+            debug_port = self.profile_http_port or port + 1000
+            try:
+                self._serve_profile("127.0.0.1", debug_port)
+                log.info("profile endpoint on http://127.0.0.1:%d/debug/profile", debug_port)
+            except OSError as e:
+                # e.g. a fixed profile_http_port shared by shard worker processes; SIGUSR2 still works
+                log.warning("profile endpoint not started on 127.0.0.1:%d: %s", debug_port, e)
+        return server
+
+    def _serve_profile(self, addr: str, port: int):
+        instr = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/debug/profile":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                try:
+                    seconds = float(parse_qs(url.query).get("seconds", [instr.profile_seconds])[0])
+                except ValueError:
+                    seconds = instr.profile_seconds
+                out = instr.profile(seconds, "http")
+                if out is None:
+                    self.send_response(409)
+                    self.end_headers()
+                    self.wfile.write(b"profile already running\n")
+                    return
+                body = out.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="instr-profile-http", daemon=True).start()
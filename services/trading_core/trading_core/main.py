@@ -1,11 +1,21 @@
-import asyncio, json, os, time, logging, yaml
+import asyncio, os, signal, socket, time, logging, yaml
 from pathlib import Path
-from typing import Dict, Any
-from prometheus_client import start_http_server
-from trading_core.redis_io import RedisIngest
-from trading_core.decision import compute_signal, Decision
+from typing import Dict, Any, List
+from trading_core.redis_io import RedisIngest, entry_ms
+from trading_core.artifacts import SelectionWatcher
+from trading_core.cooldown import Cooldown
+from trading_core.decision import compute_signal, compute_signal_batch, Decision, SignalColumns
 from trading_core.executor import PaperExecutor, BitvavoExecutor
-from trading_core.metrics import decision_runs_total, signals_total, orders_total, last_run_ts, open_positions
+from trading_core.book import BookManager, BitvavoRestBookSource, ticker_view
+from trading_core.features import FeatureEngine
+from trading_core.instrumentation import Instrumentation
+from trading_core.pnl import PnlEngine
+from trading_core.state import StateStore
+from trading_core.metrics import (decision_runs_total, signals_total, orders_total, last_run_ts, open_positions,
+                                  tick_to_decision, events_consumed_total, exchange_to_ingest, ingest_to_redis,
+                                  redis_to_decision, order_latency_ms, paper_fills_total, paper_fees_eur,
+                                  paper_realized_pnl_eur, state_snapshot_bytes, state_snapshot_seconds,
+                                  state_restored_age_seconds)
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL","INFO"))
 log = logging.getLogger("trading_core")
@@ -14,88 +24,348 @@ def load_cfg(path: str) -> Dict[str, Any]:
     with open(path, "r") as f:
         return yaml.safe_load(f)
 
-def load_selection(path: str):
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except Exception as e:
-        log.warning("No selection file yet: %s", e)
-        return []
-
-class Cooldown:
-    def __init__(self, seconds: int):
-        self.seconds = seconds
-        self._last = {}
-
-    def hit(self, market: str) -> bool:
-        t = self._last.get(market, 0)
-        return time.time() - t < self.seconds
-
-    def set(self, market: str):
-        self._last[market] = time.time()
+def _log_task_exit(task: asyncio.Task):
+    # a background task should only end by cancellation at shutdown
+    if not task.cancelled() and task.exception() is not None:
+        log.error("background task %s failed", task.get_name(), exc_info=task.exception())
 
 async def run(cfg_path: str):
     cfg = load_cfg(cfg_path)
-    start_http_server(cfg["http"]["port"], addr=cfg["http"]["host"])
+    instr = Instrumentation("trading_core", cfg.get("instrumentation"))
+    instr.start_http_server(cfg["http"]["port"], addr=cfg["http"]["host"])
+    instr.install(asyncio.get_running_loop())
     log.info("Metrics HTTP on %s:%s", cfg["http"]["host"], cfg["http"]["port"])
 
     ri = RedisIngest(cfg["redis_url"])
     await ri.connect()
 
-    selection_file = cfg["selection_file"]
+    # background tasks are kept here so they are not garbage-collected and can be cancelled at shutdown
+    tasks: List[asyncio.Task] = []
+
+    def background(coro, name: str):
+        task = asyncio.create_task(coro, name=name)
+        task.add_done_callback(_log_task_exit)
+        tasks.append(task)
+
     exec_mode = cfg["execution"]["mode"]
     notional = float(cfg["risk"]["notional_per_trade_eur"])
     tp = float(cfg["risk"]["take_profit_pct"])
     sl = float(cfg["risk"]["stop_loss_pct"])
     cooldown = Cooldown(int(cfg["signals"]["cooldown_s"]))
 
+    max_positions = int(cfg["risk"]["max_open_positions"])
+    positions = {}
+    signal_params = {
+        "max_spread_bps": cfg["signals"]["max_spread_bps"],
+        "min_book_depth_eur": cfg["signals"]["min_book_depth_eur"],
+    }
+    poll_sleep = cfg.get("poll_interval_ms", 500)/1000.0
+    mode = cfg.get("mode", "poll")
+
+    # vectorized gates over columns the event loop keeps current (events mode only); below a handful of
+    # markets the per-market path is cheaper, see bench/decision.py
+    batch_min = int(cfg["signals"].get("batch_min_markets", 16))
+    columns = SignalColumns() if mode == "events" else None
+
+    # selection file is only re-parsed when it changes; Redis pubsub delivers new selections right away
+    selection = SelectionWatcher(cfg["selection_file"], check_interval_s=poll_sleep)
+    if cfg.get("selection_redis", True):
+        background(ri.follow_selection(selection), "selection")
+    if not selection.get():
+        log.warning("No selection yet (%s)", cfg["selection_file"])
+
+    # local L2 books, fed from ws:book in events mode
+    book_cfg = cfg.get("book") or {}
+    books = None
+    if book_cfg.get("enabled", True):
+        source = BitvavoRestBookSource(cfg["execution"]["bitvavo"]["rest_base"]) \
+            if book_cfg.get("source", "rest") == "rest" else None
+        books = BookManager(source, depth=int(book_cfg.get("depth", 100)), levels=int(book_cfg.get("levels", 10)),
+                            on_resync=(lambda m: columns.set_book(m, books.view(m))) if columns is not None else None)
+
+    feat_cfg = cfg.get("features") or {}
+    features = FeatureEngine(feat_cfg) if feat_cfg.get("enabled", True) else None
+
     if exec_mode == "paper":
-        executor = PaperExecutor(notional, tp, sl)
+        # simulated matching against the local books; TP/SL exits come from the event hooks below
+        executor = PaperExecutor(notional, tp, sl, books=books, cfg=cfg.get("paper"))
     else:
-        executor = BitvavoExecutor(cfg["execution"]["bitvavo"])
+        executor = BitvavoExecutor(cfg["execution"]["bitvavo"], notional)
+        await executor.start()
+    sim = executor if isinstance(executor, PaperExecutor) else None
 
-    max_positions = int(cfg["risk"]["max_open_positions"])
-    positions = {}
+    # day PnL and the -2% pause; gauges are published from their own task
+    pnl_cfg = cfg.get("pnl") or {}
+    pnl = PnlEngine(float(pnl_cfg.get("start_balance_eur", 1000)), float(pnl_cfg.get("pause_pct", -2.0)),
+                    float(pnl_cfg.get("pause_minutes", 60)), float(pnl_cfg.get("guard_minutes", 30)),
+                    float(pnl_cfg.get("guard_size_factor", 0.5)))
+    background(pnl.run_publisher(float(pnl_cfg.get("publish_interval_s", 1.0))), "pnl_publisher")
 
-    poll_sleep = cfg.get("poll_interval_ms", 500)/1000.0
+    ev = cfg.get("events") or {}
+    streams = list(ev.get("streams") or ["ws:ticker", "ws:book"])
+    group = ev.get("group") or None
+    # a stable consumer name lets a restarted process pick up its own unacked entries
+    consumer = ev.get("consumer") or socket.gethostname()
+    resume_gap_s = float(ev.get("resume_max_gap_s", 120))
+    last_ids = None if group else {s: "$" for s in streams}
 
-    while True:
-        decision_runs_total.inc()
-        last_run_ts.set(time.time())
+    # warm restart: positions, cooldowns, PnL, paper/live executor state, feature windows, XREAD offsets
+    state_cfg = cfg.get("state") or {}
+    store = None
+    if state_cfg.get("enabled", True):
+        store = StateStore(state_cfg.get("path") or None, ri.client if state_cfg.get("redis", True) else None,
+                           state_cfg.get("key", "trading_core:state"))
+        t0 = time.perf_counter()
+        snap = await store.load()
+        if snap:
+            age_s = time.time() - snap["ts"] / 1000.0
+            state_restored_age_seconds.set(age_s)
+            positions.update(snap.get("positions") or {})
+            cooldown.restore(snap.get("cooldowns") or {})
+            pnl.restore(snap.get("pnl") or {})
+            if snap.get("exec_mode") == exec_mode:
+                executor.restore(snap.get("executor") or {})
+            # windows older than their horizon would expire anyway; EMAs/RSI would be stale
+            if features is not None and age_s <= float(state_cfg.get("features_max_age_s", 300)):
+                features.restore(snap.get("features") or {})
+            offsets = snap.get("offsets") or {}
+            if last_ids is not None and age_s <= resume_gap_s and set(offsets) >= set(streams):
+                last_ids = {s: offsets[s] for s in streams}
+            open_positions.set(len(positions))
+            log.info("restored state from %.1fs ago in %.0f ms (%d positions, %d cooldowns, %d feature markets)",
+                     age_s, (time.perf_counter() - t0) * 1000, len(positions), len(snap.get("cooldowns") or {}),
+                     len(snap.get("features") or {}))
+
+    def export_state() -> Dict[str, Any]:
+        # copies only: the snapshot is packed off the event loop
+        return {"ts": int(time.time() * 1000), "exec_mode": exec_mode,
+                "positions": {m: dict(p) for m, p in positions.items()}, "cooldowns": cooldown.export(),
+                "pnl": pnl.export(), "executor": executor.export(),
+                "features": features.export() if features is not None else {},
+                "offsets": dict(last_ids) if last_ids else {}}
+
+    async def save_state():
+        t0 = time.perf_counter()
+        try:
+            state_snapshot_bytes.set(await store.save(export_state()))
+        except Exception:
+            log.exception("state snapshot failed")
+        state_snapshot_seconds.observe(time.perf_counter() - t0)
 
-        selection = load_selection(selection_file)
-        markets = [m if isinstance(m, str) else m.get("market") for m in selection]
-        markets = [m for m in markets if m]
+    async def snapshot_loop(interval_s: float):
+        while True:
+            await asyncio.sleep(interval_s)
+            await save_state()
 
+    if store is not None:
+        background(snapshot_loop(float(state_cfg.get("interval_s", 5))), "state_snapshot")
+
+    def on_fills(fills):
+        for f in fills:
+            pnl.on_fill(f.market, f.side, f.price, f.size, f.fee, f.ts)
+            paper_fills_total.labels(f.liquidity, f.reason).inc()
+            paper_fees_eur.inc(f.fee)
+            pos = sim.position(f.market)
+            if pos is None:
+                positions.pop(f.market, None)
+            else:
+                positions[f.market] = {"entry_price": pos.entry_price, "size": pos.size}
+        if fills:
+            paper_realized_pnl_eur.set(sim.engine.realized_pnl)
+            open_positions.set(len(positions))
+
+    async def decide(markets, tick_ms=None, tick_ch=None):
+        """tick_ms/tick_ch: per market the stream entry time and channel that triggered this run."""
+        decision_runs_total.inc()
+        now = time.time()
+        last_run_ts.set(now)
         open_positions.set(len(positions))
+        now_ms = int(now * 1000)
+
+        if columns is not None and len(markets) >= batch_min:
+            # markets that had no ticker event since start take their last price from the latest key once
+            missing = columns.without_ticker(markets)
+            if missing:
+                for market, snapshot in (await ri.read_latest_many(missing)).items():
+                    columns.set_ticker(market, snapshot.get("ticker"))
+            signals = compute_signal_batch(columns.select(markets), signal_params).entries()
+        else:
+            snapshots = await ri.read_latest_many(markets)
+            for market in markets:
+                snapshot = snapshots.setdefault(market, {})
+                view = books.view(market) if books else None
+                if view is None and mode != "events":
+                    # no ws:book in poll mode: BBO and top-of-book sizes from the latest ticker
+                    view = ticker_view(snapshot.get("ticker"))
+                if view is not None:
+                    snapshot["book"] = view
+                if features is not None:
+                    snapshot["features"] = features.snapshot(market)
+                if mode != "events":
+                    # poll mode has no stream events: marks and TP/SL from the latest ticker
+                    ticker = snapshot.get("ticker") or {}
+                    pnl.on_ticker(market, now_ms, ticker)
+                    if sim is not None:
+                        on_fills(sim.on_ticker(market, now_ms, ticker))
+            signals = [d for d in (compute_signal(m, snapshots[m], signal_params) for m in markets) if d.side]
+        by_market = {d.market: d for d in signals}
+
+        entries_ok = pnl.allow_entry(now_ms)
+        size = notional * pnl.size_factor(now_ms)
+
+        async def submit(market: str, d: Decision, channel: str):
+            t_order = time.perf_counter()
+            res = await executor.place_order(market, d.side, d.price or 0.0, notional=size)
+            order_latency_ms.labels(channel).observe((time.perf_counter() - t_order) * 1000.0)
+            orders_total.labels(mode=exec_mode, market=market, ok=str(res.ok)).inc()
+            if res.ok and res.filled_size:
+                pnl.on_fill(market, d.side, res.filled_price, res.filled_size, res.fee, int(time.time() * 1000))
+
+            if res.ok and d.side == "buy":
+                cooldown.set(market)
+                if res.filled_size:
+                    if sim is not None:
+                        paper_fills_total.labels(res.liquidity, "entry").inc()
+                        paper_fees_eur.inc(res.fee)
+                        pos = sim.position(market)
+                        positions[market] = {"entry_price": pos.entry_price, "size": pos.size}
+                    else:
+                        positions[market] = {"entry_price": res.filled_price, "size": res.filled_size}
+                    open_positions.set(len(positions))
 
+        orders = []
         for market in markets:
-            if market in positions and len(positions) >= max_positions:
-                continue
+            channel = tick_ch.get(market, "unknown") if tick_ch else "poll"
+            if tick_ms and market in tick_ms:
+                waited = max(0.0, time.time() - tick_ms[market] / 1000.0)
+                tick_to_decision.labels(mode).observe(waited)
+                redis_to_decision.labels(channel).observe(waited)
 
-            snapshot = await ri.read_latest(market)
-            d: Decision = compute_signal(market, snapshot, {
-                "max_spread_bps": cfg["signals"]["max_spread_bps"],
-                "min_book_depth_eur": cfg["signals"]["min_book_depth_eur"],
-            })
+            # one position per market, and no new entries at the max_open_positions limit
+            if market in positions or len(positions) >= max_positions:
+                continue
 
-            if not d.side:
+            d = by_market.get(market)
+            if d is None or (d.side == "buy" and not entries_ok):
                 continue
 
             if cooldown.hit(market):
                 continue
 
             signals_total.labels(side=d.side, reason=d.reason).inc()
+            orders.append(submit(market, d, channel))
 
-            res = await executor.place_order(market, d.side, d.price or 0.0)
-            orders_total.labels(mode=exec_mode, market=market, ok=str(res.ok)).inc()
+        # orders for different markets go out concurrently (the live gateway pools connections)
+        if orders:
+            await asyncio.gather(*orders)
 
-            if res.ok and d.side == "buy":
-                positions[market] = {"entry_price": res.filled_price, "size": res.filled_size}
-                cooldown.set(market)
-                open_positions.set(len(positions))
+    # SIGTERM (systemd stop) / Ctrl-C end the loop between reads, never in the middle of
+    # submitting orders, and the final snapshot below is written on the way out
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    try:
+        if mode != "events":
+            while not stop.is_set():
+                selection.changed.clear()
+                await decide(selection.get())
+                # a new selection starts the next run early
+                waits = [asyncio.ensure_future(selection.changed.wait()), asyncio.ensure_future(stop.wait())]
+                _, idle = await asyncio.wait(waits, timeout=poll_sleep, return_when=asyncio.FIRST_COMPLETED)
+                for w in idle:
+                    w.cancel()
+            return
+
+        # Event-driven: block on the ingest streams and only re-evaluate markets that changed.
+        block_ms = int(ev.get("block_ms", 1000))
+        count = int(ev.get("count", 1000))
+        pending = False
+        if group:
+            await ri.ensure_group(streams, group)
+            gaps = await ri.resume_group(streams, group, resume_gap_s)
+            if gaps:
+                log.info("resuming group %s; ms behind per stream: %s", group, gaps)
+            pending = True
+        log.info("Event-driven mode on %s (group=%s consumer=%s)", streams, group, consumer)
+
+        while not stop.is_set():
+            try:
+                events = await ri.read_events(streams, block_ms, count, group, consumer, last_ids, pending)
+            except Exception:
+                log.exception("stream read failed; retrying")
+                await asyncio.sleep(poll_sleep)
+                continue
+            markets = selection.get()
+            if not events:
+                # our unacked entries from before a restart are done; continue with new ones
+                pending = False
+                continue
 
-        await asyncio.sleep(poll_sleep)
+            selected = set(markets)
+            tick_ms: Dict[str, int] = {}
+            tick_ch: Dict[str, str] = {}
+            for stream, entry_id, payload, recv_ms in events:
+                events_consumed_total.labels(stream).inc()
+                m = payload.get("market")
+                ts = entry_ms(entry_id)
+                channel = stream[3:] if stream.startswith("ws:") else stream
+                if recv_ms:
+                    ingest_to_redis.labels(channel).observe(max(0.0, (ts - recv_ms) / 1000.0))
+                    # only trades carry an exchange timestamp on Bitvavo's public feed
+                    xt = payload.get("timestamp")
+                    if xt:
+                        exchange_to_ingest.labels(channel).observe(max(0.0, (recv_ms - int(xt)) / 1000.0))
+                if stream == "ws:book":
+                    if books is None:
+                        continue
+                    if not books.on_event(payload):
+                        if columns is not None and m and books.get(m) is None:
+                            columns.set_book(m, None)      # gap: no BBO until the resync lands
+                        continue
+                    view = books.view(m)
+                    if columns is not None:
+                        columns.set_book(m, view)
+                    if features is not None:
+                        features.on_book_view(m, ts, view or {})
+                    if sim is not None:
+                        on_fills(sim.on_book(m, ts))
+                elif stream == "ws:ticker":
+                    if columns is not None and m:
+                        columns.set_ticker(m, payload)
+                    if features is not None and m:
+                        features.on_ticker(m, ts, payload)
+                    pnl.on_ticker(m, ts, payload)
+                    if sim is not None and m:
+                        on_fills(sim.on_ticker(m, ts, payload))
+                elif stream == "ws:trade":
+                    # trades only move features and maker queues; BBO changes drive decisions
+                    if m:
+                        t_ms = int(payload.get("timestamp") or ts)
+                        if features is not None:
+                            features.on_trade(m, t_ms, payload.get("price"), payload.get("amount"), payload.get("side"))
+                        if sim is not None:
+                            on_fills(sim.on_trade(m, t_ms, payload.get("price"), payload.get("amount"),
+                                                  payload.get("side")))
+                    continue
+                if m in selected and m not in tick_ms:
+                    tick_ms[m] = ts
+                    tick_ch[m] = channel
+            if tick_ms:
+                await decide([m for m in markets if m in tick_ms], tick_ms, tick_ch)
+            if group:
+                await ri.ack(group, events)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if store is not None:
+            await save_state()
+            log.info("state snapshot written")
+        # book resync tasks and the REST clients (book snapshots, live order gateway)
+        if books is not None:
+            await books.close()
+        await executor.close()
+        await ri.close()
 
 def main():
     cfg_path = os.environ.get("TRADING_CORE_CONFIG", str(Path(__file__).with_name("config.yml")))
@@ -0,0 +1,271 @@
+"""
+Simulated exchange for paper trading and replay, matched against the local
+L2 books of `book.BookManager`.
+
+- Taker orders walk the opposite side from the touch outwards, at most
+  `max_slippage_bps` past it. The live book is not consumed: simulated
+  orders are assumed small next to the displayed size.
+- Maker orders are post-only limits joining the touch (best bid for a buy).
+  The queue ahead starts at the level's size. It shrinks with trades at
+  our price and, pro rata, when the level shrinks without a trade
+  (cancellations are as likely ahead of us as behind). A trade through our
+  price or a crossed book fills the rest. Unfilled orders expire after
+  `maker_timeout_s`.
+- Fees are charged in bps of notional (Bitvavo base tier: 25 taker, 15 maker).
+- Positions are long-only, like the strategy. Each gets TP/SL prices from
+  its average entry and is closed with a taker sell once the best bid
+  reaches either of them.
+
+All hooks take the event time (`ts`, epoch ms), so the same engine runs
+inline in the live loop and inside replay.
+"""
+import itertools
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+_EPS = 1e-12
+
+
+@dataclass
+class Fill:
+    ts: int
+    market: str
+    side: str
+    price: float
+    size: float
+    fee: float
+    liquidity: str              # taker | maker
+    reason: str                 # entry | tp | sl | close
+    order_id: str
+    pnl: Optional[float] = None  # realized on sells, net of entry and exit fees
+
+
+@dataclass
+class Position:
+    market: str
+    size: float
+    notional: float             # entry cost excluding fees
+    fees: float                 # entry fees
+    ts: int
+    tp_price: float = 0.0
+    sl_price: float = 0.0
+
+    @property
+    def entry_price(self) -> float:
+        return self.notional / self.size if self.size > 0 else 0.0
+
+
+class RestingOrder:
+    __slots__ = ("id", "market", "side", "price", "size", "filled", "queue_ahead", "level", "expires")
+
+    def __init__(self, oid: str, market: str, side: str, price: float, size: float, level: float, expires: int):
+        self.id = oid
+        self.market = market
+        self.side = side
+        self.price = price
+        self.size = size
+        self.filled = 0.0
+        self.queue_ahead = level
+        self.level = level          # last seen size of our price level
+        self.expires = expires
+
+    @property
+    def remaining(self) -> float:
+        return self.size - self.filled
+
+
+class MatchingEngine:
+    def __init__(self, books=None, taker_fee_bps: float = 25.0, maker_fee_bps: float = 15.0,
+                 tp_pct: float = 0.30, sl_pct: float = 0.25, max_slippage_bps: float = 50.0,
+                 maker_timeout_s: float = 30.0):
+        self.books = books
+        self.taker_fee = taker_fee_bps / 10_000
+        self.maker_fee = maker_fee_bps / 10_000
+        self.tp = tp_pct / 100.0
+        self.sl = sl_pct / 100.0
+        self.slippage = max_slippage_bps / 10_000
+        self.maker_timeout_ms = int(maker_timeout_s * 1000)
+        self.positions: Dict[str, Position] = {}
+        self.orders: Dict[str, List[RestingOrder]] = {}
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self._ids = itertools.count(1)
+
+    def _book(self, market: str):
+        return self.books.get(market) if self.books is not None else None
+
+    def has_book(self, market: str) -> bool:
+        return self._book(market) is not None
+
+    def _oid(self) -> str:
+        return f"sim-{next(self._ids)}"
+
+    # ---------- orders ----------
+
+    def market_order(self, market: str, side: str, ts: int, quote: Optional[float] = None,
+                     size: Optional[float] = None, reason: str = "entry") -> Optional[Fill]:
+        """Taker order for `quote` EUR or `size` base; None without a synced book or liquidity."""
+        book = self._book(market)
+        if book is None:
+            return None
+        levels = book.asks if side == "buy" else book.bids
+        best = levels.best()[0]
+        if best is None:
+            return None
+        limit = best * (1 + self.slippage) if side == "buy" else best * (1 - self.slippage)
+        filled, notional = levels.walk(size=size, quote=quote, limit=limit)
+        if filled <= _EPS:
+            return None
+        return self._fill(ts, market, side, notional / filled, filled, notional * self.taker_fee, "taker",
+                          reason, self._oid())
+
+    def fill_at(self, market: str, side: str, ts: int, price: float, quote: Optional[float] = None,
+                size: Optional[float] = None, reason: str = "entry") -> Optional[Fill]:
+        """Taker fill at a given price, for markets without a local book."""
+        if price <= 0:
+            return None
+        size = quote / price if size is None else size
+        return self._fill(ts, market, side, price, size, price * size * self.taker_fee, "taker", reason, self._oid())
+
+    def limit_order(self, market: str, side: str, ts: int, quote: Optional[float] = None,
+                    size: Optional[float] = None) -> Optional[RestingOrder]:
+        """Post-only order joining the touch on our own side."""
+        book = self._book(market)
+        if book is None:
+            return None
+        levels = book.bids if side == "buy" else book.asks
+        price, level = levels.best()
+        if price is None:
+            return None
+        size = quote / price if size is None else size
+        o = RestingOrder(self._oid(), market, side, price, size, level, ts + self.maker_timeout_ms)
+        self.orders.setdefault(market, []).append(o)
+        return o
+
+    def cancel(self, market: str, order_id: str) -> bool:
+        orders = self.orders.get(market) or []
+        for i, o in enumerate(orders):
+            if o.id == order_id:
+                del orders[i]
+                return True
+        return False
+
+    # ---------- events ----------
+
+    def on_trade(self, market: str, ts: int, price, amount, side) -> List[Fill]:
+        """Public trade (`side` = aggressor): advances maker queues on the other side."""
+        orders = self.orders.get(market)
+        if not orders:
+            return []
+        price, amount = float(price), float(amount)
+        fills = []
+        for o in orders:
+            if o.side == "buy":
+                if side != "sell" or price > o.price:
+                    continue
+            elif side != "buy" or price < o.price:
+                continue
+            if price != o.price:
+                qty = o.remaining        # traded through our level
+            else:
+                o.level = max(0.0, o.level - amount)
+                ahead = o.queue_ahead - amount
+                o.queue_ahead = max(0.0, ahead)
+                qty = min(o.remaining, -ahead) if ahead < 0 else 0.0
+            if qty > _EPS:
+                fills.append(self._maker_fill(o, ts, qty))
+        self._sweep(market, ts)
+        return fills
+
+    def on_book(self, market: str, ts: int) -> List[Fill]:
+        """After a book update: crossed/shrunk maker levels, expiries and TP/SL exits."""
+        book = self._book(market)
+        if book is None:
+            return []
+        fills = []
+        orders = self.orders.get(market)
+        if orders:
+            bid, ask = book.bids.best()[0], book.asks.best()[0]
+            for o in orders:
+                if o.side == "buy":
+                    crossed = ask is not None and ask <= o.price
+                    level = book.bids.size_at(o.price)
+                else:
+                    crossed = bid is not None and bid >= o.price
+                    level = book.asks.size_at(o.price)
+                if crossed:
+                    if o.remaining > _EPS:
+                        fills.append(self._maker_fill(o, ts, o.remaining))
+                    continue
+                if level < o.level and o.level > 0:
+                    o.queue_ahead -= (o.level - level) * o.queue_ahead / o.level
+                o.level = level
+            self._sweep(market, ts)
+        pos = self.positions.get(market)
+        if pos is not None:
+            bid = book.bids.best()[0]
+            if bid is not None and (bid >= pos.tp_price or bid <= pos.sl_price):
+                f = self.market_order(market, "sell", ts, size=pos.size, reason="tp" if bid >= pos.tp_price else "sl")
+                if f is not None:
+                    fills.append(f)
+        return fills
+
+    def on_price(self, market: str, ts: int, bid) -> List[Fill]:
+        """TP/SL from a ticker bid, for positions in markets without a synced book."""
+        pos = self.positions.get(market)
+        if pos is None or bid is None or self._book(market) is not None:
+            return []
+        bid = float(bid)
+        if bid >= pos.tp_price or bid <= pos.sl_price:
+            f = self.fill_at(market, "sell", ts, bid, size=pos.size, reason="tp" if bid >= pos.tp_price else "sl")
+            return [f] if f is not None else []
+        return []
+
+    # ---------- warm restart ----------
+
+    def export(self) -> Dict:
+        """Positions and totals; resting maker orders are not carried over a restart."""
+        return {"positions": {m: asdict(p) for m, p in self.positions.items()},
+                "realized_pnl": self.realized_pnl, "fees": self.fees}
+
+    def restore(self, state: Dict):
+        self.positions = {m: Position(**p) for m, p in state.get("positions", {}).items()}
+        self.realized_pnl = state.get("realized_pnl", 0.0)
+        self.fees = state.get("fees", 0.0)
+
+    # ---------- bookkeeping ----------
+
+    def _sweep(self, market: str, ts: int):
+        orders = self.orders.get(market)
+        if orders:
+            orders[:] = [o for o in orders if o.remaining > _EPS and ts < o.expires]
+
+    def _maker_fill(self, o: RestingOrder, ts: int, qty: float) -> Fill:
+        o.filled += qty
+        return self._fill(ts, o.market, o.side, o.price, qty, o.price * qty * self.maker_fee, "maker", "entry", o.id)
+
+    def _fill(self, ts: int, market: str, side: str, price: float, size: float, fee: float, liquidity: str,
+              reason: str, oid: str) -> Fill:
+        self.fees += fee
+        pos = self.positions.get(market)
+        pnl = None
+        if side == "buy":
+            if pos is None:
+                pos = self.positions[market] = Position(market, 0.0, 0.0, 0.0, ts)
+            pos.size += size
+            pos.notional += price * size
+            pos.fees += fee
+            entry = pos.entry_price
+            pos.tp_price = entry * (1 + self.tp)
+            pos.sl_price = entry * (1 - self.sl)
+        elif pos is not None:
+            size = min(size, pos.size)
+            share = size / pos.size
+            pnl = price * size - fee - (pos.notional + pos.fees) * share
+            self.realized_pnl += pnl
+            pos.size -= size
+            pos.notional -= pos.notional * share
+            pos.fees -= pos.fees * share
+            if pos.size <= _EPS:
+                del self.positions[market]
+        return Fill(ts, market, side, price, size, fee, liquidity, reason, oid, pnl)
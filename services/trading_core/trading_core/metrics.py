@@ -1,7 +1,51 @@
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 
 decision_runs_total = Counter("trading_core_decision_runs_total", "Decision loop runs")
 signals_total = Counter("trading_core_signals_total", "Signals produced", ["side", "reason"])
 orders_total = Counter("trading_core_orders_total", "Orders placed", ["mode", "market", "ok"])
 last_run_ts = Gauge("trading_core_last_run_ts", "Unix ts of last run")
 open_positions = Gauge("trading_core_open_positions", "Open positions (paper)")
+tick_to_decision = Histogram("trading_core_tick_to_decision_seconds",
+                             "Time from the ingest stream entry to the decision on that market", ["mode"],
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+events_consumed_total = Counter("trading_core_events_consumed_total", "Ingest stream entries consumed", ["stream"])
+book_updates_total = Counter("trading_core_book_updates_total", "Book deltas applied to local order books")
+paper_fills_total = Counter("trading_core_paper_fills_total", "Simulated fills", ["liquidity", "reason"])
+paper_fees_eur = Counter("trading_core_paper_fees_eur_total", "Simulated fees paid (EUR)")
+paper_realized_pnl_eur = Gauge("trading_core_paper_realized_pnl_eur", "Realized paper PnL net of fees since start (EUR)")
+book_resyncs_total = Counter("trading_core_book_resyncs_total", "Local order book snapshot resyncs", ["reason"])
+
+# end-to-end latency per stage, labeled by the ingest channel that triggered it
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+exchange_to_ingest = Histogram("trading_core_exchange_to_ingest_seconds",
+                               "Exchange event timestamp to ingest WS receive", ["channel"], buckets=_STAGE_BUCKETS)
+ingest_to_redis = Histogram("trading_core_ingest_to_redis_seconds",
+                            "Ingest WS receive to the XADD on the ingest stream", ["channel"], buckets=_STAGE_BUCKETS)
+redis_to_decision = Histogram("trading_core_redis_to_decision_seconds",
+                              "Ingest stream entry to the decision on that market", ["channel"],
+                              buckets=_STAGE_BUCKETS)
+order_latency_ms = Histogram("trader_order_latency_ms", "Decision to order result (blueprint §6)", ["channel"],
+                             buckets=(1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+
+# order gateway (execution.mode: bitvavo)
+orders_submitted_total = Counter("trader_orders_submitted_total", "Orders sent to the exchange by result (blueprint §6)",
+                                 ["result"])
+gateway_requests_total = Counter("trading_core_gateway_requests_total", "Exchange REST requests by status",
+                                 ["endpoint", "status"])
+gateway_request_seconds = Histogram("trading_core_gateway_request_seconds", "Exchange REST request duration",
+                                    ["endpoint"], buckets=_STAGE_BUCKETS)
+gateway_ratelimit_wait_seconds = Histogram("trading_core_gateway_ratelimit_wait_seconds",
+                                           "Time requests waited for rate-limit budget", buckets=_STAGE_BUCKETS)
+gateway_breaker_open = Gauge("trading_core_gateway_breaker_open", "1 while the order circuit breaker is open")
+
+# day PnL and pause state machine (blueprint §4.4, §6)
+day_pnl_eur = Gauge("trader_day_pnl_eur", "Net PnL of the current UTC day incl. fees and open PnL (EUR)")
+upnl_eur = Gauge("trader_upnl_eur", "Unrealized PnL per open position, marked to mid (EUR)", ["market"])
+trader_state = Gauge("trader_state", "1 for the current trading state", ["state"])
+risk_mode = Gauge("trader_risk_mode", "1 for the current risk mode", ["mode"])
+
+# warm restart snapshots
+state_snapshot_bytes = Gauge("trading_core_state_snapshot_bytes", "Size of the last state snapshot")
+state_snapshot_seconds = Histogram("trading_core_state_snapshot_seconds", "Time to export, pack and store a snapshot",
+                                   buckets=_STAGE_BUCKETS)
+state_restored_age_seconds = Gauge("trading_core_state_restored_age_seconds", "Age of the snapshot restored at start")
@@ -0,0 +1,198 @@
+"""
+Incremental PnL and the day-loss pause state machine (blueprint §1.1, §4.4).
+
+Open positions are indexed by market. A price update re-marks one position
+and adjusts the running unrealized total by the difference, so every event
+is O(1) and nothing is rescanned. Day aggregates (realized PnL, fees,
+trades) are running sums that roll over at the UTC day boundary; the
+start-of-day balance then compounds by the day's realized PnL.
+
+    NetPNL_day = realized today + (unrealized now - unrealized at day start)
+
+States: RUNNING -> PAUSED once NetPNL_day <= pause_pct of the start-of-day
+balance; PAUSED -> RUNNING when `pause_minutes` have passed and NetPNL_day is
+back above the threshold. The first `guard_minutes` after a resume run in
+"cautious" risk mode at `guard_size_factor` of the normal order size.
+
+Times are epoch ms from the caller (event time), so replay drives the same
+state machine. Prometheus gauges are written by `publish()`, off the
+decision path.
+"""
+import asyncio, logging, time
+from typing import Dict, Optional
+from trading_core.metrics import day_pnl_eur, upnl_eur, trader_state, risk_mode
+
+log = logging.getLogger("trading_core.pnl")
+
+DAY_MS = 86_400_000
+RUNNING, PAUSED = "RUNNING", "PAUSED"
+
+
+class OpenPosition:
+    __slots__ = ("size", "cost", "upnl")
+
+    def __init__(self):
+        self.size = 0.0
+        self.cost = 0.0             # entry notional plus entry fees
+        self.upnl = 0.0
+
+
+class PnlEngine:
+    def __init__(self, start_balance_eur: float, pause_pct: float = -2.0, pause_minutes: float = 60,
+                 guard_minutes: float = 30, guard_size_factor: float = 0.5):
+        self.balance = start_balance_eur      # start-of-day balance
+        self.pause_pct = pause_pct
+        self.pause_ms = int(pause_minutes * 60_000)
+        self.guard_ms = int(guard_minutes * 60_000)
+        self.guard_size = guard_size_factor
+        self.positions: Dict[str, OpenPosition] = {}
+        self.upnl = 0.0
+        self.day_realized = 0.0
+        self.day_fees = 0.0
+        self.day_trades = 0
+        self._upnl_base = 0.0
+        self._day_end: Optional[int] = None
+        self.state = RUNNING
+        self.paused_until = 0
+        self.guard_until = 0
+        self.pauses = 0
+        self._published: set = set()
+
+    # ---------- updates ----------
+
+    def on_fill(self, market: str, side: str, price: float, size: float, fee: float, ts: int):
+        self._roll(ts)
+        self.day_fees += fee
+        self.day_trades += 1
+        pos = self.positions.get(market)
+        if side == "buy":
+            if pos is None:
+                pos = self.positions[market] = OpenPosition()
+            pos.size += size
+            pos.cost += price * size + fee
+            self._mark(pos, price)
+        elif pos is not None:
+            size = min(size, pos.size)
+            cost = pos.cost * size / pos.size
+            self.day_realized += price * size - fee - cost
+            pos.size -= size
+            pos.cost -= cost
+            if pos.size <= 1e-12:
+                self.upnl -= pos.upnl
+                del self.positions[market]
+            else:
+                self._mark(pos, price)
+        self._check(ts)
+
+    def on_ticker(self, market: str, ts: int, evt: Dict):
+        """Mark to mid (last price without a BBO); a no-op for markets without a position."""
+        pos = self.positions.get(market)
+        if pos is None:
+            return
+        # roll first: the first mark after midnight belongs to the new day, not to its baseline
+        self._roll(ts)
+        bid, ask = evt.get("bestBid"), evt.get("bestAsk")
+        if bid and ask:
+            price = (float(bid) + float(ask)) / 2
+        elif evt.get("lastPrice"):
+            price = float(evt["lastPrice"])
+        else:
+            return
+        self._mark(pos, price)
+        self._check(ts)
+
+    def _mark(self, pos: OpenPosition, price: float):
+        upnl = pos.size * price - pos.cost
+        self.upnl += upnl - pos.upnl
+        pos.upnl = upnl
+
+    # ---------- day / state ----------
+
+    @property
+    def day_pnl(self) -> float:
+        return self.day_realized + self.upnl - self._upnl_base
+
+    @property
+    def day_pnl_pct(self) -> float:
+        return 100.0 * self.day_pnl / self.balance if self.balance > 0 else 0.0
+
+    def _roll(self, ts: int):
+        if self._day_end is None:
+            self._day_end = (ts // DAY_MS + 1) * DAY_MS
+        elif ts >= self._day_end:
+            log.info("day closed: pnl %.2f EUR (realized %.2f, fees %.2f, %d trades)",
+                     self.day_pnl, self.day_realized, self.day_fees, self.day_trades)
+            self.balance += self.day_realized
+            self.day_realized = self.day_fees = 0.0
+            self.day_trades = 0
+            self._upnl_base = self.upnl
+            self._day_end = (ts // DAY_MS + 1) * DAY_MS
+
+    def _check(self, ts: int):
+        self._roll(ts)
+        if self.state == RUNNING:
+            if self.day_pnl_pct <= self.pause_pct:
+                self.state = PAUSED
+                self.paused_until = ts + self.pause_ms
+                self.pauses += 1
+                log.warning("day PnL %.2f%% <= %.2f%%: trading paused until %d",
+                            self.day_pnl_pct, self.pause_pct, self.paused_until)
+        elif ts >= self.paused_until and self.day_pnl_pct > self.pause_pct:
+            self.state = RUNNING
+            self.guard_until = ts + self.guard_ms
+            log.info("trading resumed (day PnL %.2f%%), cautious until %d", self.day_pnl_pct, self.guard_until)
+
+    def allow_entry(self, ts: int) -> bool:
+        self._check(ts)
+        return self.state == RUNNING
+
+    def risk_mode(self, ts: int) -> str:
+        if self.state == PAUSED:
+            return "halt"
+        return "cautious" if ts < self.guard_until else "normal"
+
+    def size_factor(self, ts: int) -> float:
+        return self.guard_size if self.risk_mode(ts) == "cautious" else 1.0
+
+    # ---------- warm restart ----------
+
+    _SAVED = ("balance", "upnl", "day_realized", "day_fees", "day_trades", "_upnl_base", "_day_end", "state",
+              "paused_until", "guard_until", "pauses")
+
+    def export(self) -> Dict:
+        out = {k: getattr(self, k) for k in self._SAVED}
+        out["positions"] = {m: [p.size, p.cost, p.upnl] for m, p in self.positions.items()}
+        return out
+
+    def restore(self, state: Dict):
+        for k in self._SAVED:
+            if k in state:
+                setattr(self, k, state[k])
+        for m, (size, cost, upnl) in state.get("positions", {}).items():
+            pos = self.positions[m] = OpenPosition()
+            pos.size, pos.cost, pos.upnl = size, cost, upnl
+
+    # ---------- metrics ----------
+
+    def publish(self, ts: Optional[int] = None):
+        ts = int(time.time() * 1000) if ts is None else ts
+        self._check(ts)
+        day_pnl_eur.set(self.day_pnl)
+        for m, pos in self.positions.items():
+            upnl_eur.labels(m).set(pos.upnl)
+        for m in self._published - self.positions.keys():
+            upnl_eur.remove(m)
+        self._published = set(self.positions)
+        for s in (RUNNING, PAUSED):
+            trader_state.labels(s).set(1 if s == self.state else 0)
+        mode = self.risk_mode(ts)
+        for m in ("normal", "cautious", "halt"):
+            risk_mode.labels(m).set(1 if m == mode else 0)
+
+    async def run_publisher(self, interval_s: float = 1.0):
+        while True:
+            try:
+                self.publish()
+            except Exception:
+                log.exception("pnl publish failed")
+            await asyncio.sleep(interval_s)
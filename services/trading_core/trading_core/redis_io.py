@@ -1,6 +1,18 @@
-import asyncio, json
-from typing import Dict, Any, Optional
+import asyncio, time
+from typing import Dict, Any, List, Optional, Tuple
 import redis.asyncio as redis
+from trading_core import codec
+
+# ingest keeps no book latest key (book events are deltas): events mode builds books from ws:book,
+# poll mode takes the BBO from the ticker
+KINDS = ("ticker", "trade")
+
+# (stream, entry_id, payload, ingest receive time in epoch ms or None)
+StreamEvent = Tuple[str, str, Dict[str, Any], Optional[int]]
+
+def entry_ms(entry_id: str) -> int:
+    """Redis stream ids are '<ms>-<seq>'; the ms part is the XADD time."""
+    return int(entry_id.split("-", 1)[0])
 
 class RedisIngest:
     def __init__(self, url: str):
@@ -8,43 +20,125 @@ class RedisIngest:
         self._r: Optional[redis.Redis] = None
 
     async def connect(self):
-        self._r = redis.from_url(self.url, decode_responses=True)
+        # values are codec bytes (binary or JSON), so no response decoding
+        self._r = redis.from_url(self.url, decode_responses=False)
         await self._r.ping()
 
     async def close(self):
         if self._r:
             await self._r.aclose()
 
+    @property
+    def client(self) -> Optional[redis.Redis]:
+        """The raw-bytes client (state snapshots share the connection pool)."""
+        return self._r
+
+    async def read_latest_many(self, markets: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Snapshot for all markets in one round trip: a single MGET over the
+        latest-state keys ws:{kind}:{market} that ws_public_ingest maintains.
+        Returns {market: {"ticker": {...}, "trade": {...}}}.
+        """
+        assert self._r
+        if not markets:
+            return {}
+        keys = [f"ws:{kind}:{m}" for m in markets for kind in KINDS]
+        values = await self._r.mget(keys)
+        out: Dict[str, Dict[str, Any]] = {}
+        it = iter(values)
+        for m in markets:
+            snap: Dict[str, Any] = {}
+            for kind in KINDS:
+                v = next(it)
+                if v:
+                    try:
+                        snap[kind] = codec.decode(v)
+                    except Exception:
+                        pass
+            out[m] = snap
+        return out
+
     async def read_latest(self, market: str) -> Dict[str, Any]:
+        return (await self.read_latest_many([market]))[market]
+
+    async def follow_selection(self, watcher):
+        """Feed market_selection's Redis selection updates into an artifacts.SelectionWatcher."""
+        assert self._r
+        await watcher.listen(self._r)
+
+    async def ensure_group(self, streams: List[str], group: str):
+        """Create the consumer group on each stream (from now on), if missing."""
+        assert self._r
+        for stream in streams:
+            try:
+                await self._r.xgroup_create(stream, group, id="$", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def resume_group(self, streams: List[str], group: str, max_gap_s: float) -> Dict[str, int]:
+        """
+        The group resumes where it left off, but not further back than
+        `max_gap_s`: older backlogs are skipped (XGROUP SETID) rather than
+        replayed. Returns the gap in ms per stream.
+        """
+        assert self._r
+        now_ms = int(time.time() * 1000)
+        floor = now_ms - int(max_gap_s * 1000)
+        gaps: Dict[str, int] = {}
+        for stream in streams:
+            for g in await self._r.xinfo_groups(stream):
+                if g["name"] in (group, group.encode()):
+                    last = g["last-delivered-id"]
+                    last_ms = entry_ms(last.decode() if isinstance(last, bytes) else last)
+                    if last_ms:     # 0-0: created on an empty stream, nothing delivered yet
+                        gaps[stream] = now_ms - last_ms
+                    if last_ms < floor:
+                        await self._r.xgroup_setid(stream, group, f"{floor}-0")
+        return gaps
+
+    async def read_events(self, streams: List[str], block_ms: int, count: int,
+                          group: Optional[str] = None, consumer: Optional[str] = None,
+                          last_ids: Optional[Dict[str, str]] = None, pending: bool = False) -> List[StreamEvent]:
         """
-        Flexible reader:
-        - Checks keys: ws:{type}:{market} (GET JSON or HGETALL)
-        - If streams exist: reads XREVRANGE for latest entry
+        Block up to `block_ms` for new ingest events. With `group` set this is
+        XREADGROUP (ack with `ack`; `pending` re-reads this consumer's
+        delivered but unacked entries instead); otherwise plain XREAD from
+        `last_ids`, which is advanced in place.
         """
         assert self._r
-        data: Dict[str, Any] = {}
-        for kind in ("ticker","book","trade"):
-            key = f"ws:{kind}:{market}"
-            # GET (JSON)
-            v = await self._r.get(key)
-            if v:
+        if group:
+            resp = await self._r.xreadgroup(group, consumer, {s: "0" if pending else ">" for s in streams},
+                                            count=count, block=None if pending else block_ms)
+        else:
+            ids = last_ids if last_ids is not None else {s: "$" for s in streams}
+            resp = await self._r.xread(ids, count=count, block=block_ms)
+        out: List[StreamEvent] = []
+        decode = codec.decode
+        for stream, entries in resp or []:
+            stream = stream.decode()
+            for entry_id, fields in entries:
+                entry_id = entry_id.decode()
+                # pending entries trimmed from the stream come back without fields
+                fields = fields or {}
+                if last_ids is not None:
+                    last_ids[stream] = entry_id
                 try:
-                    data[kind] = json.loads(v)
-                    continue
+                    payload = decode(fields.get(b"v"))
                 except Exception:
-                    pass
-            # Hash
-            h = await self._r.hgetall(key)
-            if h:
-                data[kind] = h
-                continue
-            # Stream (latest)
-            xkey = f"{key}:stream"
-            try:
-                xr = await self._r.xrevrange(xkey, count=1)
-                if xr:
-                    _, fields = xr[0]
-                    data[kind] = dict(fields)
-            except Exception:
-                pass
-        return data
+                    payload = {}
+                rt = fields.get(b"rt")
+                out.append((stream, entry_id, payload, int(rt) if rt else None))
+        return out
+
+    async def ack(self, group: str, events: List[StreamEvent]):
+        assert self._r
+        by_stream: Dict[str, List[str]] = {}
+        for stream, entry_id, *_ in events:
+            by_stream.setdefault(stream, []).append(entry_id)
+        if not by_stream:
+            return
+        pipe = self._r.pipeline(transaction=False)
+        for stream, ids in by_stream.items():
+            pipe.xack(stream, group, *ids)
+        await pipe.execute()
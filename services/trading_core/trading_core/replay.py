@@ -0,0 +1,323 @@
+"""
+Historical replay / backtest over the ingest Parquet lake.
+
+Events from `tickers/`, `trades/` and `books/` (date=*/market=*/part-*.parquet)
+are streamed file by file with column projection and k-way merged in
+timestamp order, so memory stays bounded by one record batch per stream.
+They drive the same components as live mode: BookManager, FeatureEngine,
+compute_signal, Cooldown and PaperExecutor (matching against the replayed
+books, with fees and TP/SL exits).
+
+Runs can be split across a process pool by market or by date:
+
+    python -m trading_core.replay --root /srv/trading/data/parquet \\
+        --date 2025-10-26 --workers 8 --split market --out replay.json
+
+Splitting by market replays each market in isolation, so the
+max_open_positions limit is then applied per market, not across them.
+--workers defaults to the CPU count, at most 8, and never exceeds the
+number of jobs.
+
+The lake holds no book snapshots, only the `ws:book` deltas, so books are
+rebuilt from deltas alone (BookManager's rebase_on_gap): a market's book
+starts empty and only holds the levels that deltas have touched. Until it
+has filled in, the spread, EUR depth and imbalance are biased (levels that
+never changed are missing). Each market therefore gets `replay.warmup_s`
+(--warmup-s) of event time after its first book event in which the books,
+features and resting paper orders are updated but no decisions are made;
+these are counted as `decisions_warmup`. Nonce gaps do not restart it: the
+lake has no nonceStart column, so a gap cannot be told apart from a run of
+deltas that ingest collapsed under load. A real gap leaves stale levels
+behind until deltas overwrite them.
+"""
+import argparse, asyncio, heapq, json, logging, os, time
+from collections import Counter as Tally
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import pyarrow.parquet as pq
+import yaml
+from trading_core.book import BookManager
+from trading_core.cooldown import Cooldown
+from trading_core.decision import compute_signal
+from trading_core.executor import PaperExecutor
+from trading_core.features import FeatureEngine
+from trading_core.pnl import PnlEngine
+
+log = logging.getLogger("trading_core.replay")
+
+CHANNELS = ("books", "tickers", "trades")
+# at equal timestamps apply book state before tickers, trades last
+_PRIO = {ch: i for i, ch in enumerate(CHANNELS)}
+_COLUMNS = {
+    "tickers": ["ts", "bestBid", "bestBidSize", "bestAsk", "bestAskSize", "lastPrice"],
+    "trades": ["ts", "price", "amount", "side"],
+    "books": ["ts", "nonce", "bid_price", "bid_size", "ask_price", "ask_size"],
+}
+SCHEMA_META_KEY = b"tradingbot.schema"
+# each worker holds a record batch per stream and its own books; more processes mostly add memory and I/O
+MAX_DEFAULT_WORKERS = 8
+
+# (ts_ms, prio, market, channel, payload)
+Event = Tuple[int, int, str, str, Dict[str, Any]]
+
+
+def _file_ts(path: Path) -> int:
+    """part-<ms>-<pid>-<seq>.parquet, or legacy part-<unix-seconds>.parquet -> epoch ms."""
+    try:
+        t = int(path.stem.split("-")[1])
+    except (IndexError, ValueError):
+        return int(path.stat().st_mtime * 1000)
+    return t if t > 10**11 else t * 1000
+
+
+def stream_files(root: Path, channel: str, market: str, dates: Sequence[str]) -> List[Path]:
+    out: List[Path] = []
+    for d in sorted(dates):
+        base = root / channel / f"date={d}" / f"market={market}"
+        if base.is_dir():
+            out.extend(sorted(base.glob("part-*.parquet"), key=lambda p: (_file_ts(p), p.name)))
+    return out
+
+
+def _rows(path: Path, channel: str, batch_size: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    pf = pq.ParquetFile(path)
+    typed = (pf.schema_arrow.metadata or {}).get(SCHEMA_META_KEY, b"").startswith(channel.encode() + b"/")
+    if typed:
+        cols = _COLUMNS[channel]
+        for batch in pf.iter_batches(batch_size=batch_size, columns=cols):
+            d = batch.to_pydict()
+            if channel == "books":
+                for ts, nonce, bp, bs, ap, as_ in zip(d["ts"], d["nonce"], d["bid_price"], d["bid_size"],
+                                                     d["ask_price"], d["ask_size"]):
+                    yield ts, {"nonce": nonce, "bids": list(zip(bp or (), bs or ())),
+                               "asks": list(zip(ap or (), as_ or ()))}
+            else:
+                names = cols[1:]
+                for ts, *vals in zip(*(d[c] for c in cols)):
+                    yield ts, {k: v for k, v in zip(names, vals) if v is not None}
+        return
+    # legacy parts (schema inferred per event): read whole rows
+    file_ts = _file_ts(path)
+    for batch in pf.iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            ts = row.get("timestamp") or row.get("ts") or file_ts
+            yield int(ts), row
+
+
+def iter_stream(root: Path, channel: str, market: str, dates: Sequence[str],
+                batch_size: int = 65_536) -> Iterator[Event]:
+    prio = _PRIO[channel]
+    for path in stream_files(root, channel, market, dates):
+        try:
+            for ts, payload in _rows(path, channel, batch_size):
+                payload["market"] = market
+                yield ts, prio, market, channel, payload
+        except Exception:
+            log.exception("skipping unreadable part %s", path)
+
+
+def discover_markets(root: Path, dates: Sequence[str]) -> List[str]:
+    found = set()
+    for ch in CHANNELS:
+        for d in dates:
+            base = root / ch / f"date={d}"
+            if base.is_dir():
+                found.update(p.name.split("=", 1)[1] for p in base.glob("market=*"))
+    return sorted(found)
+
+
+def merged_events(root: Path, markets: Sequence[str], dates: Sequence[str],
+                  channels: Sequence[str] = CHANNELS) -> Iterator[Event]:
+    streams = [iter_stream(root, ch, m, dates) for m in markets for ch in channels]
+    return heapq.merge(*streams, key=lambda e: (e[0], e[1]))
+
+
+class Backtest:
+    """Feeds replayed events through the live decision components."""
+
+    def __init__(self, cfg: Dict[str, Any]):
+        book_cfg = cfg.get("book") or {}
+        self.books = BookManager(None, depth=int(book_cfg.get("depth", 100)),
+                                 levels=int(book_cfg.get("levels", 10)), rebase_on_gap=True)
+        # books start empty (no snapshots in the lake): no decisions until warm_until[market]
+        self.warmup_ms = int(float((cfg.get("replay") or {}).get("warmup_s", 60)) * 1000)
+        self.warm_until: Dict[str, int] = {}
+        self.features = FeatureEngine(cfg.get("features") or {})
+        self.tickers: Dict[str, Dict[str, Any]] = {}
+        self.cooldown = Cooldown(int(cfg["signals"]["cooldown_s"]))
+        risk = cfg["risk"]
+        self.executor = PaperExecutor(float(risk["notional_per_trade_eur"]), float(risk["take_profit_pct"]),
+                                      float(risk["stop_loss_pct"]), books=self.books, cfg=cfg.get("paper"))
+        self.notional = float(risk["notional_per_trade_eur"])
+        pnl_cfg = cfg.get("pnl") or {}
+        self.pnl = PnlEngine(float(pnl_cfg.get("start_balance_eur", 1000)), float(pnl_cfg.get("pause_pct", -2.0)),
+                             float(pnl_cfg.get("pause_minutes", 60)), float(pnl_cfg.get("guard_minutes", 30)),
+                             float(pnl_cfg.get("guard_size_factor", 0.5)))
+        self.max_positions = int(risk["max_open_positions"])
+        self.params = {"max_spread_bps": cfg["signals"]["max_spread_bps"],
+                       "min_book_depth_eur": cfg["signals"]["min_book_depth_eur"]}
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.stats: Tally = Tally()
+        self.fills: List[Dict[str, Any]] = []
+
+    async def on_event(self, ts: int, channel: str, market: str, payload: Dict[str, Any]):
+        self.stats[f"events_{channel}"] += 1
+        view = None
+        if channel == "books":
+            if not self.books.on_event(payload):
+                return
+            if market not in self.warm_until:
+                self.warm_until[market] = ts + self.warmup_ms
+            view = self.books.view(market) or {}
+            self.features.on_book_view(market, ts, view)
+            self.on_fills(self.executor.on_book(market, ts))
+        elif channel == "tickers":
+            self.tickers.setdefault(market, {}).update(payload)
+            self.features.on_ticker(market, ts, payload)
+            self.pnl.on_ticker(market, ts, payload)
+            self.on_fills(self.executor.on_ticker(market, ts, payload))
+        else:
+            self.features.on_trade(market, ts, payload.get("price"), payload.get("amount"), payload.get("side"))
+            self.on_fills(self.executor.on_trade(market, ts, payload.get("price"), payload.get("amount"),
+                                                 payload.get("side")))
+            return
+        await self.decide(market, ts, view)
+
+    def on_fills(self, fills):
+        for f in fills:
+            self.stats[f"fills_{f.liquidity}_{f.reason}"] += 1
+            self.pnl.on_fill(f.market, f.side, f.price, f.size, f.fee, f.ts)
+            self.fills.append(asdict(f))
+            self.sync_position(f.market)
+
+    def sync_position(self, market: str):
+        """Mirror the simulator's position (partial fills, exits and rejections included)."""
+        pos = self.executor.position(market)
+        if pos is None:
+            self.positions.pop(market, None)
+        else:
+            self.positions[market] = {"entry_price": pos.entry_price, "size": pos.size, "ts": pos.ts}
+
+    async def decide(self, market: str, ts: int, view: Optional[Dict[str, Any]] = None):
+        if market in self.positions or len(self.positions) >= self.max_positions:
+            return
+        if ts < self.warm_until.get(market, 0):
+            self.stats["decisions_warmup"] += 1
+            return
+        if view is None:
+            view = self.books.view(market) or {}
+        snapshot = {"ticker": self.tickers.get(market) or {}, "book": view,
+                    "features": self.features.snapshot(market, ts)}
+        d = compute_signal(market, snapshot, self.params)
+        self.stats["decisions"] += 1
+        if not d.side or self.cooldown.hit(market, now=ts / 1000.0):
+            return
+        if d.side == "buy" and not self.pnl.allow_entry(ts):
+            self.stats["signals_paused"] += 1
+            return
+        self.stats[f"signals_{d.reason}"] += 1
+        res = await self.executor.place_order(market, d.side, d.price or 0.0, ts_ms=ts,
+                                              notional=self.notional * self.pnl.size_factor(ts))
+        self.stats[f"orders_ok_{res.ok}"] += 1
+        if res.ok and res.filled_size:
+            self.pnl.on_fill(market, d.side, res.filled_price, res.filled_size, res.fee, ts)
+        self.sync_position(market)
+        if res.ok and d.side == "buy":
+            self.cooldown.set(market, now=ts / 1000.0)
+            if res.filled_size:
+                self.stats[f"fills_{res.liquidity}_entry"] += 1
+                self.fills.append({"ts": ts, "market": market, "side": d.side, "price": res.filled_price,
+                                   "size": res.filled_size, "fee": res.fee, "liquidity": res.liquidity,
+                                   "reason": "entry", "order_id": res.order_id, "pnl": None})
+
+
+async def _replay(root: Path, markets: Sequence[str], dates: Sequence[str], cfg: Dict[str, Any]) -> Dict[str, Any]:
+    bt = Backtest(cfg)
+    t0 = time.perf_counter()
+    n = 0
+    for ts, _, market, channel, payload in merged_events(root, markets, dates):
+        await bt.on_event(ts, channel, market, payload)
+        n += 1
+    elapsed = time.perf_counter() - t0
+    eng = bt.executor.engine
+    bt.stats["pnl_pauses"] = bt.pnl.pauses
+    return {"markets": list(markets), "dates": list(dates), "events": n, "elapsed_s": elapsed,
+            "stats": dict(bt.stats), "fills": bt.fills, "realized_pnl_eur": eng.realized_pnl, "fees_eur": eng.fees,
+            "open_positions": len(eng.positions)}
+
+
+def run_job(job: Tuple[str, List[str], List[str], Dict[str, Any]]) -> Dict[str, Any]:
+    root, markets, dates, cfg = job
+    return asyncio.run(_replay(Path(root), markets, dates, cfg))
+
+
+def plan_jobs(root: str, markets: Sequence[str], dates: Sequence[str], cfg: Dict[str, Any],
+              split: str) -> List[Tuple[str, List[str], List[str], Dict[str, Any]]]:
+    if split == "market":
+        return [(root, [m], list(dates), cfg) for m in markets]
+    if split == "date":
+        return [(root, list(markets), [d], cfg) for d in dates]
+    return [(root, list(markets), list(dates), cfg)]
+
+
+def run(root: str, dates: Sequence[str], cfg: Dict[str, Any], markets: Optional[Sequence[str]] = None,
+        workers: int = 1, split: str = "market") -> Dict[str, Any]:
+    markets = list(markets or discover_markets(Path(root), dates))
+    jobs = plan_jobs(root, markets, dates, cfg, split if workers > 1 else "none")
+    workers = max(1, min(workers, len(jobs)))
+    t0 = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_job, jobs))
+    else:
+        results = [run_job(j) for j in jobs]
+    stats: Tally = Tally()
+    fills: List[Dict[str, Any]] = []
+    events = 0
+    pnl = fees = 0.0
+    open_pos = 0
+    for r in results:
+        stats.update(r["stats"])
+        fills.extend(r["fills"])
+        events += r["events"]
+        pnl += r["realized_pnl_eur"]
+        fees += r["fees_eur"]
+        open_pos += r["open_positions"]
+    fills.sort(key=lambda f: (f["ts"], f["market"]))
+    elapsed = time.perf_counter() - t0
+    return {"markets": len(markets), "dates": list(dates), "jobs": len(jobs), "workers": workers,
+            "events": events, "elapsed_s": elapsed, "events_per_s": events / elapsed if elapsed else None,
+            "stats": dict(stats), "realized_pnl_eur": pnl, "fees_eur": fees, "open_positions": open_pos,
+            "fills": fills}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay the ingest Parquet lake through trading_core")
+    ap.add_argument("--root", required=True, help="parquet root containing tickers/ trades/ books/")
+    ap.add_argument("--date", action="append", required=True, help="YYYY-MM-DD (repeatable)")
+    ap.add_argument("--market", action="append", help="limit to market (repeatable); default: all found")
+    ap.add_argument("--config", default=os.environ.get("TRADING_CORE_CONFIG",
+                                                       str(Path(__file__).with_name("config.yml"))))
+    ap.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+    ap.add_argument("--split", choices=("market", "date"), default="market")
+    ap.add_argument("--warmup-s", type=float, help="no decisions this long after a market's first book event "
+                                                   "(default: replay.warmup_s in the config)")
+    ap.add_argument("--out", help="write the result JSON here (default: stdout summary)")
+    args = ap.parse_args()
+    with open(args.config, "r") as f:
+        cfg = yaml.safe_load(f)
+    if args.warmup_s is not None:
+        cfg.setdefault("replay", {})["warmup_s"] = args.warmup_s
+    res = run(args.root, args.date, cfg, args.market, args.workers, args.split)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(res, f)
+    summary = {k: v for k, v in res.items() if k != "fills"}
+    summary["fills"] = len(res["fills"])
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Warm-restart snapshots of trading_core's decision state.
+
+A snapshot is a JSON header plus the raw bytes of every `array.array` in
+it (feature windows), so packing and unpacking cost a memcpy per window
+instead of a float-by-float (de)serialization:
+
+    MAGIC(2) VERSION(1) header_len(4, LE) header(JSON) blob...
+
+Arrays in the header are replaced by {"$a": typecode, "o": offset, "n": nbytes}.
+Snapshots go to a local file (written to a temp file, then renamed) and/or
+one Redis key; `load` returns the newest one that can be read.
+"""
+import asyncio, json, logging, os, struct, time
+from array import array
+from typing import Any, List, Optional, Tuple
+
+log = logging.getLogger("trading_core.state")
+
+MAGIC = b"\xb7s"
+VERSION = 1
+_HEAD = struct.Struct("<2sBI")
+
+
+def pack(obj: Any) -> bytes:
+    blobs: List[bytes] = []
+    size = 0
+
+    def walk(x):
+        nonlocal size
+        if isinstance(x, array):
+            b = x.tobytes()
+            blobs.append(b)
+            size += len(b)
+            return {"$a": x.typecode, "o": size - len(b), "n": len(b)}
+        if isinstance(x, dict):
+            return {k: walk(v) for k, v in x.items()}
+        if isinstance(x, (list, tuple)):
+            return [walk(v) for v in x]
+        return x
+
+    header = json.dumps(walk(obj), separators=(",", ":")).encode()
+    return _HEAD.pack(MAGIC, VERSION, len(header)) + header + b"".join(blobs)
+
+
+def unpack(data: bytes) -> Any:
+    magic, version, n = _HEAD.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a trading_core state snapshot")
+    base = _HEAD.size + n
+    view = memoryview(data)
+
+    def walk(x):
+        if isinstance(x, dict):
+            if "$a" in x:
+                a = array(x["$a"])
+                a.frombytes(view[base + x["o"]:base + x["o"] + x["n"]])
+                return a
+            return {k: walk(v) for k, v in x.items()}
+        if isinstance(x, list):
+            return [walk(v) for v in x]
+        return x
+
+    return walk(json.loads(bytes(view[_HEAD.size:base])))
+
+
+class StateStore:
+    """Snapshot target: a file path, a Redis key on a raw-bytes client, or both."""
+
+    def __init__(self, path: Optional[str] = None, redis=None, key: str = "trading_core:state"):
+        self.path = path
+        self.redis = redis
+        self.key = key
+
+    def _write_file(self, data: bytes):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    async def save(self, state: Any) -> int:
+        """
+        Pack `state` and store it; packing and the file write run off the
+        event loop, so `state` must be built from copies. Returns the size.
+        """
+        data = await asyncio.to_thread(pack, state)
+        if self.path:
+            try:
+                await asyncio.to_thread(self._write_file, data)
+            except OSError:
+                log.exception("state snapshot write to %s failed", self.path)
+        if self.redis is not None:
+            await self.redis.set(self.key, data)
+        return len(data)
+
+    async def load(self) -> Optional[Any]:
+        """Newest readable snapshot (by its `ts`), or None."""
+        found: List[Tuple[int, Any]] = []
+        sources = []
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                sources.append(("file", f.read()))
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(self.key)
+                if data:
+                    sources.append(("redis", data))
+            except Exception:
+                log.exception("state snapshot read from redis failed")
+        for name, data in sources:
+            try:
+                state = unpack(data)
+                found.append((int(state.get("ts", 0)), state))
+            except Exception:
+                log.exception("unreadable state snapshot (%s)", name)
+        if not found:
+            return None
+        ts, state = max(found, key=lambda x: x[0])
+        log.info("state snapshot from %.1fs ago", time.time() - ts / 1000.0)
+        return state
@@ -0,0 +1,169 @@
+"""
+Compact binary encoding of ingest events on the Redis streams (`v` field)
+and latest-state keys.
+
+Written by ws_public_ingest, read by trading_core and market_selection
+(stream mode). The services share no package, so each keeps a copy of this
+module (ws_public_ingest/app, trading_core/trading_core, market_selection/app);
+`make ci` (ci/check_shared_copies.py) fails when they differ.
+
+Layout (little endian), version 1:
+
+    header   B magic (0xB7)  B version  B type  B len(market)  market utf-8
+    ticker   B mask  [q timestamp]  d value * popcount(mask bits 0..4)
+             (bits 0..4: bestBid bestBidSize bestAsk bestAskSize lastPrice,
+              bit 5: timestamp present)
+    book     q nonce  q nonceStart  H n_bids  H n_asks  (d price, d size) * (n_bids + n_asks)
+    trade    q timestamp  d price  d amount  B side  B len(id)  id utf-8
+
+Ticker events only carry changed fields, so the mask says which values
+follow. For book and trade a nonceStart of -1 and a timestamp of 0 mean
+absent; absent fields are left out of the decoded dict.
+Prices and sizes decode as floats, not the exchange's decimal strings, and
+book levels as (price, size) tuples.
+Fields outside this layout are dropped, and events that do not fit it
+(ticker24h, no market, > 65535 levels) are stored as JSON instead.
+`decode` accepts both, so either ingest setting works with every reader
+and old entries stay readable.
+
+The layout trades CPU for size: entries are less than half as large as
+JSON, but orjson encodes and decodes faster than these struct calls
+(`python -m bench.codec` in ws_public_ingest), so ingest defaults to
+`redis.codec: json`.
+"""
+import json, struct
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+MAGIC = 0xB7
+VERSION = 1
+T_TICKER, T_BOOK, T_TRADE = 1, 2, 3
+
+_HDR = struct.Struct("<BBBB")
+_TICKER_KEYS = ("bestBid", "bestBidSize", "bestAsk", "bestAskSize", "lastPrice")
+_TICKER_BITS = tuple((1 << b, k) for b, k in enumerate(_TICKER_KEYS))
+_TICKER_TS = 1 << len(_TICKER_KEYS)
+# mask -> (keys present, struct of the values that follow the mask byte)
+_TICKER = [(("timestamp",) * bool(m & _TICKER_TS) + tuple(k for b, k in enumerate(_TICKER_KEYS) if m >> b & 1),
+            struct.Struct("<" + "q" * bool(m & _TICKER_TS) + "d" * bin(m & (_TICKER_TS - 1)).count("1")))
+           for m in range(_TICKER_TS << 1)]
+_BOOK = struct.Struct("<qqHH")
+_TRADE = struct.Struct("<qddBB")
+_SIDES = {"buy": 0, "sell": 1}
+_SIDE_NAMES = ("buy", "sell")
+_EVENT_TYPE = {"ticker": T_TICKER, "book": T_BOOK, "trade": T_TRADE, "trades": T_TRADE}
+
+try:
+    import orjson
+    _dumps, _loads = orjson.dumps, orjson.loads
+except ImportError:  # stdlib fallback
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+    _loads = json.loads
+
+
+def _i(x, default: int) -> int:
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return default
+
+
+@lru_cache(maxsize=4096)
+def _head(typ: int, market: str) -> Optional[bytes]:
+    mb = market.encode()
+    return _HDR.pack(MAGIC, VERSION, typ, len(mb)) + mb if len(mb) <= 255 else None
+
+
+@lru_cache(maxsize=256)
+def _levels(n: int) -> struct.Struct:
+    return struct.Struct(f"<{2 * n}d")
+
+
+def _encode_binary(evt: Dict[str, Any]) -> Optional[bytes]:
+    g = evt.get
+    typ = _EVENT_TYPE.get(g("event"))
+    market = g("market")
+    if typ is None or not market:
+        return None
+    head = _head(typ, market)
+    if head is None:
+        return None
+    if typ == T_TICKER:
+        mask, vals = 0, []
+        ts = g("timestamp")
+        if ts is not None:
+            mask, vals = _TICKER_TS, [int(ts)]
+        for bit, k in _TICKER_BITS:
+            v = g(k)
+            if v is not None:
+                mask |= bit
+                vals.append(float(v))
+        return head + bytes((mask,)) + _TICKER[mask][1].pack(*vals)
+    if typ == T_BOOK:
+        bids, asks = evt.get("bids") or [], evt.get("asks") or []
+        if len(bids) > 0xFFFF or len(asks) > 0xFFFF or evt.get("nonce") is None:
+            return None
+        flat = []
+        for lvl in bids:
+            flat += (float(lvl[0]), float(lvl[1]))
+        for lvl in asks:
+            flat += (float(lvl[0]), float(lvl[1]))
+        return (head + _BOOK.pack(_i(evt["nonce"], 0), _i(evt.get("nonceStart"), -1), len(bids), len(asks))
+                + _levels(len(bids) + len(asks)).pack(*flat))
+    tid = str(evt.get("id") or "").encode()
+    if len(tid) > 255:
+        return None
+    return head + _TRADE.pack(_i(evt.get("timestamp"), 0), float(evt["price"]), float(evt["amount"]),
+                              _SIDES.get(evt.get("side"), 2), len(tid)) + tid
+
+
+def encode(evt: Dict[str, Any], binary: bool = True) -> bytes:
+    """Binary when the event fits the layout (and `binary`), JSON otherwise."""
+    if binary:
+        try:
+            data = _encode_binary(evt)
+        except (KeyError, TypeError, ValueError, IndexError, struct.error):
+            data = None
+        if data is not None:
+            return data
+    return _dumps(evt)
+
+
+def decode(data) -> Dict[str, Any]:
+    """Decode a binary or JSON payload (bytes or str)."""
+    if not data:
+        return {}
+    if isinstance(data, str) or data[0] != MAGIC:
+        return _loads(data)
+    _, version, typ, mlen = _HDR.unpack_from(data, 0)
+    if version != VERSION:
+        raise ValueError(f"unsupported codec version {version}")
+    off = _HDR.size + mlen
+    market = data[_HDR.size:off].decode()
+    if typ == T_TICKER:
+        keys, st = _TICKER[data[off]]
+        out = dict(zip(keys, st.unpack_from(data, off + 1)))
+        out["event"] = "ticker"
+        out["market"] = market
+        return out
+    if typ == T_BOOK:
+        nonce, start, nb, na = _BOOK.unpack_from(data, off)
+        flat = _levels(nb + na).unpack_from(data, off + _BOOK.size)
+        it = iter(flat)
+        levels = list(zip(it, it))
+        out = {"event": "book", "market": market, "nonce": nonce, "bids": levels[:nb], "asks": levels[nb:]}
+        if start >= 0:
+            out["nonceStart"] = start
+        return out
+    if typ == T_TRADE:
+        ts, price, amount, side, idlen = _TRADE.unpack_from(data, off)
+        p = off + _TRADE.size
+        out = {"event": "trade", "market": market, "id": data[p:p + idlen].decode(), "price": price,
+               "amount": amount}
+        if side < 2:
+            out["side"] = _SIDE_NAMES[side]
+        if ts:
+            out["timestamp"] = ts
+        return out
+    raise ValueError(f"unknown codec type {typ}")
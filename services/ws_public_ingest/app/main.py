@@ -1,63 +1,23 @@
-import asyncio, logging, argparse, time, os, json, orjson
-from pathlib import Path
-from typing import Dict, List, Any
+import asyncio, logging, argparse, time, os, signal
+import multiprocessing as mp
+from typing import Dict, List, Any, Optional
 import yaml
-from prometheus_client import start_http_server
+import redis.asyncio as aioredis
 from .writer_redis import RedisWriter
 from .writer_parquet import ParquetWriter
 from .ws_client import WSClient
-from .metrics import events_parquet_written, subscribe_updates
+from .shards import shard_subscriptions
+from .pipeline import Pipeline
+from .instrumentation import Instrumentation
+from .artifacts import CachedFile, SelectionWatcher, parse_universe
+from .metrics import shard_markets
 
 def load_yaml(path: str) -> Dict[str, Any]:
     with open(path, "r") as f:
         return yaml.safe_load(f)
 
-def read_lines_file(path: str) -> List[str]:
-    lines = []
-    with open(path, "r") as f:
-        for line in f:
-            s = line.strip()
-            if not s:
-                continue
-            # handle jsonl or plain symbols per line
-            if s.startswith("{"):
-                try:
-                    obj = orjson.loads(s)
-                    sym = obj.get("symbol") or obj.get("market") or obj.get("pair")
-                    if sym:
-                        lines.append(sym)
-                except:
-                    pass
-            else:
-                lines.append(s)
-    return lines
-
-def load_selection(path: str) -> List[str]:
-    try:
-        with open(path, "r") as f:
-            data = json.load(f)
-        # supports either {"markets": [...]} or a plain list
-        if isinstance(data, dict):
-            return list(data.get("markets") or data.get("symbols") or [])
-        elif isinstance(data, list):
-            return [str(x) for x in data]
-    except FileNotFoundError:
-        return []
-    return []
-
-def build_subscribe_lists(cfg: Dict[str, Any]) -> Dict[str, List[str]]:
-    rt = cfg["runtime"]
+def build_subscribe_lists(cfg: Dict[str, Any], universe: List[str], selection: List[str]) -> Dict[str, List[str]]:
     subs = cfg["subscribe"]
-    universe = []
-    selection = []
-
-    uni_path = rt["universe_file"]
-    sel_path = rt["selection_file"]
-
-    if Path(uni_path).exists():
-        universe = read_lines_file(uni_path)
-    if Path(sel_path).exists():
-        selection = load_selection(sel_path)
 
     def choose(mode: str, fallback: List[str]) -> List[str]:
         if mode == "universe":
@@ -76,75 +36,211 @@ def build_subscribe_lists(cfg: Dict[str, Any]) -> Dict[str, List[str]]:
     out["book"]   = choose(subs["book"]["mode"],   subs["book"]["list"] or [])
     return out
 
-async def main_async(cfg_path: str):
-    cfg = load_yaml(cfg_path)
-    logging.basicConfig(level=getattr(logging, cfg["runtime"]["log_level"].upper(), logging.INFO),
-                        format='%(asctime)s %(levelname)s %(message)s')
-
-    start_http_server(int(cfg["runtime"]["metrics_port"]))
-
-    redisw = RedisWriter(cfg["runtime"]["redis_dsn"])
-    parquetw = ParquetWriter(cfg["runtime"]["parquet_root"])
-
-    subs = build_subscribe_lists(cfg)
-    ws = WSClient(cfg["ws"]["url"], cfg["ws"]["max_retries"], cfg["ws"]["base_backoff_ms"])
-
-    async def handle_ticker(evt):
+class IngestShard:
+    """One WS connection with its own Redis/Parquet writers for a subset of the markets."""
+
+    def __init__(self, cfg: Dict[str, Any], index: int, count: int):
+        self.index = index
+        self.count = count
+        label = str(index)
+        r_cfg = cfg.get("redis") or {}
+        self.redisw = RedisWriter(cfg["runtime"]["redis_dsn"],
+                                  batch_max=int(r_cfg.get("batch_max", 500)),
+                                  linger_ms=float(r_cfg.get("linger_ms", 5)),
+                                  queue_max=int(r_cfg.get("queue_max", 50_000)),
+                                  maxlen=r_cfg.get("maxlen") or {},
+                                  latest_ttl_s=int(r_cfg.get("latest_ttl_s", 300)),
+                                  shard=label, codec=r_cfg.get("codec", "json"))
+        pq_cfg = cfg.get("parquet") or {}
+        self.parquetw = ParquetWriter(cfg["runtime"]["parquet_root"],
+                                      rotation_seconds=int(pq_cfg.get("rotation_seconds", 300)),
+                                      max_rows_per_file=int(pq_cfg.get("max_rows_per_file", 500_000)),
+                                      shard=label)
+        # the binary codec re-encodes every event, so raw frames would only ride along through the queues
+        passthrough = bool(cfg["ws"].get("raw_passthrough", False))
+        if passthrough and self.redisw.binary:
+            logging.warning("ws.raw_passthrough has no effect with redis.codec: binary; disabled")
+            passthrough = False
+        self.ws = WSClient(cfg["ws"]["url"], cfg["ws"]["max_retries"], cfg["ws"]["base_backoff_ms"], shard=label,
+                           raw_passthrough=passthrough)
+        # Bitvavo ticker events only carry changed fields; keep the merged state per market
+        self.latest_ticker: Dict[str, Dict[str, Any]] = {}
+        self.handlers = {"ticker": self.handle_ticker, "trade": self.handle_trade, "book": self.handle_book}
+        # the WS receiver only enqueues; consumer tasks run the handlers above
+        self.pipeline = Pipeline(self.handlers, cfg.get("queues"), shard=label)
+        self._tasks: List[asyncio.Task] = []
+
+    def subs_for(self, subs: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        mine = shard_subscriptions(subs, self.index, self.count)
+        for ch, markets in mine.items():
+            shard_markets.labels(str(self.index), ch).set(len(markets))
+        return mine
+
+    async def handle_ticker(self, evt, raw=None, recv_ms=None):
         market = evt.get("market") or evt.get("symbol") or "UNKNOWN"
-        await redisw.write_stream("ws:ticker", evt)
-        parquetw.write_rows("tickers", market, [evt])
-        events_parquet_written.labels("ticker").inc()
+        await self.redisw.write_stream("ws:ticker", evt, raw, recv_ms)
+        state = self.latest_ticker.setdefault(market, {})
+        state.update(evt)
+        self.redisw.set_latest(f"ws:ticker:{market}", state)
+        self.parquetw.write_rows("tickers", market, [evt])
 
-    async def handle_trade(evt):
+    async def handle_trade(self, evt, raw=None, recv_ms=None):
         market = evt.get("market") or "UNKNOWN"
-        await redisw.write_stream("ws:trade", evt)
-        parquetw.write_rows("trades", market, [evt])
-        events_parquet_written.labels("trade").inc()
+        await self.redisw.write_stream("ws:trade", evt, raw, recv_ms)
+        self.redisw.set_latest(f"ws:trade:{market}", evt)
+        self.parquetw.write_rows("trades", market, [evt])
 
-    async def handle_book(evt):
+    async def handle_book(self, evt, raw=None, recv_ms=None):
         market = evt.get("market") or "UNKNOWN"
-        await redisw.write_stream("ws:book", evt)
-        parquetw.write_rows("books", market, [evt])
-        events_parquet_written.labels("book").inc()
+        # no latest-state key: a book event is a delta, not a book (trading_core builds books from ws:book)
+        await self.redisw.write_stream("ws:book", evt, raw, recv_ms)
+        self.parquetw.write_rows("books", market, [evt])
+
+    def start(self, subs: Dict[str, List[str]]):
+        # launch ws loop, channel consumers, redis batching and parquet rotation
+        self.pipeline.start()
+        self._tasks = [asyncio.create_task(self.ws.run(self.subs_for(subs), self.pipeline.receivers())),
+                       asyncio.create_task(self.redisw.run()),
+                       asyncio.create_task(self.parquetw.run())]
+
+    async def resubscribe(self, subs: Dict[str, List[str]]):
+        await self.ws.update(self.subs_for(subs))
+
+    async def close(self):
+        await self.ws.stop()
+        await self.pipeline.drain()
+        await self.redisw.close()
+        # the ws loop may still sit in a reconnect backoff, the parquet loop in its rotation sleep
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.parquetw.close()
+
+
+async def main_async(cfg_path: str, shard: Optional[int] = None):
+    """
+    Run ingest shards in this event loop: all `shards.count` shards, or only
+    `shard` when started as a worker process of the supervisor.
+    """
+    cfg = load_yaml(cfg_path)
+    logging.basicConfig(level=getattr(logging, cfg["runtime"]["log_level"].upper(), logging.INFO),
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    count = max(1, int((cfg.get("shards") or {}).get("count", 1)))
+    indices = list(range(count)) if shard is None else [shard]
+    # worker processes each serve their own metrics port: metrics_port + shard
+    instr = Instrumentation("ws", cfg.get("instrumentation"))
+    instr.start_http_server(int(cfg["runtime"]["metrics_port"]) + (shard or 0))
+    instr.install(asyncio.get_running_loop())
 
-    handlers = {"ticker": handle_ticker, "trade": handle_trade, "book": handle_book}
+    # universe/selection are re-parsed only when the files change; selection updates also arrive via Redis pubsub
+    rt = cfg["runtime"]
+    universe = CachedFile(rt["universe_file"], parse_universe, [])
+    selection = SelectionWatcher(rt["selection_file"], check_interval_s=10)
+    # background tasks are kept here so they are not garbage-collected and can be cancelled at shutdown
+    tasks: List[asyncio.Task] = []
+    selection_redis = None
+    if rt.get("selection_redis", True):
+        selection_redis = aioredis.from_url(rt["redis_dsn"])
+        tasks.append(asyncio.create_task(selection.listen(selection_redis)))
+
+    subs = build_subscribe_lists(cfg, universe.get(), selection.get())
+    shards = [IngestShard(cfg, i, count) for i in indices]
+    for s in shards:
+        s.start(subs)
+    logging.info("ingest running shards=%s of %d", indices, count)
 
     async def autosync_task():
-        # Rebuild subscription lists when universe/selection mtime changes
-        rt = cfg["runtime"]
-        uni = Path(rt["universe_file"])
-        sel = Path(rt["selection_file"])
-        prev = (uni.stat().st_mtime if uni.exists() else 0, sel.stat().st_mtime if sel.exists() else 0)
+        # Rebuild subscription lists when the universe or selection changes (files checked every 10 s,
+        # Redis selection updates wake this up right away)
+        prev = (universe.version, selection.markets)
         while True:
-            await asyncio.sleep(10)
-            now = (uni.stat().st_mtime if uni.exists() else 0, sel.stat().st_mtime if sel.exists() else 0)
-            if now != prev:
-                prev = now
-                new_subs = build_subscribe_lists(cfg)
-                subscribe_updates.labels("ticker").inc()
-                subscribe_updates.labels("trade").inc()
-                subscribe_updates.labels("book").inc()
-                # soft-resubscribe: reconnect to apply new markets
-                await ws.close()
-                await asyncio.sleep(0.5)
-                asyncio.create_task(ws.run(new_subs, handlers))
-
-    # launch ws loop and autosync
-    asyncio.create_task(ws.run(subs, handlers))
-    asyncio.create_task(autosync_task())
-
-    # keep running
-    while True:
-        await asyncio.sleep(3600)
+            selection.changed.clear()
+            try:
+                await asyncio.wait_for(selection.changed.wait(), 10)
+            except asyncio.TimeoutError:
+                pass
+            uni, sel = universe.get(), selection.get()
+            if (universe.version, sel) != prev:
+                prev = (universe.version, sel)
+                new_subs = build_subscribe_lists(cfg, uni, sel)
+                # differential resubscribe on the live connections; unchanged markets keep streaming
+                for s in shards:
+                    try:
+                        await s.resubscribe(new_subs)
+                    except Exception:
+                        logging.exception("resubscribe failed shard=%d; the reconnect loop will apply the new lists",
+                                          s.index)
+
+    tasks.append(asyncio.create_task(autosync_task()))
+
+    # keep running until SIGTERM/SIGINT, then flush buffered parquet rows
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    try:
+        await stop.wait()
+    finally:
+        logging.info("shutting down, flushing redis and parquet buffers")
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(s.close() for s in shards), return_exceptions=True)
+        if selection_redis is not None:
+            await selection_redis.aclose()
+
+
+def _shard_worker(cfg_path: str, shard: int):
+    asyncio.run(main_async(cfg_path, shard))
+
+
+def supervise(cfg_path: str, count: int):
+    """Run one worker process per shard; restart workers that exit, stop all on SIGTERM/SIGINT."""
+    ctx = mp.get_context("spawn")
+    procs: Dict[int, Any] = {}
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    while not stopping:
+        for i in range(count):
+            p = procs.get(i)
+            if p is None or not p.is_alive():
+                if p is not None:
+                    logging.warning("shard %d exited (code %s), restarting", i, p.exitcode)
+                p = procs[i] = ctx.Process(target=_shard_worker, args=(cfg_path, i), name=f"ingest-shard-{i}")
+                p.start()
+        time.sleep(1.0)
+    for p in procs.values():
+        if p.is_alive():
+            p.terminate()  # SIGTERM: the worker flushes its buffers
+    for p in procs.values():
+        p.join(30)
 
 def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True)
+    ap.add_argument("--shard", type=int, help="run only this shard (worker process)")
     return ap.parse_args()
 
 def main():
     args = parse_args()
-    asyncio.run(main_async(args.config))
+    if args.shard is None:
+        sh = load_yaml(args.config).get("shards") or {}
+        count = max(1, int(sh.get("count", 1)))
+        if sh.get("processes") and count > 1:
+            logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+            supervise(args.config, count)
+            return
+    asyncio.run(main_async(args.config, args.shard))
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,31 @@
 from prometheus_client import Counter, Gauge, Histogram, Summary
 
-events_ingested = Counter("ws_events_ingested_total", "Total WS events ingested", ["channel"])
-events_parquet_written = Counter("ws_parquet_rows_total", "Total rows written to Parquet", ["channel"])
-ws_connects = Counter("ws_connects_total", "WebSocket connect attempts")
-ws_reconnects = Counter("ws_reconnects_total", "WebSocket reconnects")
-ws_errors = Counter("ws_errors_total", "WebSocket errors", ["stage"])
-subscribe_updates = Counter("ws_subscribe_updates_total", "Subscribe list rebuilds", ["channel"])
+# every ingest metric carries the shard index ("0" when running unsharded)
+events_ingested = Counter("ws_events_ingested_total", "Total WS events ingested", ["shard", "channel"])
+events_parquet_written = Counter("ws_parquet_rows_total", "Total rows written to Parquet", ["shard", "channel"])
+ws_connects = Counter("ws_connects_total", "WebSocket connect attempts", ["shard"])
+ws_reconnects = Counter("ws_reconnects_total", "WebSocket reconnects", ["shard"])
+ws_errors = Counter("ws_errors_total", "WebSocket errors", ["shard", "stage"])
+subscribe_updates = Counter("ws_subscribe_updates_total", "Subscribe list changes applied", ["shard", "channel"])
+subscription_changes = Counter("ws_subscription_changes_total", "Markets subscribed/unsubscribed on a live connection",
+                               ["shard", "channel", "action"])
+subscribed_markets = Gauge("ws_subscribed_markets", "Markets subscribed on the current connection",
+                           ["shard", "channel"])
+parquet_buffered_rows = Gauge("ws_parquet_buffered_rows", "Rows buffered in memory awaiting Parquet flush",
+                              ["shard", "channel"])
+parquet_flush_seconds = Histogram("ws_parquet_flush_seconds", "Parquet part encode+write latency", ["shard", "channel"],
+                                  buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+parquet_files_written = Counter("ws_parquet_files_total", "Parquet part files written", ["shard", "channel"])
+redis_batch_size = Histogram("ws_redis_batch_size", "Entries per pipelined XADD batch", ["shard"],
+                             buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+redis_flush_seconds = Histogram("ws_redis_flush_seconds", "Round trip of one pipelined XADD batch", ["shard"],
+                                buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+redis_queue_depth = Gauge("ws_redis_queue_depth", "Entries waiting in the Redis writer queue", ["shard"])
+redis_backpressure = Counter("ws_redis_backpressure_total", "Writes that had to wait for a full Redis queue", ["shard"])
+redis_dropped = Counter("ws_redis_dropped_total", "Entries dropped after exhausting Redis retries", ["shard"])
+shard_markets = Gauge("ws_shard_markets", "Markets assigned to this shard", ["shard", "channel"])
+queue_depth = Gauge("ws_queue_depth", "Events waiting between receiver and sink handlers", ["shard", "channel"])
+queue_overflow = Counter("ws_queue_overflow_total", "Events that hit a full channel queue, by policy outcome",
+                         ["shard", "channel", "action"])
+classify_fallback = Counter("ws_classify_fallback_total", "Frames without an event field classified by key sniffing",
+                            ["shard"])
@@ -0,0 +1,196 @@
+"""
+Receive/handle decoupling for one ingest shard.
+
+The WS receiver only decodes, classifies and puts events into a bounded
+queue per channel; one consumer task per channel awaits the sink handlers
+(Redis XADD, Parquet append). A slow Redis or disk therefore fills a queue
+instead of stalling the socket (ping timeouts).
+
+What happens when a queue is full is the channel's overflow policy:
+
+- ``block``: the receiver waits for room (nothing is lost; use for trades)
+- ``coalesce``: merge into the pending event of the same market (ticker;
+  fields are merged because Bitvavo tickers only carry changed fields)
+- ``collapse``: merge a contiguous book delta into the pending delta of the
+  same market; the merged event keeps ``nonceStart`` so consumers can still
+  verify nonce continuity
+- ``drop``: drop the new event
+
+Merging needs at most one pending event per market beyond ``maxsize``, so
+coalescing queues are bounded by maxsize + number of markets.
+"""
+import asyncio, logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from .metrics import queue_depth, queue_overflow, ws_errors
+
+log = logging.getLogger(__name__)
+
+# handler(evt, raw, recv_ms): raw is the undecoded frame when passthrough is on, else None
+Handler = Callable[[Dict[str, Any], Optional[bytes], Optional[int]], Awaitable[None]]
+
+POLICIES = ("block", "coalesce", "collapse", "drop")
+DEFAULT_QUEUES = {
+    "ticker": {"maxsize": 20_000, "policy": "coalesce"},
+    "trade": {"maxsize": 50_000, "policy": "block"},
+    "book": {"maxsize": 20_000, "policy": "collapse"},
+}
+
+
+def _merge_levels(old, new):
+    # levels are absolute [price, size]; the newest size per price wins, size 0 = remove
+    merged = {str(l[0]): l for l in old or ()}
+    for l in new or ():
+        merged[str(l[0])] = l
+    return list(merged.values())
+
+
+def merge_book(pending: Dict[str, Any], evt: Dict[str, Any]) -> bool:
+    """Fold `evt` into `pending` if it is the next nonce; returns False on a gap."""
+    try:
+        if int(evt["nonce"]) != int(pending["nonce"]) + 1:
+            return False
+    except (KeyError, TypeError, ValueError):
+        return False
+    pending.setdefault("nonceStart", pending["nonce"])
+    pending["bids"] = _merge_levels(pending.get("bids"), evt.get("bids"))
+    pending["asks"] = _merge_levels(pending.get("asks"), evt.get("asks"))
+    pending["nonce"] = evt["nonce"]
+    return True
+
+
+def merge_ticker(pending: Dict[str, Any], evt: Dict[str, Any]) -> bool:
+    pending.update(evt)
+    return True
+
+
+_MERGE = {"coalesce": merge_ticker, "collapse": merge_book}
+
+
+class ChannelQueue:
+    def __init__(self, channel: str, maxsize: int, policy: str, shard: str = "0"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r} for {channel}")
+        self.channel = channel
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        # entries are [evt, raw, recv_ms]; raw is cleared when another event is merged in,
+        # recv_ms stays that of the oldest merged event
+        self._items: Deque[List[Any]] = deque()
+        # newest queued entry per market, for merging on overflow
+        self._pending: Dict[str, List[Any]] = {}
+        self._merge = _MERGE.get(policy)
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._depth = queue_depth.labels(shard, channel)
+        self._overflow = {a: queue_overflow.labels(shard, channel, a)
+                          for a in ("blocked", "coalesced", "collapsed", "dropped")}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _append(self, evt: Dict[str, Any], raw: Optional[bytes], recv_ms: Optional[int]):
+        entry = [evt, raw, recv_ms]
+        self._items.append(entry)
+        if self._merge is not None:
+            m = evt.get("market")
+            if m:
+                self._pending[m] = entry
+        self._not_empty.set()
+        if len(self._items) >= self.maxsize:
+            self._not_full.clear()
+
+    async def put(self, evt: Dict[str, Any], raw: Optional[bytes] = None, recv_ms: Optional[int] = None):
+        if len(self._items) < self.maxsize:
+            self._append(evt, raw, recv_ms)
+            return
+        if self.policy == "block":
+            self._overflow["blocked"].inc()
+            while len(self._items) >= self.maxsize:
+                await self._not_full.wait()
+            self._append(evt, raw, recv_ms)
+            return
+        if self._merge is not None:
+            pending = self._pending.get(evt.get("market"))
+            if pending is not None and self._merge(pending[0], evt):
+                pending[1] = None
+                self._overflow["coalesced" if self.policy == "coalesce" else "collapsed"].inc()
+                return
+            if evt.get("market"):
+                # first pending event for this market (or a book gap): keep it
+                self._append(evt, raw, recv_ms)
+                return
+        self._overflow["dropped"].inc()
+
+    async def get(self) -> List[Any]:
+        """Next [evt, raw, recv_ms] entry."""
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        entry = self._items.popleft()
+        if self._merge is not None:
+            m = entry[0].get("market")
+            if m and self._pending.get(m) is entry:
+                del self._pending[m]
+        if len(self._items) < self.maxsize:
+            self._not_full.set()
+        return entry
+
+    def sample_depth(self):
+        self._depth.set(len(self._items))
+
+
+class Pipeline:
+    """Bounded per-channel queues between the WS receiver and the sink handlers."""
+
+    def __init__(self, handlers: Dict[str, Handler], queues_cfg: Optional[Dict[str, Dict[str, Any]]] = None,
+                 shard: str = "0"):
+        self.shard = shard
+        self.handlers = handlers
+        cfg = queues_cfg or {}
+        self.queues: Dict[str, ChannelQueue] = {}
+        for ch in handlers:
+            c = {**DEFAULT_QUEUES.get(ch, {"maxsize": 20_000, "policy": "block"}), **(cfg.get(ch) or {})}
+            self.queues[ch] = ChannelQueue(ch, int(c["maxsize"]), c["policy"], shard)
+        self._tasks: list = []
+        self._busy = 0
+
+    def receivers(self) -> Dict[str, Handler]:
+        """Handlers for WSClient.run: enqueue only."""
+        return {ch: q.put for ch, q in self.queues.items()}
+
+    async def _consume(self, ch: str):
+        q, handler = self.queues[ch], self.handlers[ch]
+        while True:
+            evt, raw, recv_ms = await q.get()
+            self._busy += 1
+            try:
+                await handler(evt, raw, recv_ms)
+            except Exception:
+                ws_errors.labels(self.shard, "handler").inc()
+                log.exception("%s handler failed", ch)
+            finally:
+                self._busy -= 1
+
+    async def _sample(self, interval: float):
+        while True:
+            for q in self.queues.values():
+                q.sample_depth()
+            await asyncio.sleep(interval)
+
+    def start(self, sample_interval: float = 1.0):
+        self._tasks = [asyncio.create_task(self._consume(ch)) for ch in self.queues]
+        self._tasks.append(asyncio.create_task(self._sample(sample_interval)))
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait (bounded) until the queues are empty, then stop the consumers."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._busy or any(len(q) for q in self.queues.values())) and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for q in self.queues.values():
+            q.sample_depth()
@@ -0,0 +1,140 @@
+"""
+Declared Arrow schemas for the Parquet lake, one per channel directory.
+
+Numeric strings from the Bitvavo WS feed are converted to float64 once, at
+ingest, and every row gets an int64 epoch-ms `ts`. Rows are collected
+column-wise (`ColumnBuffer`) so a flush is a handful of `pa.array` calls
+instead of schema inference over a list of dicts.
+"""
+import time
+import pyarrow as pa
+from typing import Any, Callable, Dict, List, Optional
+
+SCHEMA_VERSION = "v1"
+SCHEMA_META_KEY = b"tradingbot.schema"
+
+_f64_list = pa.list_(pa.float64())
+
+
+def _schema(name: str, fields: List[pa.Field]) -> pa.Schema:
+    return pa.schema(fields, metadata={SCHEMA_META_KEY: f"{name}/{SCHEMA_VERSION}".encode()})
+
+
+TICKER_SCHEMA = _schema("tickers", [
+    pa.field("ts", pa.int64(), nullable=False),
+    pa.field("market", pa.string(), nullable=False),
+    pa.field("bestBid", pa.float64()),
+    pa.field("bestBidSize", pa.float64()),
+    pa.field("bestAsk", pa.float64()),
+    pa.field("bestAskSize", pa.float64()),
+    pa.field("lastPrice", pa.float64()),
+])
+
+TRADE_SCHEMA = _schema("trades", [
+    pa.field("ts", pa.int64(), nullable=False),
+    pa.field("market", pa.string(), nullable=False),
+    pa.field("id", pa.string()),
+    pa.field("price", pa.float64()),
+    pa.field("amount", pa.float64()),
+    pa.field("side", pa.string()),
+])
+
+BOOK_SCHEMA = _schema("books", [
+    pa.field("ts", pa.int64(), nullable=False),
+    pa.field("market", pa.string(), nullable=False),
+    pa.field("nonce", pa.int64()),
+    pa.field("bid_price", _f64_list),
+    pa.field("bid_size", _f64_list),
+    pa.field("ask_price", _f64_list),
+    pa.field("ask_size", _f64_list),
+])
+
+SCHEMAS: Dict[str, pa.Schema] = {
+    "tickers": TICKER_SCHEMA,
+    "trades": TRADE_SCHEMA,
+    "books": BOOK_SCHEMA,
+}
+
+
+def to_float(x) -> Optional[float]:
+    if x is None:
+        return None
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ts(evt: Dict[str, Any], now_ms: int) -> int:
+    t = evt.get("timestamp") or evt.get("ts")
+    try:
+        return int(t) if t is not None else now_ms
+    except (TypeError, ValueError):
+        return now_ms
+
+
+def _levels(levels) -> tuple:
+    prices, sizes = [], []
+    for lvl in levels or ():
+        try:
+            prices.append(float(lvl[0]))
+            sizes.append(float(lvl[1]))
+        except (TypeError, ValueError, IndexError):
+            continue
+    return prices, sizes
+
+
+def _ticker_row(evt: Dict[str, Any], market: str, now_ms: int) -> tuple:
+    return (_ts(evt, now_ms), market,
+            to_float(evt.get("bestBid")), to_float(evt.get("bestBidSize")),
+            to_float(evt.get("bestAsk")), to_float(evt.get("bestAskSize")),
+            to_float(evt.get("lastPrice")))
+
+
+def _trade_row(evt: Dict[str, Any], market: str, now_ms: int) -> tuple:
+    tid = evt.get("id")
+    return (_ts(evt, now_ms), market, None if tid is None else str(tid),
+            to_float(evt.get("price")), to_float(evt.get("amount")), evt.get("side"))
+
+
+def _book_row(evt: Dict[str, Any], market: str, now_ms: int) -> tuple:
+    nonce = evt.get("nonce")
+    bp, bs = _levels(evt.get("bids"))
+    ap, as_ = _levels(evt.get("asks"))
+    return (_ts(evt, now_ms), market, None if nonce is None else int(nonce), bp, bs, ap, as_)
+
+
+ROW_BUILDERS: Dict[str, Callable[[Dict[str, Any], str, int], tuple]] = {
+    "tickers": _ticker_row,
+    "trades": _trade_row,
+    "books": _book_row,
+}
+
+
+class ColumnBuffer:
+    """Append-only column lists for one declared schema."""
+    __slots__ = ("schema", "_build", "_cols")
+
+    def __init__(self, channel: str):
+        self.schema = SCHEMAS[channel]
+        self._build = ROW_BUILDERS[channel]
+        self._cols: List[list] = [[] for _ in self.schema]
+
+    def __len__(self) -> int:
+        return len(self._cols[0])
+
+    def append(self, evt: Dict[str, Any], market: str, now_ms: Optional[int] = None):
+        row = self._build(evt, market, now_ms if now_ms is not None else int(time.time() * 1000))
+        for col, v in zip(self._cols, row):
+            col.append(v)
+
+    def to_table(self) -> pa.Table:
+        arrays = [pa.array(col, type=f.type) for col, f in zip(self._cols, self.schema)]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+
+def is_typed(schema: pa.Schema, channel: str) -> bool:
+    """True if a file schema was written by this module for `channel`."""
+    meta = schema.metadata or {}
+    tag = meta.get(SCHEMA_META_KEY, b"").decode()
+    return tag.startswith(f"{channel}/")
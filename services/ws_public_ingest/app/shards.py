@@ -0,0 +1,28 @@
+"""
+Market -> shard assignment for multi-connection ingest.
+
+Rendezvous (highest-random-weight) hashing: a market goes to the shard with
+the highest hash(shard, market). The assignment depends only on the market
+name and the shard count, so universe changes never move markets that stay
+listed, and changing the count moves roughly 1/N of them.
+"""
+import hashlib
+from functools import lru_cache
+from typing import Dict, List
+
+
+@lru_cache(maxsize=65536)
+def shard_of(market: str, count: int) -> int:
+    if count <= 1:
+        return 0
+    best, best_w = 0, b""
+    for i in range(count):
+        w = hashlib.blake2b(f"{i}:{market}".encode(), digest_size=8).digest()
+        if w > best_w:
+            best, best_w = i, w
+    return best
+
+
+def shard_subscriptions(subs: Dict[str, List[str]], shard: int, count: int) -> Dict[str, List[str]]:
+    """The part of {channel: [markets]} that belongs to `shard`."""
+    return {ch: [m for m in markets if shard_of(m, count) == shard] for ch, markets in subs.items()}
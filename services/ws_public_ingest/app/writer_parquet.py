@@ -1,21 +1,133 @@
+import asyncio, itertools, logging, os, time
 import pyarrow as pa
 import pyarrow.parquet as pq
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple, Union
+from .schemas import SCHEMAS, ColumnBuffer
+from .metrics import (events_parquet_written, parquet_buffered_rows, parquet_flush_seconds,
+                      parquet_files_written)
+
+log = logging.getLogger(__name__)
+
+BufferKey = Tuple[str, str, str]  # (channel, market, UTC date)
+# one sequence per process: in-process shards share the pid
+_SEQ = itertools.count()
+
+
+class _Buffer:
+    __slots__ = ("rows", "opened")
+
+    def __init__(self, channel: str, opened: float):
+        # declared channels are built column-wise; anything else falls back to dict rows
+        self.rows: Union[ColumnBuffer, List[Dict[str, Any]]] = (
+            ColumnBuffer(channel) if channel in SCHEMAS else [])
+        self.opened = opened
+
+    def append(self, rows: List[Dict[str, Any]], market: str, now_ms: int):
+        if isinstance(self.rows, list):
+            self.rows.extend(rows)
+            return
+        for r in rows:
+            self.rows.append(r, market, now_ms)
+
+    def to_table(self) -> pa.Table:
+        if isinstance(self.rows, list):
+            return pa.Table.from_pylist(self.rows)
+        return self.rows.to_table()
+
 
 class ParquetWriter:
-    def __init__(self, root: str):
+    """
+    Buffers rows per (channel, market, UTC date) and writes one part file per
+    buffer when it is older than `rotation_seconds` or holds `max_rows_per_file`
+    rows. Appends are in-memory; the actual Parquet encode/write runs in a worker
+    thread so the WS receive loop never blocks on disk.
+    """
+
+    def __init__(self, root: str, rotation_seconds: int = 300, max_rows_per_file: int = 500_000,
+                 shard: str = "0"):
         self.root = Path(root)
+        self.shard = shard
+        self.rotation_seconds = float(rotation_seconds)
+        self.max_rows_per_file = int(max_rows_per_file)
+        self._buffers: Dict[BufferKey, _Buffer] = {}
+        self._seq = _SEQ
+        self._pending: set = set()
 
-    def _path(self, channel: str, market: str):
-        d = datetime.now(timezone.utc).astimezone().strftime("%Y-%m-%d")
-        base = self.root / f"{channel}" / f"date={d}" / f"market={market}"
+    def _path(self, channel: str, market: str, date: str) -> Path:
+        base = self.root / f"{channel}" / f"date={date}" / f"market={market}"
         base.mkdir(parents=True, exist_ok=True)
-        return base / f"part-{int(datetime.now().timestamp())}.parquet"
+        # ms + pid + sequence: unique within and across processes
+        return base / f"part-{int(time.time()*1000)}-{os.getpid()}-{next(self._seq):06d}.parquet"
 
     def write_rows(self, channel: str, market: str, rows: List[Dict[str, Any]]):
         if not rows:
             return
-        table = pa.Table.from_pylist(rows)
-        pq.write_table(table, self._path(channel, market))
+        now = time.time()
+        date = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+        key = (channel, market, date)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = _Buffer(channel, now)
+        buf.append(rows, market, int(now * 1000))
+        parquet_buffered_rows.labels(self.shard, channel).inc(len(rows))
+        if len(buf.rows) >= self.max_rows_per_file:
+            self._schedule(key)
+
+    def _take(self, key: BufferKey):
+        buf = self._buffers.pop(key, None)
+        if buf is None or not len(buf.rows):
+            return None
+        parquet_buffered_rows.labels(self.shard, key[0]).dec(len(buf.rows))
+        return buf
+
+    def _write_file(self, key: BufferKey, buf: _Buffer):
+        channel, market, date = key
+        t0 = time.perf_counter()
+        rows = len(buf.rows)
+        table = buf.to_table()
+        final = self._path(channel, market, date)
+        tmp = final.with_name("." + final.name + ".tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, final)
+        parquet_flush_seconds.labels(self.shard, channel).observe(time.perf_counter() - t0)
+        parquet_files_written.labels(self.shard, channel).inc()
+        events_parquet_written.labels(self.shard, channel).inc(rows)
+
+    def _schedule(self, key: BufferKey):
+        buf = self._take(key)
+        if buf is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_file(key, buf)
+            return
+        task = loop.create_task(self._flush_async(key, buf))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _flush_async(self, key: BufferKey, buf: _Buffer):
+        try:
+            await asyncio.to_thread(self._write_file, key, buf)
+        except Exception:
+            log.exception("parquet flush failed channel=%s market=%s rows=%d", key[0], key[1], len(buf.rows))
+
+    def flush_due(self, now: float = None):
+        now = time.time() if now is None else now
+        for key in [k for k, b in self._buffers.items() if now - b.opened >= self.rotation_seconds]:
+            self._schedule(key)
+
+    async def run(self, check_interval: float = 1.0):
+        """Background task: rotate buffers that exceeded rotation_seconds."""
+        while True:
+            await asyncio.sleep(check_interval)
+            self.flush_due()
+
+    async def close(self):
+        """Flush everything still buffered and wait for in-flight writes."""
+        for key in list(self._buffers):
+            self._schedule(key)
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
@@ -1,12 +1,151 @@
-import asyncio, orjson, time
-from typing import Dict, Any
+import asyncio, logging, time
+from typing import Dict, Any, List, Optional, Tuple
 import redis.asyncio as redis
+from . import codec
+from .metrics import (redis_batch_size, redis_flush_seconds, redis_queue_depth, redis_backpressure,
+                      redis_dropped, ws_errors)
+
+log = logging.getLogger(__name__)
+
+_STOP = object()    # queued by `close`: the run loop returns after the entries before it
+
 
 class RedisWriter:
-    def __init__(self, dsn: str):
+    """
+    Batching stream writer. `write_stream` only enqueues; a background task
+    (`run`) drains the queue in batches of up to `batch_max` entries or
+    `linger_ms`, whichever comes first, and sends each batch as one
+    non-transactional pipeline of `XADD ... MAXLEN ~ n`.
+
+    The queue is bounded: when Redis falls behind, `write_stream` waits for
+    room (counted in `ws_redis_backpressure_total`) instead of growing memory.
+
+    `set_latest` keeps per-market latest-state keys (`ws:{kind}:{market}`).
+    Updates are coalesced per key and sent with the next batch, so a burst of
+    ticks on one market costs a single SET.
+
+    Values are encoded with `codec`: JSON (orjson) by default, or compact
+    binary for ticker/book/trade with `codec="binary"` (smaller entries,
+    slower to encode and decode than orjson).
+    """
+
+    def __init__(self, dsn: str, batch_max: int = 500, linger_ms: float = 5.0, queue_max: int = 50_000,
+                 maxlen: Optional[Dict[str, int]] = None, max_retries: int = 3, latest_ttl_s: int = 300,
+                 shard: str = "0", codec: str = "json"):
+        self.shard = shard
+        self.binary = codec == "binary"
         self._client = redis.from_url(dsn, decode_responses=False)
-    async def write_stream(self, stream: str, payload: Dict[str, Any]):
-        data = orjson.dumps(payload)
-        await self._client.xadd(stream, {"v": data})
+        self.batch_max = int(batch_max)
+        self.linger = float(linger_ms) / 1000.0
+        self.queue_max = int(queue_max)
+        self.maxlen: Dict[str, int] = {k: int(v) for k, v in (maxlen or {}).items() if v}
+        self.max_retries = int(max_retries)
+        self.latest_ttl = int(latest_ttl_s) or None
+        self._q: Optional[asyncio.Queue] = None
+        self._latest: Dict[str, bytes] = {}
+        self._runner: Optional[asyncio.Task] = None
+
+    def _queue(self) -> asyncio.Queue:
+        if self._q is None:
+            self._q = asyncio.Queue(maxsize=self.queue_max)
+        return self._q
+
+    async def write_stream(self, stream: str, payload: Dict[str, Any], raw: Optional[bytes] = None,
+                           recv_ms: Optional[int] = None):
+        """
+        Queue one XADD. Fields: `v` = encoded payload, `rt` = WS receive time
+        in epoch ms for latency tracing. With the JSON codec `raw`, the
+        original WS frame, is stored as-is instead of re-serializing.
+        """
+        if self.binary or raw is None:
+            data = codec.encode(payload, self.binary)
+        else:
+            data = raw
+        q = self._queue()
+        if q.full():
+            redis_backpressure.labels(self.shard).inc()
+        await q.put((stream, data, recv_ms))
+
+    def set_latest(self, key: str, state: Dict[str, Any]):
+        """Queue a latest-state SET; only the newest value per key is sent."""
+        self._latest[key] = codec.encode(state, self.binary)
+
+    async def _collect(self, q: asyncio.Queue) -> List[Tuple[str, bytes, Optional[int]]]:
+        batch = [await q.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.linger
+        while len(batch) < self.batch_max and batch[-1] is not _STOP:
+            try:
+                batch.append(q.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(q.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, batch: List[Tuple[str, bytes, Optional[int]]]):
+        latest, self._latest = self._latest, {}
+        for attempt in range(1, self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                pipe = self._client.pipeline(transaction=False)
+                # latest-state first, so a consumer woken by the XADD already sees it
+                for key, data in latest.items():
+                    pipe.set(key, data, ex=self.latest_ttl)
+                for stream, data, recv_ms in batch:
+                    fields = {"v": data} if recv_ms is None else {"v": data, "rt": recv_ms}
+                    pipe.xadd(stream, fields, maxlen=self.maxlen.get(stream), approximate=True)
+                await pipe.execute()
+                redis_flush_seconds.labels(self.shard).observe(time.perf_counter() - t0)
+                redis_batch_size.labels(self.shard).observe(len(batch))
+                return
+            except Exception:
+                ws_errors.labels(self.shard, "redis").inc()
+                if attempt == self.max_retries:
+                    log.exception("redis batch dropped after %d attempts (size=%d)", attempt, len(batch))
+                    redis_dropped.labels(self.shard).inc(len(batch))
+                    return
+                await asyncio.sleep(0.1 * attempt)
+
+    async def run(self):
+        """Background task: drain the queue into pipelined XADD batches until `close`."""
+        q = self._queue()
+        self._runner = asyncio.current_task()
+        while True:
+            batch = await self._collect(q)
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            redis_queue_depth.labels(self.shard).set(q.qsize())
+            if batch:
+                await self._send(batch)
+            if stop:
+                return
+
+    async def close(self):
+        """
+        Stop the run loop (it finishes the batch in flight and everything
+        queued before the stop), send what is left, then close the connection.
+        """
+        q = self._queue()
+        if self._runner is not None and not self._runner.done():
+            await q.put(_STOP)
+            await self._runner
+        if q.empty() and self._latest:
+            await self._send([])
+        while not q.empty():
+            batch = []
+            while not q.empty() and len(batch) < self.batch_max:
+                batch.append(q.get_nowait())
+            await self._send(batch)
+        redis_queue_depth.labels(self.shard).set(0)
+        await self._client.aclose()
+
     async def ping(self):
         await self._client.ping()
@@ -1,8 +1,10 @@
-import asyncio, orjson, logging
+import asyncio, orjson, logging, time
 import websockets
-from websockets.client import WebSocketClientProtocol
-from typing import List, Dict, Any, Optional
-from .metrics import ws_connects, ws_reconnects, ws_errors, events_ingested
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosedOK
+from typing import List, Dict, Any, Optional, Set
+from .metrics import ws_connects, ws_reconnects, ws_errors, events_ingested, subscribe_updates, \
+    subscription_changes, subscribed_markets, classify_fallback
 
 SUB_TPL = {
     "ticker": {"action": "subscribe", "channels": [{"name": "ticker", "markets": []}]},
@@ -10,15 +12,60 @@ SUB_TPL = {
     "book":   {"action": "subscribe", "channels": [{"name": "book", "markets": []}]},
 }
 
+# Classification per project WS-contract: the `event` field decides
+EVENT_CHANNEL = {
+    "ticker": "ticker",
+    "ticker24h": "ticker",
+    "trade": "trade",
+    "trades": "trade",
+    "book": "book",
+}
+
+
+def sniff_channel(evt: Dict[str, Any]) -> Optional[str]:
+    """Fallback for frames without an `event` field: guess the channel from the keys."""
+    if "market" not in evt:
+        return None
+    if "bestBid" in evt or "bestAsk" in evt or "lastPrice" in evt:
+        return "ticker"
+    if "amount" in evt and "price" in evt and "side" in evt:
+        return "trade"
+    if "bids" in evt or "asks" in evt:
+        return "book"
+    return None
+
+
+def classify(evt: Dict[str, Any]) -> Optional[str]:
+    ev = evt.get("event")
+    if ev is not None:
+        return EVENT_CHANNEL.get(ev)
+    return sniff_channel(evt)
+
+
 class WSClient:
-    def __init__(self, url: str, max_retries: int = 3, backoff_ms: int = 750):
+    """
+    Handlers are called as `await handler(evt, raw, recv_ms)`. With
+    `raw_passthrough` `raw` is the undecoded frame (bytes) so the Redis sink
+    can store it as-is; otherwise it is None. `recv_ms` is the receive time
+    (epoch ms), carried to Redis for latency tracing.
+    """
+
+    def __init__(self, url: str, max_retries: int = 3, backoff_ms: int = 750, shard: str = "0",
+                 raw_passthrough: bool = False):
         self.url = url
+        self.shard = shard
         self.max_retries = max_retries
         self.backoff_ms = backoff_ms
-        self.ws: Optional[WebSocketClientProtocol] = None
+        self.raw_passthrough = raw_passthrough
+        self.ws: Optional[ClientConnection] = None
+        # desired markets per channel, and what the live connection is subscribed to
+        self.channels: Dict[str, List[str]] = {}
+        self._subscribed: Dict[str, Set[str]] = {}
+        self._sub_lock = asyncio.Lock()
+        self._stopped = False
 
     async def connect(self):
-        ws_connects.inc()
+        ws_connects.labels(self.shard).inc()
         self.ws = await websockets.connect(self.url, ping_interval=20, ping_timeout=20, close_timeout=5)
 
     async def close(self):
@@ -28,70 +75,114 @@ class WSClient:
             except Exception:
                 pass
             self.ws = None
+        self._subscribed = {}
+
+    async def stop(self):
+        """Close for good: the run loop exits instead of reconnecting."""
+        self._stopped = True
+        await self.close()
+
+    async def _send(self, action: str, ch: str, markets: List[str]):
+        # batch markets to avoid oversized subscribe payloads
+        name = SUB_TPL[ch]["channels"][0]["name"]
+        BATCH = 50
+        for i in range(0, len(markets), BATCH):
+            chunk = markets[i:i+BATCH]
+            msg = {"action": action, "channels": [{"name": name, "markets": chunk}]}
+            await self.ws.send(orjson.dumps(msg).decode())
+            await asyncio.sleep(0.05)
+
+    async def _sync(self):
+        """Send only the subscribe/unsubscribe deltas between the desired and the live state."""
+        async with self._sub_lock:
+            if self.ws is None:
+                return
+            for ch in SUB_TPL:
+                want = self.channels.get(ch) or []
+                have = self._subscribed.setdefault(ch, set())
+                added = [m for m in want if m not in have]
+                removed = sorted(have - set(want))
+                if removed:
+                    await self._send("unsubscribe", ch, removed)
+                    have.difference_update(removed)
+                    subscription_changes.labels(self.shard, ch, "unsubscribe").inc(len(removed))
+                if added:
+                    await self._send("subscribe", ch, added)
+                    have.update(added)
+                    subscription_changes.labels(self.shard, ch, "subscribe").inc(len(added))
+                subscribed_markets.labels(self.shard, ch).set(len(have))
 
     async def subscribe(self, channels: Dict[str, List[str]]):
         # channels: {"ticker": [...], "trade": [...], "book": [...]}
-        for ch, markets in channels.items():
-            if not markets:
+        self.channels = {ch: list(m) for ch, m in channels.items()}
+        await self._sync()
+
+    async def update(self, channels: Dict[str, List[str]]):
+        """
+        Apply a new subscription set on the live connection. Markets that stay
+        subscribed are untouched, so their event flow has no gap. Without a
+        connection only the desired state changes; the next connect uses it.
+        """
+        for ch in SUB_TPL:
+            if set(channels.get(ch) or []) != set(self.channels.get(ch) or []):
+                subscribe_updates.labels(self.shard, ch).inc()
+        await self.subscribe(channels)
+
+    async def _receive(self, handlers: Dict[str, Any]):
+        loads, recv, now = orjson.loads, self.ws.recv, time.time
+        passthrough = self.raw_passthrough
+        ingested = {ch: events_ingested.labels(self.shard, ch) for ch in handlers}
+        decode_errors = ws_errors.labels(self.shard, "decode")
+        handler_errors = ws_errors.labels(self.shard, "handler")
+        fallback = classify_fallback.labels(self.shard)
+        while True:
+            # bytes, not str: orjson parses it directly and the sink can reuse it
+            raw = await recv(decode=False)
+            recv_ms = int(now() * 1000)
+            try:
+                evt = loads(raw)
+            except Exception:
+                decode_errors.inc()
+                continue
+            if type(evt) is not dict:
                 continue
-            # batch markets to avoid oversized subscribe payloads
-            name = SUB_TPL[ch]["channels"][0]["name"]
-            BATCH = 50
-            for i in range(0, len(markets), BATCH):
-                chunk = markets[i:i+BATCH]
-                msg = SUB_TPL[ch].copy()
-                msg["channels"] = [{"name": name, "markets": chunk}]
-                await self.ws.send(orjson.dumps(msg).decode())
-                await asyncio.sleep(0.05)
+            ev = evt.get("event")
+            if ev is not None:
+                ch = EVENT_CHANNEL.get(ev)
+            else:
+                ch = sniff_channel(evt)
+                if ch is not None:
+                    fallback.inc()
+            handler = handlers.get(ch) if ch else None
+            if handler is None:
+                continue
+            try:
+                await handler(evt, raw if passthrough else None, recv_ms)
+                ingested[ch].inc()
+            except Exception:
+                handler_errors.inc()
 
     async def run(self, channels: Dict[str, List[str]], handlers: Dict[str, Any]):
         attempt = 0
-        while True:
+        self.channels = {ch: list(m) for ch, m in channels.items()}
+        while not self._stopped:
             try:
                 await self.connect()
-                await self.subscribe(channels)
-                async for raw in self.ws:
-                    evt = None
-                    try:
-                        evt = orjson.loads(raw)
-                        if not isinstance(evt, dict):
-                            continue
-                    except Exception:
-                        ws_errors.labels("decode").inc()
-                        continue
-
-                    # Classification strictly per project WS-contract
-                    evname = evt.get("event")
-                    ch = None
-                    # ticker events (project uses event="ticker" and bestBid/bestAsk/lastPrice)
-                    if evname in ("ticker", "ticker24h") or (
-                        "market" in evt and (("bestBid" in evt or "bestAsk" in evt or "lastPrice" in evt) and evname is None)
-                    ):
-                        ch = "ticker"
-                    # trade events
-                    elif evname in ("trades", "trade") or (
-                        "market" in evt and "amount" in evt and "price" in evt and "side" in evt
-                    ):
-                        ch = "trade"
-                    # book events
-                    elif evname == "book" or ("market" in evt and ("bids" in evt or "asks" in evt)):
-                        ch = "book"
-
-                    if ch and ch in handlers:
-                        try:
-                            await handlers[ch](evt)
-                            events_ingested.labels(ch).inc()
-                        except Exception:
-                            ws_errors.labels("handler").inc()
+                # a fresh connection has no subscriptions: _sync sends the full desired set
+                self._subscribed = {}
+                await self._sync()
+                await self._receive(handlers)
+            except ConnectionClosedOK:
+                pass
             except Exception:
-                ws_errors.labels("loop").inc()
+                ws_errors.labels(self.shard, "loop").inc()
                 attempt += 1
                 if attempt > self.max_retries:
                     logging.exception("WS failed permanently")
                     await asyncio.sleep(2.0)
                     attempt = 0
                 else:
-                    ws_reconnects.inc()
+                    ws_reconnects.labels(self.shard).inc()
                     await asyncio.sleep(self.backoff_ms/1000 * attempt)
             finally:
                 await self.close()
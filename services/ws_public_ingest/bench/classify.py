@@ -0,0 +1,106 @@
+"""
+Microbenchmark: WS frame decode + classification + Redis payload per core.
+
+    cd services/ws_public_ingest && python -m bench.classify [--n 200000]
+
+`before` is the pre-dispatch path (str frame, key-sniffing chain, re-encode
+with orjson.dumps for the Redis sink); `after` is WSClient's current path
+(bytes frame, `event` dispatch table), with and without raw passthrough.
+Prints messages/second per variant as JSON.
+"""
+import argparse, json, random, time
+import orjson
+from app.ws_client import EVENT_CHANNEL, sniff_channel
+
+
+def synthetic_frames(n: int, seed: int = 7) -> list:
+    rnd = random.Random(seed)
+    markets = [f"M{i:03d}-EUR" for i in range(200)]
+    out = []
+    for i in range(n):
+        m = rnd.choice(markets)
+        p = round(rnd.uniform(1, 1000), 4)
+        r = rnd.random()
+        if r < 0.6:
+            evt = {"event": "book", "market": m, "nonce": i,
+                   "bids": [[str(p), str(round(rnd.random() * 5, 6))]],
+                   "asks": [[str(p * 1.001), str(round(rnd.random() * 5, 6))]]}
+        elif r < 0.9:
+            evt = {"event": "ticker", "market": m, "bestBid": str(p), "bestBidSize": "1.5",
+                   "bestAsk": str(p * 1.001), "bestAskSize": "2.0"}
+        else:
+            evt = {"event": "trade", "timestamp": 1_700_000_000_000 + i, "market": m, "id": str(i),
+                   "amount": "0.25", "price": str(p), "side": rnd.choice(("buy", "sell"))}
+        out.append(orjson.dumps(evt))
+    return out
+
+
+def legacy_classify(evt):
+    evname = evt.get("event")
+    if evname in ("ticker", "ticker24h") or (
+        "market" in evt and (("bestBid" in evt or "bestAsk" in evt or "lastPrice" in evt) and evname is None)
+    ):
+        return "ticker"
+    if evname in ("trades", "trade") or ("market" in evt and "amount" in evt and "price" in evt and "side" in evt):
+        return "trade"
+    if evname == "book" or ("market" in evt and ("bids" in evt or "asks" in evt)):
+        return "book"
+    return None
+
+
+def before(frames):
+    n = 0
+    for raw in frames:
+        evt = orjson.loads(raw)
+        if not isinstance(evt, dict):
+            continue
+        if legacy_classify(evt):
+            orjson.dumps(evt)
+            n += 1
+    return n
+
+
+def after(frames, passthrough: bool):
+    n = 0
+    loads, dumps, table = orjson.loads, orjson.dumps, EVENT_CHANNEL
+    for raw in frames:
+        evt = loads(raw)
+        if type(evt) is not dict:
+            continue
+        ev = evt.get("event")
+        ch = table.get(ev) if ev is not None else sniff_channel(evt)
+        if ch is None:
+            continue
+        data = raw if passthrough else dumps(evt)
+        n += 1
+    return n
+
+
+def bench(fn, frames, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(frames)
+        best = min(best, time.perf_counter() - t0)
+    return len(frames) / best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    frames = synthetic_frames(args.n)
+    text_frames = [f.decode() for f in frames]  # websockets' default: text frames as str
+    res = {
+        "messages": args.n,
+        "before_msgs_per_s": bench(before, text_frames, args.repeat),
+        "after_msgs_per_s": bench(lambda f: after(f, False), frames, args.repeat),
+        "after_passthrough_msgs_per_s": bench(lambda f: after(f, True), frames, args.repeat),
+    }
+    res["speedup"] = res["after_passthrough_msgs_per_s"] / res["before_msgs_per_s"]
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
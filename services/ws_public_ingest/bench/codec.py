@@ -0,0 +1,50 @@
+"""
+Microbenchmark: Redis stream payload size, encode and decode per codec.
+
+    cd services/ws_public_ingest && python -m bench.codec [--n 200000]
+
+`json_stdlib` is trading_core's former read path (decode_responses=True,
+then `json.loads`), `json_orjson` the JSON codec with orjson, `binary` the
+struct layout of app/codec.py. Prints mean bytes per entry and
+entries/second for encode and decode as JSON.
+"""
+import argparse, json, time
+import orjson
+from app import codec
+from bench.classify import synthetic_frames
+
+
+def bench(fn, items, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for x in items:
+            fn(x)
+        best = min(best, time.perf_counter() - t0)
+    return len(items) / best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    events = [orjson.loads(f) for f in synthetic_frames(args.n)]
+    as_json = [orjson.dumps(e) for e in events]
+    as_binary = [codec.encode(e) for e in events]
+    res = {
+        "messages": args.n,
+        "json_bytes": sum(map(len, as_json)) / args.n,
+        "binary_bytes": sum(map(len, as_binary)) / args.n,
+        "encode_json_per_s": bench(orjson.dumps, events, args.repeat),
+        "encode_binary_per_s": bench(codec.encode, events, args.repeat),
+        "decode_json_stdlib_per_s": bench(lambda b: json.loads(b.decode()), as_json, args.repeat),
+        "decode_json_orjson_per_s": bench(codec.decode, as_json, args.repeat),
+        "decode_binary_per_s": bench(codec.decode, as_binary, args.repeat),
+    }
+    res["size_ratio"] = res["binary_bytes"] / res["json_bytes"]
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()